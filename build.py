@@ -13,7 +13,10 @@
 #
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
-from pybuilder.core import use_plugin, init, Author
+import sys
+
+from pybuilder.core import use_plugin, init, task, Author
+from pybuilder.errors import BuildFailedException
 
 use_plugin('filter_resources')
 
@@ -70,6 +73,36 @@ def set_properties(project):
     project.install_file('/etc/twisted-taps/', 'yadtreceiver/yadtreceiver.tac')
     project.install_file('/etc/init.d/', 'yadtreceiver/yadtreceiver')
 
+    project.set_property('dir_source_benchmark_python', 'src/benchmark/python')
+    project.set_property('benchmark_baseline_file', 'src/benchmark/resources/baseline.json')
+    project.set_property('benchmark_results_file', '$dir_reports/benchmarks.json')
+    project.set_property('benchmark_max_slowdown', 1.5)
+    project.set_property('benchmark_update_baseline', False)
+    project.set_property('benchmark_startup_budget', 1.0)
+
+
+@task('run_benchmarks', description='Runs the benchmarks and fails on slowdowns against the baseline')
+def run_benchmarks(project, logger):
+    sys.path.insert(0, project.expand_path('$dir_source_main_python'))
+    sys.path.insert(0, project.expand_path('$dir_source_benchmark_python'))
+    import receiver_benchmark
+
+    update_baseline = str(project.get_property('benchmark_update_baseline')).lower() == 'true'
+    try:
+        regressions = receiver_benchmark.run_suite(
+            project.expand_path('$benchmark_baseline_file'),
+            project.expand_path('$benchmark_results_file'),
+            float(project.get_property('benchmark_max_slowdown')),
+            update_baseline,
+            log=logger.info,
+            startup_budget=float(project.get_property('benchmark_startup_budget')))
+    except receiver_benchmark.MissingBaselineError as e:
+        raise BuildFailedException(str(e))
+    if regressions:
+        for name, limit, result in regressions:
+            logger.error('%s took %.3f ms, limit is %.3f ms' % (name, result * 1000, limit * 1000))
+        raise BuildFailedException('%d benchmarks are slower than their baseline or budget' % len(regressions))
+
 
 @init(environments="teamcity")
 def set_properties_for_teamcity(project):
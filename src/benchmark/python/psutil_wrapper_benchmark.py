@@ -0,0 +1,110 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Compares the ways of finding the running yadtshell processes on a
+    synthetic /proc filesystem with thousands of processes:
+
+        legacy  -- wrap every process, ask for name and cmdline one by one
+        attrs   -- psutil.process_iter(attrs=[...]) in one pass
+        proc    -- read /proc/<pid>/cmdline directly and pre-filter
+
+    usage: python psutil_wrapper_benchmark.py [number-of-processes ...]
+"""
+
+import os
+import sys
+from shutil import rmtree
+from tempfile import mkdtemp
+from timeit import default_timer
+
+import psutil
+
+from yadtreceiver import psutil_wrapper
+
+SCRIPT = '/usr/bin/yadtshell'
+STAT_FIELDS_AFTER_NAME = 'S 1 1 1 0 -1 4194560 100 0 0 0 1 1 0 0 20 0 1 0 100 1000000 100 ' + ' '.join(['0'] * 30)
+
+
+def create_synthetic_proc(number_of_processes):
+    proc_directory = mkdtemp()
+    os.makedirs(os.path.join(proc_directory, 'self'))
+    with open(os.path.join(proc_directory, 'stat'), 'w') as stat_file:
+        stat_file.write('cpu  1 1 1 1 1 1 1 1 1 1\nbtime 1000000000\n')
+    for pid in range(1, number_of_processes + 1):
+        if pid % 100 == 0:
+            name, cmdline = 'python', ['/usr/bin/python', SCRIPT, 'status', '--tracking-id=%d' % pid]
+        elif pid % 10 == 0:
+            name, cmdline = 'python', ['/usr/bin/python', '/usr/bin/some-daemon']
+        else:
+            name, cmdline = 'worker%d' % (pid % 7), ['/usr/sbin/worker', '--id=%d' % pid]
+        process_directory = os.path.join(proc_directory, str(pid))
+        os.makedirs(process_directory)
+        with open(os.path.join(process_directory, 'comm'), 'w') as comm_file:
+            comm_file.write(name + '\n')
+        with open(os.path.join(process_directory, 'cmdline'), 'w') as cmdline_file:
+            cmdline_file.write('\0'.join(cmdline) + '\0')
+        with open(os.path.join(process_directory, 'stat'), 'w') as stat_file:
+            stat_file.write('%d (%s) %s\n' % (pid, name, STAT_FIELDS_AFTER_NAME))
+        os.symlink('/etc/yadtshell/targets/dev%d' % pid, os.path.join(process_directory, 'cwd'))
+    return proc_directory
+
+
+def find_legacy():
+    python_processes = filter(lambda p: p.name() == 'python', psutil_wrapper.get_processes())
+    return filter(lambda p: SCRIPT in p.cmdline(), python_processes)
+
+
+def find_with_attrs():
+    return [p for p in psutil_wrapper.get_processes(attrs=['name'])
+            if p.name() == 'python' and SCRIPT in p.cmdline()]
+
+
+def find_in_proc(proc_directory):
+    return psutil_wrapper.get_python_processes_containing(SCRIPT, proc_directory)
+
+
+def measure(function, repetitions=5):
+    best = None
+    for _ in range(repetitions):
+        start = default_timer()
+        found = function()
+        duration = default_timer() - start
+        best = duration if best is None else min(best, duration)
+    return best, len(found)
+
+
+def main(sizes):
+    for size in sizes:
+        proc_directory = create_synthetic_proc(size)
+        original_procfs_path = psutil.PROCFS_PATH
+        psutil.PROCFS_PATH = proc_directory
+        try:
+            results = [('legacy', measure(find_legacy)),
+                       ('attrs', measure(find_with_attrs)),
+                       ('proc', measure(lambda: find_in_proc(proc_directory)))]
+        finally:
+            psutil.PROCFS_PATH = original_procfs_path
+            getattr(psutil, '_pmap', {}).clear()  # psutil caches processes across process_iter calls
+            rmtree(proc_directory)
+        legacy_duration = results[0][1][0]
+        for variant, (duration, found) in results:
+            print('{0:>6} processes  {1:<6} {2:8.2f} ms  {3:5.1f}x  ({4} found)'.format(
+                size, variant, duration * 1000, legacy_duration / duration, found))
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [1000, 5000])
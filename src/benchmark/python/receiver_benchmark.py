@@ -0,0 +1,364 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Benchmarks the hot paths of the receiver on synthetic data at several
+    sizes and compares the results with a JSON baseline:
+
+        event_parsing            -- events.Event for votes, requests, cmd and
+                                    service-change events (size = events)
+        event_dispatch           -- Receiver.onEvent for votes, cmd events
+                                    and heartbeats (size = events)
+        voting_fsm               -- create_voting_fsm (size = state machines)
+        write_metrics            -- _write_metrics (size = metrics)
+        allowed_targets          -- ReceiverConfig.compute_allowed_targets
+                                    (size = entries in the targets directory)
+        app_status_snapshot      -- AppStatusResource.compute_snapshot
+                                    (size = running commands)
+        app_status_render        -- AppStatusResource.render_GET from the
+                                    cached snapshot (size = running commands)
+        startup_imports          -- a new interpreter importing what
+                                    yadtreceiver.tac imports before the
+                                    receiver is ready
+        process_spawn            -- a new interpreter spawning processes
+                                    one after another (size = processes)
+
+    Every benchmark is repeated and the best duration is kept. A benchmark
+    fails when it is more than max_slowdown times slower than its baseline,
+    startup_imports also fails when it takes longer than the start-up
+    budget. The baseline is committed in src/benchmark/resources, running
+    without it fails, the results become the new baseline only with
+    --update-baseline.
+
+    usage: python receiver_benchmark.py [options]
+           pyb run_benchmarks [-P benchmark_update_baseline=true]
+"""
+
+import json
+import os
+import subprocess
+import sys
+from optparse import OptionParser
+from shutil import rmtree
+from StringIO import StringIO
+from tempfile import mkdtemp
+from timeit import default_timer
+
+from mock import Mock, patch
+from twisted.web.test.requesthelper import DummyRequest
+
+from yadtreceiver import Receiver, _write_metrics, events
+from yadtreceiver.app_status import AppStatusResource
+from yadtreceiver.configuration import ReceiverConfig
+from yadtreceiver.voting import create_voting_fsm
+
+DEFAULT_SIZES = [10, 100, 1000]
+DEFAULT_REPETITIONS = 5
+DEFAULT_MAX_SLOWDOWN = 1.5
+DEFAULT_STARTUP_BUDGET = 1.0
+STARTUP_IMPORTS = ('import twisted.internet.reactor, twisted.application.service; '
+                   'import yadtreceiver, yadtreceiver.configuration, yadtreceiver.startup')
+SPAWN_BENCHMARK = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spawn_benchmark.py')
+DEFAULT_BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                                     'resources', 'baseline.json')
+
+
+class MissingBaselineError(Exception):
+    pass
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+def _event_data(number):
+    tracking_id = 'tracking-id-%d' % (number % 10)
+    kind = number % 4
+    if kind == 0:
+        return {'type': 'event', 'id': 'vote', 'target': 'dev%d' % number, 'tracking_id': tracking_id,
+                'payload': '%032x' % number}
+    if kind == 1:
+        return {'type': 'event', 'id': 'request', 'target': 'dev%d' % number, 'tracking_id': tracking_id,
+                'cmd': 'yadtshell', 'args': ['update', '--tracking-id=%s' % tracking_id]}
+    if kind == 2:
+        return {'type': 'event', 'id': 'cmd', 'target': 'dev%d' % number, 'tracking_id': tracking_id,
+                'cmd': 'yadtshell update', 'state': 'finished', 'message': 'finished'}
+    return {'type': 'event', 'id': 'service-change', 'target': 'dev%d' % number, 'tracking_id': tracking_id,
+            'payload': [{'uri': 'service://dev%d/service%d' % (number, service), 'state': 'up'}
+                        for service in range(10)]}
+
+
+def benchmark_event_parsing(size):
+    event_data = [_event_data(number) for number in range(size)]
+
+    def run():
+        for data in event_data:
+            events.Event(None, data)
+    return run, _noop
+
+
+def benchmark_event_dispatch(size):
+    receiver = Receiver()
+    receiver.states = {}
+    dispatched = []
+    for number in range(size):
+        data = _event_data(number)
+        if data['id'] == 'vote':
+            data['payload'] = '%032x' % (number % 2)
+        elif data['id'] != 'cmd':
+            data = {'type': 'event', 'id': 'heartbeat', 'target': 'dev%d' % number, 'payload': None}
+        dispatched.append(data)
+    for number in range(10):
+        tracking_id = 'tracking-id-%d' % number
+        receiver.states[tracking_id] = create_voting_fsm(tracking_id, '%032x' % 2, _noop, _noop, _noop, _noop)
+
+    log_patch = patch('yadtreceiver.log')
+
+    def run():
+        log_patch.start()
+        try:
+            for data in dispatched:
+                receiver.onEvent(data)
+        finally:
+            log_patch.stop()
+    return run, _noop
+
+
+def benchmark_voting_fsm(size):
+    def run():
+        for number in range(size):
+            create_voting_fsm('tracking-id-%d' % number, '%032x' % number, _noop, _noop, _noop, _noop)
+    return run, _noop
+
+
+def benchmark_write_metrics(size):
+    metrics = dict(('commands_succeeded.dev%d' % number, number) for number in range(size))
+
+    def run():
+        _write_metrics(metrics, StringIO())
+    return run, _noop
+
+
+def benchmark_allowed_targets(size):
+    directory = mkdtemp()
+    targets_directory = os.path.join(directory, 'targets')
+    os.makedirs(targets_directory)
+    for number in range(size):
+        os.makedirs(os.path.join(targets_directory, ('dev%d' if number % 2 else 'pro%d') % number))
+    configuration_file = os.path.join(directory, 'receiver.cfg')
+    with open(configuration_file, 'w') as configuration:
+        configuration.write('[receiver]\ntargets = dev1*, dev2*, pro*, .hidden*\ntargets_directory = %s\n'
+                            % targets_directory)
+    receiver_configuration = ReceiverConfig(configuration_file)
+
+    def run():
+        receiver_configuration.compute_allowed_targets()
+    return run, lambda: rmtree(directory)
+
+
+class FakeProcess(object):
+
+    def __init__(self, pid):
+        self.pid = pid
+
+    def cmdline(self):
+        return ['/usr/bin/python', '/usr/bin/yadtshell', 'update', '--tracking-id=tracking-id-%d' % self.pid]
+
+    def cwd(self):
+        return '/etc/yadtshell/targets/dev%d' % self.pid
+
+
+def _app_status_resource(size):
+    receiver = Mock()
+    receiver.configuration = {'script_to_execute': '/usr/bin/yadtshell'}
+    receiver.admission_controller = None
+    receiver.scheduler = None
+    receiver.startup = None
+    receiver.fan_in = None
+    receiver.leases = None
+    receiver.membership = None
+    receiver.drain = None
+    processes = [FakeProcess(pid) for pid in range(size)]
+    resource = AppStatusResource(receiver, cache_ttl=3600)
+    resource.get_python_processes_containing = lambda script_name: processes
+    return resource
+
+
+def benchmark_app_status_snapshot(size):
+    resource = _app_status_resource(size)
+    return resource.compute_snapshot, _noop
+
+
+def benchmark_app_status_render(size):
+    resource = _app_status_resource(size)
+    resource.snapshot = resource.compute_snapshot()
+
+    def run():
+        for _ in range(100):
+            resource.render_GET(DummyRequest(['']))
+    return run, _noop
+
+
+def benchmark_startup_imports(_):
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(sys.path)
+
+    def run():
+        subprocess.check_call([sys.executable, '-W', 'ignore', '-c', STARTUP_IMPORTS], env=environment)
+    return run, _noop
+
+
+def benchmark_process_spawn(size):
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(sys.path)
+
+    def run():
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([sys.executable, '-W', 'ignore', SPAWN_BENCHMARK, str(size)],
+                                  env=environment, stdout=devnull)
+    return run, _noop
+
+
+# (name, benchmark, sizes): sizes None means the sizes of the run
+BENCHMARKS = [('event_parsing', benchmark_event_parsing, None),
+              ('event_dispatch', benchmark_event_dispatch, None),
+              ('voting_fsm', benchmark_voting_fsm, None),
+              ('write_metrics', benchmark_write_metrics, None),
+              ('allowed_targets', benchmark_allowed_targets, None),
+              ('app_status_snapshot', benchmark_app_status_snapshot, None),
+              ('app_status_render', benchmark_app_status_render, None),
+              ('startup_imports', benchmark_startup_imports, [1]),
+              ('process_spawn', benchmark_process_spawn, [10, 100])]
+
+
+def measure(function, repetitions):
+    best = None
+    for _ in range(repetitions):
+        start = default_timer()
+        function()
+        duration = default_timer() - start
+        best = duration if best is None else min(best, duration)
+    return best
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repetitions=DEFAULT_REPETITIONS, names=None):
+    """
+        @return: dictionary of the best duration in seconds by
+                 "<benchmark>/<size>"
+    """
+    results = {}
+    for name, benchmark, benchmark_sizes in BENCHMARKS:
+        if names and name not in names:
+            continue
+        for size in benchmark_sizes or sizes:
+            function, cleanup = benchmark(size)
+            try:
+                results['%s/%d' % (name, size)] = measure(function, repetitions)
+            finally:
+                cleanup()
+    return results
+
+
+def compare(results, baseline, max_slowdown, startup_budget=None):
+    """
+        @return: list of (benchmark, baseline, result) for all results which
+                 are more than max_slowdown times slower than the baseline,
+                 and (benchmark, budget, result) when the start-up takes
+                 longer than the budget.
+    """
+    regressions = []
+    for name in sorted(results):
+        if name in baseline and results[name] > baseline[name] * max_slowdown:
+            regressions.append((name, baseline[name], results[name]))
+    startup = results.get('startup_imports/1')
+    if startup_budget and startup is not None and startup > startup_budget:
+        regressions.append(('startup_imports/1', startup_budget, startup))
+    return regressions
+
+
+def load_baseline(baseline_file):
+    with open(baseline_file) as baseline:
+        return json.load(baseline)
+
+
+def write_results(results, results_file):
+    results_directory = os.path.dirname(results_file)
+    if results_directory and not os.path.isdir(results_directory):
+        os.makedirs(results_directory)
+    with open(results_file, 'w') as output:
+        json.dump(results, output, indent=4, separators=(',', ': '), sort_keys=True)
+        output.write('\n')
+
+
+def run_suite(baseline_file=DEFAULT_BASELINE_FILE, results_file=None, max_slowdown=DEFAULT_MAX_SLOWDOWN,
+              update_baseline=False, sizes=DEFAULT_SIZES, repetitions=DEFAULT_REPETITIONS, log=None,
+              startup_budget=DEFAULT_STARTUP_BUDGET):
+    """
+        Runs all benchmarks, writes the results and compares them with the
+        baseline. The results become the baseline when update_baseline is
+        set.
+
+        @return: the regressions as returned by compare
+        @raise MissingBaselineError: if there is no baseline and
+                                     update_baseline is not set.
+    """
+    log = log or (lambda message: sys.stdout.write(message + '\n'))
+    if not update_baseline and not os.path.exists(baseline_file):
+        raise MissingBaselineError('Benchmark baseline %s does not exist, write it with --update-baseline '
+                                   '(pyb run_benchmarks -P benchmark_update_baseline=true)' % baseline_file)
+    results = run_benchmarks(sizes, repetitions)
+    baseline = {} if update_baseline else load_baseline(baseline_file)
+
+    for name in sorted(results):
+        if name in baseline:
+            log('%-28s %10.3f ms  baseline %10.3f ms  %5.2fx' % (
+                name, results[name] * 1000, baseline[name] * 1000, results[name] / baseline[name]))
+        else:
+            log('%-28s %10.3f ms  no baseline' % (name, results[name] * 1000))
+
+    if results_file:
+        write_results(results, results_file)
+    if update_baseline:
+        write_results(results, baseline_file)
+        log('Wrote baseline %s' % baseline_file)
+    return compare(results, baseline, max_slowdown, startup_budget)
+
+
+def main(arguments):
+    option_parser = OptionParser(usage='usage: %prog [options]')
+    option_parser.add_option('--baseline', dest='baseline_file', default=DEFAULT_BASELINE_FILE)
+    option_parser.add_option('--results', dest='results_file', default=None)
+    option_parser.add_option('--max-slowdown', dest='max_slowdown', type='float', default=DEFAULT_MAX_SLOWDOWN)
+    option_parser.add_option('--update-baseline', dest='update_baseline', action='store_true', default=False)
+    option_parser.add_option('--sizes', dest='sizes', default=','.join(str(size) for size in DEFAULT_SIZES))
+    option_parser.add_option('--repetitions', dest='repetitions', type='int', default=DEFAULT_REPETITIONS)
+    option_parser.add_option('--startup-budget', dest='startup_budget', type='float', default=DEFAULT_STARTUP_BUDGET)
+    options, _ = option_parser.parse_args(arguments)
+
+    try:
+        regressions = run_suite(options.baseline_file, options.results_file, options.max_slowdown,
+                                options.update_baseline, [int(size) for size in options.sizes.split(',')],
+                                options.repetitions, startup_budget=options.startup_budget)
+    except MissingBaselineError as e:
+        print('ERROR %s' % e)
+        return 2
+    for name, baseline, result in regressions:
+        print('REGRESSION %s: %.3f ms, limit %.3f ms' % (name, result * 1000, baseline * 1000))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
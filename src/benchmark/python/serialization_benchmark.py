@@ -0,0 +1,83 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Measures encoding and decoding of the events the receiver exchanges with
+    the broadcaster, for every available WAMP serializer:
+
+        vote     -- the vote of a receiver
+        request  -- a request of yadtshell to run a command on a target
+        started  -- a started-event of a command
+        failed   -- a failed-event carrying a capped error output (16k)
+
+    usage: python serialization_benchmark.py [repetitions]
+"""
+
+import sys
+from timeit import default_timer
+from uuid import uuid4
+
+from autobahn.wamp import message
+
+from yadtreceiver.serialization import available_serializers, create_wamp_serializers
+
+TRACKING_ID = 'yadtshell-%s' % uuid4()
+TRACEBACK = ''.join('  File "/usr/lib/python2.7/site-packages/yadtshell/commands.py", line %d, in run\n'
+                    '    raise RuntimeError("service %d did not come up")\n' % (number, number)
+                    for number in range(150))[:16384]
+
+
+def event(event_id, **attributes):
+    data = {'type': 'event', 'id': event_id, 'tracking_id': TRACKING_ID, 'target': 'devabc123', 'payload': None}
+    data.update(attributes)
+    return data
+
+
+PAYLOADS = [
+    ('vote', event('vote', payload=str(uuid4()))),
+    ('request', event('request', cmd='yadtshell', args=['update', '--tracking-id=%s' % TRACKING_ID])),
+    ('started', event('cmd', cmd='/usr/bin/python /usr/bin/yadtshell update', state='started',
+                      message='(host01) target[devabc123] request: command="yadtshell", arguments=["update"]')),
+    ('failed', event('cmd', cmd='/usr/bin/python /usr/bin/yadtshell update', state='failed', message=TRACEBACK)),
+]
+
+
+def measure(serializer, payload, repetitions):
+    start = default_timer()
+    for request_id in range(repetitions):
+        # a new message every time since messages cache their serialization
+        encoded, is_binary = serializer.serialize(message.Publish(request_id + 1, u'devabc123', args=[payload]))
+    encode_duration = default_timer() - start
+
+    start = default_timer()
+    for _ in range(repetitions):
+        serializer.unserialize(encoded, is_binary)
+    decode_duration = default_timer() - start
+    return encode_duration / repetitions, decode_duration / repetitions, len(encoded)
+
+
+def main(repetitions):
+    print('available serializers: %s' % ', '.join(available_serializers()))
+    for name in available_serializers():
+        serializer = create_wamp_serializers([name])[0]
+        for payload_name, payload in PAYLOADS:
+            encode, decode, size = measure(serializer, payload, repetitions)
+            print('{0:<8} {1:<8} encode {2:8.2f} us  decode {3:8.2f} us  {4:6d} bytes'.format(
+                name, payload_name, encode * 1e6, decode * 1e6, size))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,60 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Spawns processes one after another with reactor.spawnProcess and prints
+    the mean latency from spawning a process until it has ended. Used by the
+    process_spawn benchmark of receiver_benchmark.py, which runs it in a new
+    interpreter to get a reactor of its own.
+
+    usage: python spawn_benchmark.py <processes>
+"""
+
+from __future__ import print_function
+
+import sys
+from timeit import default_timer
+
+EXECUTABLE = '/bin/true'
+
+
+def main(processes):
+    from twisted.internet import protocol, reactor
+
+    latencies = []
+
+    class EndedProtocol(protocol.ProcessProtocol):
+
+        def __init__(self):
+            self.spawned_at = default_timer()
+
+        def processEnded(self, reason):
+            latencies.append(default_timer() - self.spawned_at)
+            spawn_next()
+
+    def spawn_next():
+        if len(latencies) == processes:
+            reactor.stop()
+            return
+        reactor.spawnProcess(EndedProtocol(), EXECUTABLE, [EXECUTABLE], env={}, path='/')
+
+    reactor.callWhenRunning(spawn_next)
+    reactor.run()
+    print(sum(latencies) / len(latencies))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]))
@@ -23,20 +23,22 @@
 """
 
 import os
+import signal
 import traceback
 import functools
 from uuid import uuid4 as random_uuid
 from collections import defaultdict
 from datetime import datetime
+from fnmatch import fnmatch
 from time import time
 
 from twisted.application import service
-from twisted.internet import inotify, reactor
+from twisted.internet import defer, inotify, reactor, threads
 from twisted.python import filepath, log
-from twisted.python.logfile import LogFile
 
 from yadtbroadcastclient import WampBroadcaster
 from .scheduling import seconds_to_midnight
+from .psutil_wrapper import pid_exists
 
 import events
 from voting import create_voting_fsm
@@ -45,8 +47,32 @@ __version__ = '${version}'
 
 METRICS = defaultdict(lambda: 0)
 
+# settings which are read whenever they are used, e.g. for every request
+SETTINGS_APPLIED_ON_USE = ['python_command', 'script_to_execute', 'hostname',
+                           'metrics_directory', 'metrics_file', 'targets', 'allowed_targets',
+                           'command_timeout', 'command_timeouts', 'target_timeouts',
+                           'command_kill_grace_period', 'setsid_command',
+                           'command_priorities', 'target_priorities',
+                           'request_rate_limit', 'target_request_rate_limits']
+
 # delayed import so that METRICS is importable from ProcessProtocol
 from protocols import ProcessProtocol  # noqa
+from spool import EventSpool, SpoolingBroadcaster  # noqa
+from journal import JobJournal, WON, SPAWNED  # noqa
+from admission import AdmissionController, DEFER, REFUSE, DEFERRED_VOTE_PREFIX  # noqa
+from scheduler import RequestScheduler  # noqa
+from failure_output import FailureOutputPublisher, FailureOutputStore  # noqa
+from serialization import JSON, NegotiatingWampBroadcaster  # noqa
+from lag_monitor import ReactorLagMonitor  # noqa
+from fanin import FanInBroadcaster  # noqa
+from recorder import EventRecorder  # noqa
+from run_output import RunOutputStore, PRUNE_INTERVAL  # noqa
+from logrotation import CompressingLogFile  # noqa
+from lease import LeaseTable  # noqa
+from membership import MembershipTable, MEMBERSHIP_TOPIC  # noqa
+from drain import Drain, RunningCommands, CHECK_INTERVAL, FLUSH_SECONDS, FLUSHING, STOPPING  # noqa
+from spawn_executor import SpawnHelperExecutor  # noqa
+from ratelimit import RequestRateLimiter  # noqa
 
 
 def _write_metrics(metrics, metrics_file):
@@ -76,6 +102,25 @@ class Receiver(service.Service):
         for the targets that it subscribed to.
     """
 
+    spool = None
+    journal = None
+    failure_output = None
+    lag_monitor = None
+    startup = None
+    admission_controller = None
+    scheduler = None
+    fan_in = None
+    recorder = None
+    run_output = None
+    leases = None
+    membership = None
+    drain = None
+    running_commands = None
+    spawn_helper = None
+    rate_limiter = None
+    # spawns the commands instead of the reactor, e.g. a stub when replaying events
+    executor = None
+
     def subscribeTarget(self, targetname):
         self.configuration.reload_targets()
         if targetname in self.configuration['allowed_targets']:
@@ -88,6 +133,8 @@ class Receiver(service.Service):
 
     def unsubscribeTarget(self, targetname):
         log.msg('unsubscribing from target "%s".' % targetname)
+        if self.leases:
+            self.release_lease(targetname)
         self.broadcaster.client.unsubscribe(targetname)
 
     def get_target_directory(self, target):
@@ -101,7 +148,7 @@ class Receiver(service.Service):
 
         target_directory = os.path.join(targets_directory, target)
 
-        if not os.path.exists(target_directory):
+        if target not in self.configuration.target_index:
             raise ReceiverException('(%s) target[%s] request failed: target directory "%s" does not exist.'
                                     % (hostname, target, target_directory))
 
@@ -109,8 +156,52 @@ class Receiver(service.Service):
 
     def handle_request(self, event):
         tracking_id = _determine_tracking_id(event.arguments)
+        if self.drain:
+            log.msg('Draining, not voting for request with tracking-id %r' % tracking_id)
+            METRICS['requests_ignored_draining'] += 1
+            return
         vote = str(random_uuid())
 
+        if self.admission_controller:
+            decision = self.admission_controller.decide(tracking_id, event.target)
+            held_lease = False
+            if decision in (REFUSE, DEFER) and self.leases:
+                held_lease = self.leases.holds(event.target)
+                self.release_lease(event.target)
+            if decision == REFUSE:
+                if held_lease:
+                    # the other receivers have already left this request to us
+                    METRICS['lease_requests_refused'] += 1
+                    self.publish_failed(event, '(%s) target[%s] request refused: host is under critical pressure'
+                                        % (self.configuration['hostname'], event.target))
+                    return
+                log.msg('Host is under critical pressure, not voting for request with tracking-id %r' % tracking_id)
+                return
+            if decision == DEFER:
+                log.msg('Host is under pressure, deferring to other receivers for tracking-id %r' % tracking_id)
+                vote = DEFERRED_VOTE_PREFIX + vote
+
+        if self.leases:
+            holder = self.leases.holder_of(event.target)
+            if holder is not None and holder != self.configuration['hostname']:
+                log.msg('%s holds the lease of %s, not voting for request with tracking-id %r'
+                        % (holder, event.target, tracking_id))
+                METRICS['lease_requests_left'] += 1
+                return
+
+        if self.journal:
+            self.journal.accepted(tracking_id, event.target, event.command)
+
+        if self.leases and self.leases.holds(event.target):
+            log.msg('Holding the lease of %s, starting request with tracking-id %r without voting'
+                    % (event.target, tracking_id))
+            METRICS['lease_requests'] += 1
+            if self.scheduler:
+                self.schedule_request(event, None)
+            else:
+                self.perform_request(event, None)
+            return
+
         def broadcast_vote(_):
             log.msg('Voting %r for request with tracking-id %r' %
                     (vote, tracking_id))
@@ -125,26 +216,78 @@ class Receiver(service.Service):
 
         def fold(_):
             METRICS['voting_folds'] += 1
+            if self.journal:
+                self.journal.discarded(tracking_id, 'folded')
 
         self.states[tracking_id] = create_voting_fsm(tracking_id,
                                                      vote,
                                                      broadcast_vote,
-                                                     functools.partial(
-                                                         self.perform_request, event),
+                                                     functools.partial(self.schedule_request if self.scheduler
+                                                                       else self.perform_request, event),
                                                      fold,
                                                      cleanup_fsm)
 
-        reactor.callLater(10, self.states[tracking_id].showdown)
+        showdown_delay = 10
+        if self.membership and self.membership.is_alone_on(event.target):
+            log.msg('No other receiver is subscribed to %s, showing down right away' % event.target)
+            METRICS['showdowns_skipped'] += 1
+            showdown_delay = 0
+        reactor.callLater(showdown_delay, self.states[tracking_id].showdown)
+
+    def schedule_request(self, event, fsm_event):
+        """
+            Performs the won request as soon as the scheduler hands it a slot.
+            The slot is released when the command has exited.
+        """
+        def start():
+            process_protocol = self.perform_request(event, fsm_event)
+            if process_protocol is None:
+                self.scheduler.release()
+            else:
+                process_protocol.add_exit_callback(self.scheduler.release)
+
+        self.scheduler.submit(self.get_priority_class(event), start)
 
-    def perform_request(self, event, _):
+    def get_priority_class(self, event):
+        """
+            @return: the highest priority class configured for the yadtshell
+                     command or a target glob matching the target, otherwise
+                     the default priority class. Only classes the scheduler
+                     has a queue for count, priority_classes changes need a
+                     restart.
+        """
+        if self.scheduler:
+            weights = self.scheduler.weights
+            default_priority_class = self.scheduler.default_priority_class
+        else:
+            weights = self.configuration['priority_classes']
+            default_priority_class = self.configuration['default_priority_class']
+        command = event.arguments[0] if event.arguments else None
+        priority_classes = [self.configuration['command_priorities'].get(command)]
+        for target_glob, priority_class in self.configuration['target_priorities'].items():
+            if fnmatch(event.target, target_glob):
+                priority_classes.append(priority_class)
+        priority_classes = [priority_class for priority_class in priority_classes if priority_class in weights]
+        if not priority_classes:
+            return default_priority_class
+        return max(priority_classes, key=lambda priority_class: weights[priority_class])
+
+    def perform_request(self, event, fsm_event):
         """
             Handles a request for the given target by executing the given
             command (using the python_command and script_to_execute from
-            the configuration).
+            the configuration). fsm_event is None when the request runs
+            under the lease of the target without voting.
+
+            @return: the process protocol of the spawned command or None when
+                     the command could not be spawned.
         """
-        log.msg('I have won the vote for %r, starting it now..' %
-                (event.target))
-        METRICS['voting_wins'] += 1
+        if fsm_event is not None:
+            log.msg('I have won the vote for %r, starting it now..' %
+                    (event.target))
+            METRICS['voting_wins'] += 1
+            if self.leases and not self.drain and self.leases.holder_of(event.target) is None:
+                self.announce_lease(event.target, self.leases.acquire(event.target))
         try:
             hostname = str(self.configuration['hostname'])
             python_command = str(self.configuration['python_command'])
@@ -152,27 +295,87 @@ class Receiver(service.Service):
             command_and_arguments_list = [
                 python_command, script_to_execute] + event.arguments
             command_with_arguments = ' '.join(command_and_arguments_list)
+            timeout = self.get_command_timeout(event)
 
             event.tracking_id = _determine_tracking_id(command_and_arguments_list)
             self.publish_start(event)
 
             if event.tracking_id in self.states:
                 self.states[event.tracking_id].spawned()
-            else:
+            elif fsm_event is not None:
                 log.err('Tracking ID %r not registered with my FSM, but handling it anyway.' % event.tracking_id)
 
-            process_protocol = ProcessProtocol(
-                hostname, self.broadcaster, event.target, command_with_arguments, tracking_id=event.tracking_id)
+            if self.journal:
+                self.journal.won(event.tracking_id)
 
+            # resolved before anything is registered that only the exit of the process cleans up
             target_dir = self.get_target_directory(event.target)
+            output_fd = self.run_output.open(event.tracking_id) if self.run_output else None
+            process_protocol = ProcessProtocol(
+                hostname, self.broadcaster, event.target, command_with_arguments, tracking_id=event.tracking_id,
+                journal=self.journal, failure_output=self.failure_output,
+                output_file=self.run_output.filename(event.tracking_id) if output_fd is not None else None)
+            if self.running_commands is not None:
+                self.running_commands.started(process_protocol)
+
             #  we pulled the arguments out of the event, so they are unicode, not string yet
             command_and_arguments_list = map(lambda possible_unicode: str(possible_unicode), command_and_arguments_list)
 
-            reactor.spawnProcess(process_protocol, python_command,
-                                 command_and_arguments_list, env={}, path=target_dir)
+            executable = python_command
+            if timeout:
+                # run in an own process group, so the whole group can be terminated
+                executable = str(self.configuration['setsid_command'])
+                command_and_arguments_list = [executable] + command_and_arguments_list
+
+            # the spawn helper answers with a deferred, the reactor with the process
+            spawner = self.executor or reactor
+            if output_fd is None:
+                spawned = defer.maybeDeferred(spawner.spawnProcess, process_protocol, executable,
+                                              command_and_arguments_list, env={}, path=target_dir)
+            else:
+                spawned = defer.maybeDeferred(spawner.spawnProcess, process_protocol, executable,
+                                              command_and_arguments_list, env={}, path=target_dir,
+                                              childFDs={0: 'w', 1: output_fd, 2: output_fd})
+            if output_fd is not None:
+                spawned.addBoth(_close_output_fd, output_fd)
+            spawned.addCallbacks(self._process_spawned, self._process_not_spawned,
+                                 callbackArgs=(event, process_protocol, timeout),
+                                 errbackArgs=(event, process_protocol))
+            return process_protocol
         except Exception as e:
+            if self.journal:
+                self.journal.discarded(event.tracking_id, 'failed')
             self.publish_failed(event, "%s : %s" % (type(e), e.message))
 
+    def _process_spawned(self, process, event, process_protocol, timeout):
+        if timeout:
+            process_protocol.schedule_timeout(timeout, self.configuration['command_kill_grace_period'])
+        if self.journal:
+            self.journal.spawned(event.tracking_id, process.pid)
+
+    def _process_not_spawned(self, failure, event, process_protocol):
+        if self.journal:
+            self.journal.discarded(event.tracking_id, 'not spawned')
+        self.publish_failed(event, "%s : %s" % (failure.type, failure.getErrorMessage()))
+        process_protocol.notify_exit()
+
+    def get_command_timeout(self, event):
+        """
+            @return: the smallest of the configured command_timeout, the
+                     timeout of the yadtshell command and the timeouts of the
+                     target globs matching the target, or None.
+        """
+        command = event.arguments[0] if event.arguments else None
+        timeouts = [self.configuration.get('command_timeout') or 0,
+                    (self.configuration.get('command_timeouts') or {}).get(command, 0)]
+        for target_glob, timeout in (self.configuration.get('target_timeouts') or {}).items():
+            if fnmatch(event.target, target_glob):
+                timeouts.append(timeout)
+        timeouts = [timeout for timeout in timeouts if timeout > 0]
+        if not timeouts:
+            return None
+        return min(timeouts)
+
     def publish_failed(self, event, message):
         """
             Publishes a event to signal that the command on the target failed.
@@ -186,6 +389,57 @@ class Receiver(service.Service):
             message,
             tracking_id=event.tracking_id)
 
+    def reject_if_rate_limited(self, event):
+        """
+            Rejects the request when it exceeds the request rate limits,
+            before it is voted on. Only one receiver publishes the
+            failed-event: the holder of the target's lease, otherwise the
+            receiver winning the vote on the rejection (draining receivers
+            do not vote).
+
+            @return: True when the request was rejected.
+        """
+        exhausted_limit = self.rate_limiter.take(event.target, self.configuration.get('request_rate_limit'),
+                                                 self.configuration.get('target_request_rate_limits'))
+        if exhausted_limit is None:
+            return False
+        METRICS['requests_rate_limited'] += 1
+        METRICS['requests_rate_limited.%s' % event.target] += 1
+        message = ('(%s) target[%s] request rate limited: limit %s exceeded'
+                   % (self.configuration['hostname'], event.target, exhausted_limit))
+
+        holder = self.leases.holder_of(event.target) if self.leases else None
+        if holder == self.configuration['hostname']:
+            self.publish_failed(event, message)
+        elif holder is None and not self.drain:
+            self.vote_on_rejection(event, message)
+        return True
+
+    def vote_on_rejection(self, event, message):
+        """
+            Votes on the rejected request like on any other request, the
+            winner publishes the failed-event instead of spawning a command.
+        """
+        tracking_id = _determine_tracking_id(event.arguments)
+        vote = str(random_uuid())
+
+        def broadcast_vote(_):
+            self.broadcaster._sendEvent('vote', data=vote, tracking_id=tracking_id, target=event.target)
+
+        def publish_rejection(_):
+            self.publish_failed(event, message)
+            self.states[tracking_id].spawned()
+
+        def cleanup_fsm(_):
+            del self.states[tracking_id]
+
+        self.states[tracking_id] = create_voting_fsm(tracking_id, vote, broadcast_vote, publish_rejection,
+                                                     lambda _: None, cleanup_fsm)
+        showdown_delay = 10
+        if self.membership and self.membership.is_alone_on(event.target):
+            showdown_delay = 0
+        reactor.callLater(showdown_delay, self.states[tracking_id].showdown)
+
     def publish_start(self, event):
         """
             Publishes a event to signal that the command on the target started.
@@ -225,9 +479,28 @@ class Receiver(service.Service):
             log.err('No targets configured or no targets in allowed targets.')
             exit(1)
 
+        if self.startup and not self.startup.is_ready:
+            self.startup.mark('connect')
+
+        subscriptions = []
         for targetname in targets:
             log.msg('subscribing to target "%s".' % targetname)
-            self.broadcaster.client.subscribe(self.onEvent, unicode(targetname))
+            subscription = defer.maybeDeferred(self.broadcaster.client.subscribe, self.onEvent, unicode(targetname))
+            subscription.addErrback(log.err, 'Could not subscribe to target "%s"' % targetname)
+            subscriptions.append(subscription)
+        if self.membership:
+            subscription = defer.maybeDeferred(self.broadcaster.client.subscribe, self.onEvent, MEMBERSHIP_TOPIC)
+            subscription.addErrback(log.err, 'Could not subscribe to the heartbeats of the other receivers')
+            subscriptions.append(subscription)
+        defer.gatherResults(subscriptions).addCallback(self._subscribed)
+
+    def _subscribed(self, _):
+        log.msg('Subscribed to all targets')
+        if self.membership:
+            self.send_heartbeat()
+        if self.startup and not self.startup.is_ready:
+            self.startup.mark('subscribe')
+            self.startup.ready()
 
     def _should_refresh_connection(self):
         if not hasattr(self, 'broadcaster') or not self.broadcaster.client:
@@ -275,6 +548,9 @@ class Receiver(service.Service):
             event_data, = args
             target = None
 
+        if self.recorder:
+            self.recorder.record(target, event_data)
+
         event = events.Event(target, event_data)
 
         if event.is_a_vote:
@@ -297,7 +573,15 @@ class Receiver(service.Service):
                     (event.vote, own_vote))
                 voting_fsm.call()
 
+        elif event.is_a_lease and self.leases:
+            self.leases.on_lease(event.target, event.lease)
+
+        elif event.is_a_heartbeat and self.membership and event.target == MEMBERSHIP_TOPIC:
+            self.membership.on_heartbeat(event.heartbeat)
+
         elif event.is_a_request:
+            if self.rate_limiter and self.reject_if_rate_limited(event):
+                return
             try:
                 self.handle_request(event)
             except Exception as e:
@@ -318,11 +602,18 @@ class Receiver(service.Service):
         self.configuration = configuration
 
     def initialize_twisted_logging(self):
-        twenty_megabytes = 20000000
-        log_file = LogFile.fromFullPath(self.configuration['log_filename'],
-                                        maxRotatedFiles=10,
-                                        rotateLength=twenty_megabytes)
+        """
+            Rotated log files are compressed in a background thread.
+        """
+        log_file = CompressingLogFile.fromFullPath(self.configuration['log_filename'],
+                                                   rotateLength=self.configuration['log_rotate_bytes'],
+                                                   maxRotatedFiles=self.configuration['log_rotated_files'],
+                                                   rotate_interval=self.configuration['log_rotate_interval'],
+                                                   compression=self.configuration['log_compression'])
         log.startLogging(log_file)
+        if log_file.compression != self.configuration['log_compression']:
+            log.msg('Log compression %s is not available, using %s'
+                    % (self.configuration['log_compression'], log_file.compression))
 
     def startService(self):
         """
@@ -330,15 +621,46 @@ class Receiver(service.Service):
         """
         self.initialize_twisted_logging()
         log.msg('yadtreceiver version %s' % __version__)
+        self.start_spawn_helper()
+        self.start_lag_monitor()
+        self.start_event_recording()
+        signal.signal(signal.SIGHUP, self._on_reload_signal)
+        signal.signal(signal.SIGUSR1, self._on_drain_signal)
+        self.running_commands = RunningCommands()
+        self.rate_limiter = RequestRateLimiter()
         self._connect_broadcaster()
+        self.recover_jobs_from_journal()
+        self.start_failure_output()
+        self.start_run_output()
+        self.start_scheduler()
+        self.start_admission_control()
+        self.start_leases()
+        self.start_membership()
         self._refresh_connection(first_call=True)
         self.schedule_write_metrics(first_call=True)
         self.reset_metrics_at_midnight(first_call=True)
+        if self.spool:
+            self.schedule_spool_maintenance(first_call=True)
 
     def stopService(self):
         """
             Writes 'shutting down service' to the log.
         """
+        if self.spool:
+            self.spool.close()
+        if self.journal:
+            self.journal.close()
+        if self.lag_monitor:
+            self.lag_monitor.stop()
+        if self.recorder:
+            self.recorder.close()
+        if self.spawn_helper:
+            self.spawn_helper.stop()
+        if self.leases:
+            for target, payload in self.leases.release_all():
+                self.announce_lease(target, payload)
+        if self.membership:
+            self.send_heartbeat(leaving=True)
         log.msg('shutting down service')
 
     def _connect_broadcaster(self):
@@ -346,13 +668,354 @@ class Receiver(service.Service):
             Establishes a connection to the broadcaster as found in the
             configuration.
         """
+        endpoints = self.configuration.get('broadcasters')
+        if endpoints:
+            log.msg('Connecting to broadcasters on %s' % ', '.join('%s:%s' % endpoint for endpoint in endpoints))
+            self.fan_in = FanInBroadcaster([self._create_broadcaster(host, port) for host, port in endpoints],
+                                           self.configuration['broadcaster_recent_ids'])
+            self.broadcaster = self.fan_in
+        else:
+            host = self.configuration['broadcaster_host']
+            port = self.configuration['broadcaster_port']
+            log.msg('Connecting to broadcaster on %s:%s' % (host, port))
+            self.broadcaster = self._create_broadcaster(host, port)
+        self.broadcaster.addOnSessionOpenHandler(self.onConnect)
+
+        spool_file = self.configuration.get('spool_file')
+        if spool_file:
+            log.msg('Spooling outbound events to %s' % spool_file)
+            self.spool = EventSpool(spool_file, self.configuration['spool_max_bytes'])
+            self.spool.open()
+            self.broadcaster = SpoolingBroadcaster(self.broadcaster, self.spool)
+
+    def _create_broadcaster(self, host, port):
+        serializer_names = self.configuration.get('event_serializers')
+        if serializer_names and serializer_names != [JSON]:
+            return NegotiatingWampBroadcaster(host, port, 'yadtreceiver', serializer_names)
+        return WampBroadcaster(host, port, 'yadtreceiver')
+
+    def _on_reload_signal(self, signal_number, frame):
+        reactor.callFromThread(self.reload_configuration)
+
+    def _on_drain_signal(self, signal_number, frame):
+        reactor.callFromThread(self.start_drain, 'SIGUSR1')
+
+    def start_drain(self, reason):
+        """
+            Stops voting on new requests and releases the leases, which are
+            not taken again while draining. The receiver stops once the votes in progress and the running
+            commands are done or the drain timeout is reached.
+        """
+        if self.drain:
+            return
+        timeout = self.configuration['drain_timeout']
+        log.msg('Draining (%s): not voting on new requests, stopping in at most %d seconds' % (reason, timeout))
+        METRICS['drains'] += 1
+        self.drain = Drain(reason, timeout)
+        if self.leases:
+            for target, payload in self.leases.release_all():
+                self.announce_lease(target, payload)
+        if self.membership:
+            self.send_heartbeat(leaving=True)
+        self.check_drain()
+
+    def check_drain(self):
+        """
+            Votes in progress include the won requests waiting for the
+            scheduler, their voting state machine is cleaned up once they
+            are spawned. Requests running under a lease have no voting state
+            machine and are only counted in the scheduler queues.
+        """
+        self.drain.update(len(getattr(self, 'states', {})),
+                          self.scheduler.queued() if self.scheduler else 0,
+                          len(self.running_commands) if self.running_commands is not None else 0)
+        if not self.drain.is_done:
+            if not self.drain.is_overdue():
+                reactor.callLater(CHECK_INTERVAL, self.check_drain)
+                return
+            log.msg('Drain timeout reached with %d votes in progress, %d queued requests and %d running commands, '
+                    'running commands are re-adopted from the job journal after the restart'
+                    % (self.drain.votes_in_progress, self.drain.queued_requests, self.drain.running_commands))
+            METRICS['drain_timeouts'] += 1
+
+        log.msg('Drained, flushing events and metrics')
+        self.drain.phase = FLUSHING
+        if self.spool:
+            self.spool.sync()
+            self.broadcaster.replay()
+        if self.journal:
+            self.journal.sync()
+        self.write_metrics_to_file()
+        reactor.callLater(FLUSH_SECONDS, self.finish_drain)
+
+    def finish_drain(self):
+        log.msg('Drained, stopping')
+        self.drain.phase = STOPPING
+        reactor.stop()
+
+    def reload_configuration(self):
+        """
+            Reloads the configuration file (triggered by SIGHUP) and applies
+            only what changed: target subscriptions are adjusted and the
+            broadcaster is reconnected if its endpoint changed. Settings like
+            python_command are picked up by the next request anyway.
+        """
+        start = time()
+        old_allowed_targets = set(self.configuration['allowed_targets'])
+        try:
+            changed_settings = self.configuration.reload()
+        except Exception as e:
+            log.err('Reloading configuration failed: %s' % e)
+            METRICS['config_reloads_failed'] += 1
+            return
+        log.msg('Reloaded configuration, changed settings: %s' % ', '.join(changed_settings))
+
+        if self.broadcaster.client:
+            new_allowed_targets = set(self.configuration['allowed_targets'])
+            for targetname in sorted(new_allowed_targets - old_allowed_targets):
+                log.msg('subscribing to target "%s".' % targetname)
+                self.broadcaster.client.subscribe(self.onEvent, unicode(targetname))
+            for targetname in sorted(old_allowed_targets - new_allowed_targets):
+                self.unsubscribeTarget(targetname)
+
+        if 'broadcaster_host' in changed_settings or 'broadcaster_port' in changed_settings:
+            self._reconnect_broadcaster()
+
+        for setting in changed_settings:
+            if setting not in SETTINGS_APPLIED_ON_USE + ['broadcaster_host', 'broadcaster_port']:
+                log.msg('Changed setting %s will be applied after restarting the receiver' % setting)
+        if self.scheduler and set(changed_settings) & set(['priority_classes', 'default_priority_class']):
+            log.msg('command_priorities and target_priorities are applied right away, but only with the priority '
+                    'classes %s until the restart, requests of other classes are queued as %s'
+                    % (', '.join(sorted(self.scheduler.weights)), self.scheduler.default_priority_class))
+
+        METRICS['config_reloads'] += 1
+        reload_duration = time() - start
+        log.msg('Reloaded configuration in {0} seconds'.format(reload_duration))
+        METRICS['last_config_reload_duration'] = reload_duration
+
+    def _reconnect_broadcaster(self):
+        """
+            Points the broadcaster to the configured endpoint and closes the
+            current session, the broadcaster client reconnects on its own.
+        """
+        if self.configuration.get('broadcasters'):
+            log.msg('Using several broadcasters, changed broadcaster will be applied after restarting the receiver')
+            return
         host = self.configuration['broadcaster_host']
         port = self.configuration['broadcaster_port']
+        log.msg('Reconnecting to broadcaster on %s:%s' % (host, port))
 
-        log.msg('Connecting to broadcaster on %s:%s' % (host, port))
-
-        self.broadcaster = WampBroadcaster(host, port, 'yadtreceiver')
+        self.broadcaster.host = host
+        self.broadcaster.port = port
+        self.broadcaster.url = 'ws://%s:%s/' % (host, port)
         self.broadcaster.addOnSessionOpenHandler(self.onConnect)
+        if self.broadcaster.client:
+            self.broadcaster.client.sendClose()
+
+    def start_lag_monitor(self):
+        if not self.configuration.get('reactor_lag_interval'):
+            return
+        self.lag_monitor = ReactorLagMonitor(self.configuration['reactor_lag_interval'],
+                                             self.configuration['reactor_lag_threshold'])
+        self.lag_monitor.start()
+
+    def start_event_recording(self):
+        recording_file = self.configuration.get('event_recording_file')
+        if not recording_file:
+            return
+        log.msg('Recording received events to %s' % recording_file)
+        self.recorder = EventRecorder(recording_file,
+                                      self.configuration['event_recording_max_bytes'],
+                                      self.configuration['event_recordings_kept'])
+
+    def start_spawn_helper(self):
+        """
+            Starts the spawn helper first, while the receiver process is
+            still small, the commands are spawned by it from then on.
+        """
+        if not self.configuration.get('spawn_helper'):
+            return
+        self.spawn_helper = SpawnHelperExecutor()
+        self.spawn_helper.start()
+        self.executor = self.spawn_helper
+
+    def start_run_output(self):
+        run_output_directory = self.configuration.get('run_output_directory')
+        if not run_output_directory:
+            return
+        log.msg('Writing the output of every run to %s' % run_output_directory)
+        self.run_output = RunOutputStore(run_output_directory,
+                                         self.configuration['run_output_max_bytes'],
+                                         self.configuration['run_output_max_age'])
+        self.prune_run_outputs()
+
+    def prune_run_outputs(self):
+        """
+            Prunes the run outputs in a worker thread every PRUNE_INTERVAL
+            seconds, the removed outputs are counted on the reactor thread.
+        """
+        def count_pruned(pruned):
+            METRICS['run_outputs_pruned'] += pruned
+
+        pruning = threads.deferToThread(self.run_output.prune)
+        pruning.addCallbacks(count_pruned, log.err, errbackArgs=('Could not prune the run outputs',))
+        pruning.addBoth(lambda _: reactor.callLater(PRUNE_INTERVAL, self.prune_run_outputs))
+
+    def start_failure_output(self):
+        store = None
+        if self.configuration.get('failure_output_directory'):
+            store = FailureOutputStore(self.configuration['failure_output_directory'],
+                                       self.configuration['failure_outputs_kept'])
+        self.failure_output = FailureOutputPublisher(self.configuration['hostname'],
+                                                     self.configuration['failure_message_max_bytes'],
+                                                     self.configuration.get('failure_output_chunk_bytes'),
+                                                     store)
+
+    def start_scheduler(self):
+        max_running_commands = self.configuration.get('max_running_commands')
+        if not max_running_commands:
+            return
+        priority_classes = self.configuration['priority_classes']
+        if self.configuration['default_priority_class'] not in priority_classes:
+            raise ReceiverException('Default priority class %s is not one of the priority classes %s'
+                                    % (self.configuration['default_priority_class'], ', '.join(priority_classes)))
+        self.scheduler = RequestScheduler(max_running_commands, priority_classes,
+                                          self.configuration['default_priority_class'])
+
+    def start_leases(self):
+        lease_duration = self.configuration.get('lease_duration')
+        if not lease_duration:
+            return
+        log.msg('Running requests of targets whose lease I hold without voting, leases last %d seconds'
+                % lease_duration)
+        self.leases = LeaseTable(self.configuration['hostname'], lease_duration)
+        self.schedule_lease_renewal(first_call=True)
+
+    def schedule_lease_renewal(self, first_call=False):
+        """
+            A draining receiver has released its leases and does not renew
+            them, the other receivers take the requests over.
+        """
+        reactor.callLater(self.leases.renewal_interval, self.schedule_lease_renewal)
+        if not first_call and not self.drain:
+            for target, payload in self.leases.renew():
+                self.announce_lease(target, payload)
+
+    def announce_lease(self, target, payload):
+        self.broadcaster._sendEvent(events.TYPE_LEASE, data=payload, target=target)
+
+    def release_lease(self, target):
+        payload = self.leases.release(target)
+        if payload is not None:
+            log.msg('Releasing the lease of %s' % target)
+            self.announce_lease(target, payload)
+
+    def start_membership(self):
+        heartbeat_interval = self.configuration.get('heartbeat_interval')
+        if not heartbeat_interval:
+            return
+        log.msg('Sending heartbeats every %d seconds' % heartbeat_interval)
+        self.membership = MembershipTable(self.configuration['hostname'], heartbeat_interval)
+        self.schedule_heartbeat(first_call=True)
+
+    def schedule_heartbeat(self, first_call=False):
+        """
+            A draining receiver keeps announcing that it is leaving, so that
+            the other receivers do not take it back into their view.
+        """
+        reactor.callLater(self.membership.interval, self.schedule_heartbeat)
+        if not first_call:
+            self.membership.expire()
+            self.send_heartbeat(leaving=bool(self.drain))
+
+    def send_heartbeat(self, leaving=False):
+        """
+            Heartbeats are only sent while connected, a queued heartbeat
+            would be stale once it is sent.
+        """
+        if not self.broadcaster.client:
+            return
+        payload = self.membership.heartbeat(self.configuration['allowed_targets'],
+                                            len(self.running_commands) if self.running_commands is not None else 0,
+                                            self.configuration.get('max_running_commands'),
+                                            leaving)
+        self.broadcaster._sendEvent(events.TYPE_HEARTBEAT, data=payload, target=MEMBERSHIP_TOPIC)
+        METRICS['heartbeats_sent'] += 1
+
+    def start_admission_control(self):
+        if not self.configuration.get('admission_control'):
+            return
+        self.admission_controller = AdmissionController(
+            self.configuration['admission_max_load_per_cpu'],
+            self.configuration['admission_min_memory_available_percent'],
+            self.configuration['admission_max_pressure_percent'])
+        self.schedule_admission_sampling()
+
+    def schedule_admission_sampling(self):
+        reactor.callLater(self.configuration['admission_sample_interval'], self.schedule_admission_sampling)
+        self.admission_controller.sample()
+
+    def recover_jobs_from_journal(self):
+        """
+            Replays the job journal (if configured). Jobs whose process is
+            still running are re-adopted, jobs which this receiver won but
+            whose final state was never published are published as failed.
+        """
+        journal_file = self.configuration.get('journal_file')
+        if not journal_file:
+            return
+
+        self.journal = JobJournal(journal_file, self.configuration['journal_snapshot_interval'])
+        start = time()
+        open_jobs = self.journal.open()
+        log.msg('Replayed job journal in {0} seconds, {1} open jobs'.format(time() - start, len(open_jobs)))
+
+        self.adopted_jobs = {}
+        for tracking_id, job in open_jobs.items():
+            if job['pid'] and pid_exists(job['pid']):
+                log.msg('Re-adopting job %r on target %s (pid %s)' % (tracking_id, job['target'], job['pid']))
+                METRICS['journal_adopted'] += 1
+                self.adopted_jobs[tracking_id] = job
+            else:
+                self._publish_lost_job(tracking_id, job)
+
+        if self.adopted_jobs:
+            self.schedule_adopted_jobs_check(first_call=True)
+        self.schedule_journal_sync(first_call=True)
+
+    def schedule_journal_sync(self, delay=1, first_call=False):
+        """
+            Syncs the journal records written since the last batch to disk.
+        """
+        reactor.callLater(delay, self.schedule_journal_sync)
+        if not first_call:
+            self.journal.sync()
+
+    def _publish_lost_job(self, tracking_id, job):
+        if job['state'] in (WON, SPAWNED):
+            message = '(%s) target[%s] request "%s" was lost: receiver restarted, exit code unknown.' % (
+                self.configuration['hostname'], job['target'], job['cmd'])
+            log.err(message)
+            METRICS['journal_orphans'] += 1
+            self.broadcaster.publish_cmd_for_target(
+                job['target'], job['cmd'], events.FAILED, message, tracking_id=tracking_id)
+        else:
+            log.msg('Discarding job %r which was still voting when the receiver stopped' % tracking_id)
+        self.journal.exited(tracking_id, None)
+
+    def schedule_adopted_jobs_check(self, delay=10, first_call=False):
+        """
+            Publishes the final state of re-adopted jobs once their process
+            is gone.
+        """
+        if not first_call:
+            for tracking_id, job in self.adopted_jobs.items():
+                if not pid_exists(job['pid']):
+                    del self.adopted_jobs[tracking_id]
+                    self._publish_lost_job(tracking_id, job)
+        if self.adopted_jobs:
+            reactor.callLater(delay, self.schedule_adopted_jobs_check)
 
     def write_metrics_to_file(self):
 
@@ -380,6 +1043,16 @@ class Receiver(service.Service):
             log.msg("Wrote metrics to file in {0} seconds".format(write_duration))
             METRICS["last_write_duration"] = write_duration
 
+    def schedule_spool_maintenance(self, delay=1, first_call=False):
+        """
+            Syncs the spool to disk and replays pending events as soon as
+            the broadcaster is connected (again).
+        """
+        reactor.callLater(delay, self.schedule_spool_maintenance)
+        if not first_call:
+            self.spool.sync()
+            self.broadcaster.replay()
+
     def reset_metrics_at_midnight(cls, first_call=False):
         reactor.callLater(seconds_to_midnight(), cls.reset_metrics_at_midnight)
         if not first_call:
@@ -387,6 +1060,11 @@ class Receiver(service.Service):
             _reset_metrics(METRICS)
 
 
+def _close_output_fd(result, output_fd):
+    os.close(output_fd)
+    return result
+
+
 def _determine_tracking_id(command_and_arguments_list):
     tracking_id = None
     for command_or_argument in command_and_arguments_list:
@@ -397,19 +1075,33 @@ def _determine_tracking_id(command_and_arguments_list):
 
 class FileSystemWatcher(service.Service):
 
-    def __init__(self, path_to_watch):
+    """
+        Watches the targets directory. New subfolders are reported to the
+        'create' callback, and the target index (if given) is kept current.
+    """
+
+    def __init__(self, path_to_watch, target_index=None):
         self.SUBFOLDER_CREATE = 0x40000100
+        self.SUBFOLDER_DELETE = 0x40000200
+        self.SUBFOLDER_MOVED_FROM = 0x40000040
+        self.SUBFOLDER_MOVED_TO = 0x40000080
         self.path = path_to_watch
+        self.target_index = target_index
 
     def startService(self):
-        in_watch_mask = self.SUBFOLDER_CREATE
+        in_watch_mask = inotify.IN_CREATE | inotify.IN_DELETE | inotify.IN_MOVED_FROM | inotify.IN_MOVED_TO
         notifier = inotify.INotify()
         notifier.startReading()
         notifier.watch(filepath.FilePath(self.path), mask=in_watch_mask,
                        callbacks=[self.onChange])
 
     def onChange(self, watch, path, mask):
-        if mask == self.SUBFOLDER_CREATE:
+        target = path.basename()
+        if mask in (self.SUBFOLDER_CREATE, self.SUBFOLDER_MOVED_TO):
+            if self.target_index is not None:
+                self.target_index.add(target)
             callback = self.onChangeCallbacks['create']
-            target = path.basename()
             callback(target)
+        elif mask in (self.SUBFOLDER_DELETE, self.SUBFOLDER_MOVED_FROM):
+            if self.target_index is not None:
+                self.target_index.discard(target)
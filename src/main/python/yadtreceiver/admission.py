@@ -0,0 +1,178 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Provides admission control based on the pressure of the host.
+
+    The controller samples the load average (per cpu), the available memory
+    and the Linux pressure stall information (/proc/pressure/*). When a
+    threshold is crossed the host is considered under pressure until all
+    measurements are back below HYSTERESIS times their threshold.
+
+    Under pressure new requests are deferred: the receiver still votes, but
+    with a vote lower than any regular vote, so it only wins when no other
+    receiver is available. When a measurement exceeds twice its threshold
+    requests are refused and the receiver does not vote at all.
+"""
+
+from __future__ import division
+
+import os
+from collections import deque
+from multiprocessing import cpu_count
+from time import time
+
+from twisted.python import log
+
+from yadtreceiver import METRICS
+
+ADMIT = 'admit'
+DEFER = 'defer'
+REFUSE = 'refuse'
+
+# '!' sorts before all characters of a uuid, so deferred votes always lose
+DEFERRED_VOTE_PREFIX = '!'
+
+HYSTERESIS = 0.8
+REFUSE_FACTOR = 2
+REMEMBERED_DECISIONS = 100
+
+PRESSURE_DIRECTORY = '/proc/pressure'
+MEMINFO_FILE = '/proc/meminfo'
+
+
+def read_load_per_cpu():
+    return os.getloadavg()[0] / cpu_count()
+
+
+def read_memory_available_percent(meminfo_file=MEMINFO_FILE):
+    """
+        @return: the available memory in percent of the total memory or None
+                 when /proc/meminfo cannot be read or lacks the total memory.
+    """
+    meminfo = {}
+    try:
+        with open(meminfo_file) as meminfo_lines:
+            for line in meminfo_lines:
+                name, value = line.split(':', 1)
+                meminfo[name] = int(value.split()[0])
+    except (IOError, ValueError):
+        return None
+
+    if 'MemAvailable' in meminfo:
+        available = meminfo['MemAvailable']
+    else:  # kernels before 3.14
+        available = meminfo.get('MemFree', 0) + meminfo.get('Buffers', 0) + meminfo.get('Cached', 0)
+    if not meminfo.get('MemTotal'):
+        return None
+    return 100.0 * available / meminfo['MemTotal']
+
+
+def read_pressure_percent(pressure_directory=PRESSURE_DIRECTORY):
+    """
+        @return: the highest "some avg10" stall percentage of cpu, memory and
+                 io or None when PSI is not available.
+    """
+    pressures = []
+    for resource in ('cpu', 'memory', 'io'):
+        try:
+            with open(os.path.join(pressure_directory, resource)) as pressure_file:
+                for line in pressure_file:
+                    fields = line.split()
+                    if fields and fields[0] == 'some':
+                        pressures.append(float(fields[1].split('=')[1]))
+        except (IOError, IndexError, ValueError):
+            continue
+    if not pressures:
+        return None
+    return max(pressures)
+
+
+class AdmissionController(object):
+
+    def __init__(self, max_load_per_cpu, min_memory_available_percent, max_pressure_percent):
+        self.max_load_per_cpu = max_load_per_cpu
+        self.min_memory_available_percent = min_memory_available_percent
+        self.max_pressure_percent = max_pressure_percent
+        self.under_pressure = False
+        self.critical = False
+        self.measurements = {}
+        self.sampled_at = None
+        self.decisions = deque(maxlen=REMEMBERED_DECISIONS)
+
+    def sample(self):
+        self.measurements = {'load_per_cpu': read_load_per_cpu(),
+                             'memory_available_percent': read_memory_available_percent(),
+                             'pressure_percent': read_pressure_percent()}
+        self.sampled_at = time()
+        self.update(self.measurements)
+
+    def update(self, measurements):
+        """
+            Updates the pressure state from the given measurements.
+        """
+        pressures = self._relative_pressures(measurements)
+        was_under_pressure = self.under_pressure
+        if self.under_pressure:
+            self.under_pressure = any(pressure > HYSTERESIS for pressure in pressures)
+        else:
+            self.under_pressure = any(pressure > 1 for pressure in pressures)
+        self.critical = any(pressure > REFUSE_FACTOR for pressure in pressures)
+
+        if self.under_pressure != was_under_pressure:
+            log.msg('Host is %s pressure: %r' % ('under' if self.under_pressure else 'no longer under', measurements))
+            METRICS['admission_pressure_changes'] += 1
+
+    def _relative_pressures(self, measurements):
+        """
+            @return: each measurement relative to its threshold, where values
+                     above 1 mean the threshold is crossed.
+        """
+        pressures = []
+        if measurements.get('load_per_cpu') is not None:
+            pressures.append(measurements['load_per_cpu'] / self.max_load_per_cpu)
+        if measurements.get('memory_available_percent') is not None:
+            pressures.append(self.min_memory_available_percent / max(measurements['memory_available_percent'], 0.01))
+        if measurements.get('pressure_percent') is not None:
+            pressures.append(measurements['pressure_percent'] / self.max_pressure_percent)
+        return pressures
+
+    def decide(self, tracking_id, target):
+        """
+            @return: ADMIT, DEFER or REFUSE for a new request
+        """
+        if self.critical:
+            decision = REFUSE
+        elif self.under_pressure:
+            decision = DEFER
+        else:
+            decision = ADMIT
+        METRICS['admission_%s' % decision] += 1
+        self.decisions.append({'time': time(),
+                               'tracking_id': tracking_id,
+                               'target': target,
+                               'decision': decision})
+        return decision
+
+    def state(self):
+        return {'under_pressure': self.under_pressure,
+                'critical': self.critical,
+                'measurements': self.measurements,
+                'sampled_at': self.sampled_at,
+                'thresholds': {'max_load_per_cpu': self.max_load_per_cpu,
+                               'min_memory_available_percent': self.min_memory_available_percent,
+                               'max_pressure_percent': self.max_pressure_percent},
+                'decisions': list(self.decisions)}
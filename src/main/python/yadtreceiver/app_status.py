@@ -1,31 +1,113 @@
+from hashlib import md5
 from socket import gethostname
 from os.path import basename
+from time import time
 
-from twisted.web import resource
+from twisted.internet import threads
+from twisted.python import log
+from twisted.web import http, resource, server
 try:
     import simplejson as json  # better performance
 except ImportError:
     import json
 
 import yadtreceiver
-from yadtreceiver.psutil_wrapper import get_processes
+from yadtreceiver import psutil_wrapper
+from yadtreceiver.run_output import DEFAULT_TAIL_BYTES, MAX_TAIL_BYTES
+
+DEFAULT_CACHE_TTL = 2
+
+
+class StatusSnapshot(object):
+
+    def __init__(self, status):
+        self.status = status
+        self.body = json.dumps(status, separators=(',', ':'))
+        self.etag = '"%s"' % md5(self.body).hexdigest()
+        self.created = time()
 
 
 class AppStatusResource(resource.Resource):
-    isLeaf = True
+    """
+        Serves the status on / and answers 404 for every path which is not
+        one of its children (e.g. /failure-output).
+    """
 
-    def __init__(self, receiver):
+    def __init__(self, receiver, cache_ttl=DEFAULT_CACHE_TTL):
+        """
+            The status snapshot is computed in a worker thread and cached for
+            cache_ttl seconds. Requests arriving while a snapshot is computed
+            wait for that computation instead of starting their own.
+        """
         self.receiver = receiver
         self.hostname = gethostname()
-        super(type(self), self).__init__()
+        self.cache_ttl = cache_ttl
+        self.snapshot = None
+        self.waiting_requests = []
+        resource.Resource.__init__(self)
+
+    def getChild(self, path, request):
+        if path == '':
+            return self
+        return resource.NoResource()
 
     def render_GET(self, request):
-        request.setHeader('Content-Type', 'application/json')
-        status_json = {
+        if self.snapshot and time() - self.snapshot.created < self.cache_ttl:
+            return self.render_snapshot(request, self.snapshot)
+
+        self.waiting_requests.append(request)
+        request.notifyFinish().addErrback(lambda _: self._forget_request(request))
+        if len(self.waiting_requests) == 1:
+            snapshot = threads.deferToThread(self.compute_snapshot)
+            snapshot.addCallbacks(self._snapshot_computed, self._snapshot_failed)
+        return server.NOT_DONE_YET
+
+    def compute_snapshot(self):
+        status = {
             "name": "yadtreceiver v{0} on {1}".format(yadtreceiver.__version__, self.hostname),
             "running_commands": self.get_list_of_running_yadtshell_processes_spawned_by_receiver(),
         }
-        return json.dumps(status_json, indent=4)
+        if getattr(self.receiver, 'startup', None):
+            status["startup"] = self.receiver.startup.state()
+        if getattr(self.receiver, 'fan_in', None):
+            status["broadcasters"] = self.receiver.fan_in.state()
+        if getattr(self.receiver, 'scheduler', None):
+            status["scheduler"] = self.receiver.scheduler.state()
+        if getattr(self.receiver, 'admission_controller', None):
+            status["admission"] = self.receiver.admission_controller.state()
+        if getattr(self.receiver, 'leases', None):
+            status["leases"] = self.receiver.leases.state()
+        if getattr(self.receiver, 'membership', None):
+            status["members"] = self.receiver.membership.state()
+        if getattr(self.receiver, 'drain', None):
+            status["drain"] = self.receiver.drain.state()
+        return StatusSnapshot(status)
+
+    def render_snapshot(self, request, snapshot):
+        request.setHeader('Content-Type', 'application/json')
+        if request.setETag(snapshot.etag) == http.CACHED:
+            return ''
+        if request.args.get('pretty'):
+            return json.dumps(snapshot.status, indent=4)
+        return snapshot.body
+
+    def _forget_request(self, request):
+        if request in self.waiting_requests:
+            self.waiting_requests.remove(request)
+
+    def _snapshot_computed(self, snapshot):
+        self.snapshot = snapshot
+        waiting_requests, self.waiting_requests = self.waiting_requests, []
+        for request in waiting_requests:
+            request.write(self.render_snapshot(request, snapshot))
+            request.finish()
+
+    def _snapshot_failed(self, failure):
+        log.err(failure, 'Could not compute app status')
+        waiting_requests, self.waiting_requests = self.waiting_requests, []
+        for request in waiting_requests:
+            request.setResponseCode(http.INTERNAL_SERVER_ERROR)
+            request.finish()
 
     def get_list_of_running_yadtshell_processes_spawned_by_receiver(self):
         yadtshell_script_name = self.receiver.configuration.get("script_to_execute")
@@ -43,6 +125,83 @@ class AppStatusResource(resource.Resource):
         return rendered_commands
 
     def get_python_processes_containing(self, script_name):
-        python_processes = filter(lambda p: p.name() == "python", get_processes())
-        matching_processes = filter(lambda p: script_name in p.cmdline(), python_processes)
-        return matching_processes
+        return psutil_wrapper.get_python_processes_containing(script_name)
+
+
+class FailureOutputResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, receiver):
+        """
+            The store is looked up on every request since the receiver
+            creates it when the service starts.
+        """
+        self.receiver = receiver
+        resource.Resource.__init__(self)
+
+    def render_GET(self, request):
+        tracking_id = request.postpath[0] if len(request.postpath) == 1 else None
+        store = getattr(self.receiver.failure_output, 'store', None)
+        output = store.load(tracking_id) if store else None
+        if output is None:
+            request.setResponseCode(http.NOT_FOUND)
+            return ''
+        request.setHeader('Content-Type', 'text/plain')
+        return output
+
+
+class RunOutputResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, receiver):
+        """
+            The store is looked up on every request since the receiver
+            creates it when the service starts.
+        """
+        self.receiver = receiver
+        resource.Resource.__init__(self)
+
+    def render_GET(self, request):
+        tracking_id = request.postpath[0] if len(request.postpath) == 1 else None
+        try:
+            max_bytes = min(int(request.args.get('bytes', [DEFAULT_TAIL_BYTES])[0]), MAX_TAIL_BYTES)
+        except ValueError:
+            request.setResponseCode(http.BAD_REQUEST)
+            return ''
+        store = self.receiver.run_output
+        output = store.tail(tracking_id, max_bytes) if store else None
+        if output is None:
+            request.setResponseCode(http.NOT_FOUND)
+            return ''
+        request.setHeader('Content-Type', 'text/plain')
+        return output
+
+
+class DrainResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, receiver, token):
+        self.receiver = receiver
+        self.token = token
+        resource.Resource.__init__(self)
+
+    def render_GET(self, request):
+        request.setHeader('Content-Type', 'application/json')
+        drain = self.receiver.drain
+        return json.dumps(drain.state() if drain else None)
+
+    def render_POST(self, request):
+        if not self.is_authorized(request):
+            request.setResponseCode(http.UNAUTHORIZED)
+            request.setHeader('WWW-Authenticate', 'Bearer')
+            return ''
+        self.receiver.start_drain('app status request')
+        request.setResponseCode(http.ACCEPTED)
+        return self.render_GET(request)
+
+    def is_authorized(self, request):
+        from yadtreceiver.profiling import compare_digest  # imported on first use to start faster
+
+        authorization = request.getHeader('Authorization') or ''
+        scheme, _, token = authorization.partition(' ')
+        return bool(self.token) and scheme == 'Bearer' and compare_digest(token.strip(), self.token)
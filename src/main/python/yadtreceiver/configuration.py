@@ -34,21 +34,57 @@
 import os
 import socket
 
-from glob import glob
-from twisted.python import filepath
+from yadtcommons.configuration import ConfigurationException, YadtConfigParser
 
-from yadtcommons.configuration import YadtConfigParser
+from yadtreceiver.ratelimit import parse_rate_limit
+from yadtreceiver.target_index import TargetDirectoryIndex
 
 
 DEFAULT_BROADCASTER_HOST = 'localhost'
 DEFAULT_BROADCASTER_PORT = "8081"
+DEFAULT_BROADCASTER_RECENT_IDS = "10000"
+DEFAULT_EVENT_RECORDING_MAX_BYTES = "10485760"
+DEFAULT_EVENT_RECORDINGS_KEPT = "5"
+DEFAULT_RUN_OUTPUT_MAX_BYTES = "1073741824"
+DEFAULT_RUN_OUTPUT_MAX_AGE = "604800"
 
 DEFAULT_LOG_FILENAME = '/var/log/yadtreceiver.log'
+DEFAULT_LOG_ROTATE_BYTES = "20000000"
+DEFAULT_LOG_ROTATE_INTERVAL = "0"
+DEFAULT_LOG_ROTATED_FILES = "10"
+DEFAULT_LOG_COMPRESSION = 'gzip'
 DEFAULT_PYTHON_COMMAND = '/usr/bin/python'
 DEFAULT_SCRIPT_TO_EXECUTE = '/usr/bin/yadtshell'
 DEFAULT_TARGETS = set()
 DEFAULT_TARGETS_DIRECTORY = '/etc/yadtshell/targets/'
 DEFAULT_APP_STATUS_PORT = "8080"
+DEFAULT_APP_STATUS_CACHE_TTL = "2"
+DEFAULT_SPOOL_MAX_BYTES = "1048576"
+DEFAULT_JOURNAL_SNAPSHOT_INTERVAL = "1000"
+DEFAULT_COMMAND_TIMEOUT = "0"
+DEFAULT_COMMAND_KILL_GRACE_PERIOD = "30"
+DEFAULT_SETSID_COMMAND = '/usr/bin/setsid'
+DEFAULT_EVENT_SERIALIZERS = ['json']
+DEFAULT_REACTOR_LAG_INTERVAL = "0.25"
+DEFAULT_REACTOR_LAG_THRESHOLD = "0.5"
+DEFAULT_PROFILING_MAX_SECONDS = "30"
+DEFAULT_PROFILING_SAMPLE_INTERVAL = "0.01"
+DEFAULT_FAILURE_MESSAGE_MAX_BYTES = "16384"
+DEFAULT_FAILURE_OUTPUT_CHUNK_BYTES = "0"
+DEFAULT_FAILURE_OUTPUTS_KEPT = "100"
+DEFAULT_MAX_RUNNING_COMMANDS = "0"
+DEFAULT_LEASE_DURATION = "0"
+DEFAULT_HEARTBEAT_INTERVAL = "0"
+DEFAULT_DRAIN_TIMEOUT = "600"
+DEFAULT_SPAWN_HELPER = "no"
+DEFAULT_REQUEST_RATE_LIMIT = "0"
+DEFAULT_PRIORITY_CLASSES = ['high:9', 'normal:3', 'low:1']
+DEFAULT_PRIORITY_CLASS = 'normal'
+DEFAULT_ADMISSION_CONTROL = "no"
+DEFAULT_ADMISSION_MAX_LOAD_PER_CPU = "2.0"
+DEFAULT_ADMISSION_MIN_MEMORY_AVAILABLE_PERCENT = "10"
+DEFAULT_ADMISSION_MAX_PRESSURE_PERCENT = "40"
+DEFAULT_ADMISSION_SAMPLE_INTERVAL = "5"
 
 SECTION_BROADCASTER = 'broadcaster'
 SECTION_RECEIVER = 'receiver'
@@ -67,6 +103,31 @@ class ReceiverConfigLoader (object):
         """
         self._parser = YadtConfigParser()
 
+    def _get_option_as_float(self, section, option, default_value):
+        option_value = self._parser.get_option(section, option, default_value)
+        try:
+            return float(option_value)
+        except ValueError:
+            raise ConfigurationException('Option %s in section %s expected a number, but got %s'
+                                         % (option, section, option_value))
+
+    def _get_option_as_dict(self, section, option, value_type=str, default_value=None):
+        """
+            Parses options like "dev*:600, pro*:3600" into a dictionary,
+            converting the values with value_type.
+        """
+        result = {}
+        for entry in self._parser.get_option_as_list(section, option, default_value or []):
+            key, _, value = entry.rpartition(':')
+            try:
+                if not key.strip():
+                    raise ValueError(entry)
+                result[key.strip()] = value_type(value.strip())
+            except ValueError:
+                raise ConfigurationException('Option %s in section %s expected entries like "name:value", but got %s'
+                                             % (option, section, entry))
+        return result
+
     def get_app_status_port(self):
         """
             @return: the app status port from the configuration file as int,
@@ -74,6 +135,245 @@ class ReceiverConfigLoader (object):
         """
         return self._parser.get_option_as_int(SECTION_RECEIVER, 'app_status_port', DEFAULT_APP_STATUS_PORT)
 
+    def get_app_status_cache_ttl(self):
+        """
+            @return: the number of seconds an app status snapshot is cached
+                     as int, otherwise DEFAULT_APP_STATUS_CACHE_TTL.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'app_status_cache_ttl', DEFAULT_APP_STATUS_CACHE_TTL)
+
+    def get_reactor_lag_interval(self):
+        """
+            @return: the seconds between two reactor lag measurements as float
+                     (0 turns the lag monitor off), otherwise DEFAULT_REACTOR_LAG_INTERVAL.
+        """
+        return self._get_option_as_float(SECTION_RECEIVER, 'reactor_lag_interval', DEFAULT_REACTOR_LAG_INTERVAL)
+
+    def get_reactor_lag_threshold(self):
+        """
+            @return: the reactor lag in seconds above which the blocking call
+                     is logged as float, otherwise DEFAULT_REACTOR_LAG_THRESHOLD.
+        """
+        return self._get_option_as_float(SECTION_RECEIVER, 'reactor_lag_threshold', DEFAULT_REACTOR_LAG_THRESHOLD)
+
+    def get_profiling_token(self):
+        """
+            @return: the token which enables the profiling resource on the
+                     app status port, otherwise None (profiling is off).
+        """
+        return self._parser.get_option(SECTION_RECEIVER, 'profiling_token', None)
+
+    def get_profiling_max_seconds(self):
+        """
+            @return: the longest profiling capture in seconds as int,
+                     otherwise DEFAULT_PROFILING_MAX_SECONDS.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'profiling_max_seconds', DEFAULT_PROFILING_MAX_SECONDS)
+
+    def get_profiling_sample_interval(self):
+        """
+            @return: the seconds between two stack samples as float,
+                     otherwise DEFAULT_PROFILING_SAMPLE_INTERVAL.
+        """
+        return self._get_option_as_float(SECTION_RECEIVER, 'profiling_sample_interval',
+                                         DEFAULT_PROFILING_SAMPLE_INTERVAL)
+
+    def get_event_serializers(self):
+        """
+            @return: the serializers offered to the broadcaster in order of
+                     preference, e.g. "event_serializers = msgpack, json",
+                     otherwise DEFAULT_EVENT_SERIALIZERS.
+        """
+        return self._parser.get_option_as_list(SECTION_RECEIVER, 'event_serializers', DEFAULT_EVENT_SERIALIZERS)
+
+    def get_failure_message_max_bytes(self):
+        """
+            @return: the maximum size of the message of a failed-event as int,
+                     otherwise DEFAULT_FAILURE_MESSAGE_MAX_BYTES.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'failure_message_max_bytes',
+                                              DEFAULT_FAILURE_MESSAGE_MAX_BYTES)
+
+    def get_failure_output_chunk_bytes(self):
+        """
+            @return: the chunk size for sending the full error output of a
+                     failed command as int (0 means not sending it),
+                     otherwise DEFAULT_FAILURE_OUTPUT_CHUNK_BYTES.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'failure_output_chunk_bytes',
+                                              DEFAULT_FAILURE_OUTPUT_CHUNK_BYTES)
+
+    def get_failure_output_directory(self):
+        """
+            @return: the directory to keep the full error output of failed
+                     commands in, otherwise None.
+        """
+        return self._parser.get_option(SECTION_RECEIVER, 'failure_output_directory', None)
+
+    def get_failure_outputs_kept(self):
+        """
+            @return: the number of error outputs to keep as int,
+                     otherwise DEFAULT_FAILURE_OUTPUTS_KEPT.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'failure_outputs_kept', DEFAULT_FAILURE_OUTPUTS_KEPT)
+
+    def get_event_recording_file(self):
+        """
+            @return: the file to record all received events in, otherwise
+                     None (no recording).
+        """
+        return self._parser.get_option(SECTION_RECEIVER, 'event_recording_file', None)
+
+    def get_event_recording_max_bytes(self):
+        """
+            @return: the size in bytes after which the event recording is
+                     rotated as int, otherwise DEFAULT_EVENT_RECORDING_MAX_BYTES.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'event_recording_max_bytes',
+                                              DEFAULT_EVENT_RECORDING_MAX_BYTES)
+
+    def get_event_recordings_kept(self):
+        """
+            @return: the number of rotated event recordings to keep as int,
+                     otherwise DEFAULT_EVENT_RECORDINGS_KEPT.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'event_recordings_kept', DEFAULT_EVENT_RECORDINGS_KEPT)
+
+    def get_run_output_directory(self):
+        """
+            @return: the directory to write the output of every run to,
+                     otherwise None (the output goes through the receiver).
+        """
+        return self._parser.get_option(SECTION_RECEIVER, 'run_output_directory', None)
+
+    def get_run_output_max_bytes(self):
+        """
+            @return: the size in bytes all run outputs together may take as
+                     int, otherwise DEFAULT_RUN_OUTPUT_MAX_BYTES.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'run_output_max_bytes', DEFAULT_RUN_OUTPUT_MAX_BYTES)
+
+    def get_run_output_max_age(self):
+        """
+            @return: the seconds after which a run output is removed as int,
+                     otherwise DEFAULT_RUN_OUTPUT_MAX_AGE.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'run_output_max_age', DEFAULT_RUN_OUTPUT_MAX_AGE)
+
+    def get_lease_duration(self):
+        """
+            @return: the seconds a lease on a target is valid without being
+                     renewed as int (0 turns leases off and every request is
+                     voted on), otherwise DEFAULT_LEASE_DURATION.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'lease_duration', DEFAULT_LEASE_DURATION)
+
+    def get_heartbeat_interval(self):
+        """
+            @return: the seconds between the heartbeats announcing this
+                     receiver to the others as int (0 turns heartbeats and the
+                     membership table off), otherwise DEFAULT_HEARTBEAT_INTERVAL.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'heartbeat_interval', DEFAULT_HEARTBEAT_INTERVAL)
+
+    def get_drain_timeout(self):
+        """
+            @return: the seconds a draining receiver waits for running
+                     commands before it stops as int, otherwise
+                     DEFAULT_DRAIN_TIMEOUT.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'drain_timeout', DEFAULT_DRAIN_TIMEOUT)
+
+    def get_drain_token(self):
+        """
+            @return: the token which allows POST /drain on the app status
+                     port, otherwise None (draining by signal only).
+        """
+        return self._parser.get_option(SECTION_RECEIVER, 'drain_token', None)
+
+    def get_spawn_helper(self):
+        """
+            @return: True if the commands are spawned by the small spawn
+                     helper process instead of the receiver ("yes"),
+                     otherwise DEFAULT_SPAWN_HELPER.
+        """
+        return self._parser.get_option_as_yes_or_no_boolean(SECTION_RECEIVER, 'spawn_helper', DEFAULT_SPAWN_HELPER)
+
+    def get_max_running_commands(self):
+        """
+            @return: the number of commands which may run at the same time as
+                     int (0 means unlimited), otherwise DEFAULT_MAX_RUNNING_COMMANDS.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'max_running_commands', DEFAULT_MAX_RUNNING_COMMANDS)
+
+    def get_priority_classes(self):
+        """
+            @return: dictionary of scheduling weights by priority class, e.g.
+                     "priority_classes = high:9, normal:3, low:1"
+        """
+        return self._get_option_as_dict(SECTION_RECEIVER, 'priority_classes', int, DEFAULT_PRIORITY_CLASSES)
+
+    def get_default_priority_class(self):
+        """
+            @return: the priority class of requests without a configured
+                     priority, otherwise DEFAULT_PRIORITY_CLASS.
+        """
+        return self._parser.get_option(SECTION_RECEIVER, 'default_priority_class', DEFAULT_PRIORITY_CLASS)
+
+    def get_command_priorities(self):
+        """
+            @return: dictionary of priority classes by yadtshell command, e.g.
+                     "command_priorities = update:high, status:low"
+        """
+        return self._get_option_as_dict(SECTION_RECEIVER, 'command_priorities')
+
+    def get_target_priorities(self):
+        """
+            @return: dictionary of priority classes by target glob, e.g.
+                     "target_priorities = pro*:high, dev*:low"
+        """
+        return self._get_option_as_dict(SECTION_RECEIVER, 'target_priorities')
+
+    def get_admission_control(self):
+        """
+            @return: True if admission control is enabled ("yes"),
+                     otherwise DEFAULT_ADMISSION_CONTROL.
+        """
+        return self._parser.get_option_as_yes_or_no_boolean(SECTION_RECEIVER, 'admission_control',
+                                                            DEFAULT_ADMISSION_CONTROL)
+
+    def get_admission_max_load_per_cpu(self):
+        """
+            @return: the 1 minute load average per cpu above which the host is
+                     under pressure, otherwise DEFAULT_ADMISSION_MAX_LOAD_PER_CPU.
+        """
+        return self._get_option_as_float(SECTION_RECEIVER, 'admission_max_load_per_cpu',
+                                         DEFAULT_ADMISSION_MAX_LOAD_PER_CPU)
+
+    def get_admission_min_memory_available_percent(self):
+        """
+            @return: the available memory in percent below which the host is
+                     under pressure, otherwise DEFAULT_ADMISSION_MIN_MEMORY_AVAILABLE_PERCENT.
+        """
+        return self._get_option_as_float(SECTION_RECEIVER, 'admission_min_memory_available_percent',
+                                         DEFAULT_ADMISSION_MIN_MEMORY_AVAILABLE_PERCENT)
+
+    def get_admission_max_pressure_percent(self):
+        """
+            @return: the PSI stall percentage (some avg10) above which the host
+                     is under pressure, otherwise DEFAULT_ADMISSION_MAX_PRESSURE_PERCENT.
+        """
+        return self._get_option_as_float(SECTION_RECEIVER, 'admission_max_pressure_percent',
+                                         DEFAULT_ADMISSION_MAX_PRESSURE_PERCENT)
+
+    def get_admission_sample_interval(self):
+        """
+            @return: the seconds between two samples of the host pressure as
+                     int, otherwise DEFAULT_ADMISSION_SAMPLE_INTERVAL.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'admission_sample_interval',
+                                              DEFAULT_ADMISSION_SAMPLE_INTERVAL)
+
     def get_broadcaster_host(self):
         """
             @return: the broadcaster host from the configuration file,
@@ -88,6 +388,87 @@ class ReceiverConfigLoader (object):
         """
         return self._parser.get_option_as_int(SECTION_BROADCASTER, 'port', DEFAULT_BROADCASTER_PORT)
 
+    def get_broadcasters(self):
+        """
+            Parses "hosts = broadcaster1:8081, broadcaster2:8081" in the
+            broadcaster section.
+
+            @return: list of (host, port) of all broadcasters the receiver
+                     connects to, empty when only host and port are used.
+        """
+        broadcasters = []
+        for entry in self._parser.get_option_as_list(SECTION_BROADCASTER, 'hosts', []):
+            host, _, port = entry.rpartition(':')
+            if not host.strip() or not port.strip().isdigit():
+                raise ConfigurationException('Option hosts in section %s expected entries like "host:port", but got %s'
+                                             % (SECTION_BROADCASTER, entry))
+            broadcasters.append((host.strip(), int(port)))
+        return broadcasters
+
+    def get_broadcaster_recent_ids(self):
+        """
+            @return: how many requests and votes are remembered to drop the
+                     duplicates arriving from several broadcasters as int,
+                     otherwise DEFAULT_BROADCASTER_RECENT_IDS.
+        """
+        return self._parser.get_option_as_int(SECTION_BROADCASTER, 'recent_ids', DEFAULT_BROADCASTER_RECENT_IDS)
+
+    def get_command_timeout(self):
+        """
+            @return: the default wall-clock timeout of a command in seconds
+                     as int (0 means no timeout), otherwise DEFAULT_COMMAND_TIMEOUT.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'command_timeout', DEFAULT_COMMAND_TIMEOUT)
+
+    def get_command_timeouts(self):
+        """
+            @return: dictionary of timeouts by yadtshell command, e.g.
+                     "command_timeouts = update:7200, status:300"
+        """
+        return self._get_option_as_dict(SECTION_RECEIVER, 'command_timeouts', int)
+
+    def get_request_rate_limit(self):
+        """
+            @return: the rate limit of all requests as tuple (requests,
+                     seconds), e.g. "request_rate_limit = 100/60", or None
+                     for 0, otherwise DEFAULT_REQUEST_RATE_LIMIT.
+        """
+        option_value = self._parser.get_option(SECTION_RECEIVER, 'request_rate_limit', DEFAULT_REQUEST_RATE_LIMIT)
+        try:
+            return parse_rate_limit(option_value)
+        except ValueError:
+            raise ConfigurationException('Option request_rate_limit in section %s expected a limit like '
+                                         '"<requests>/<seconds>", but got %s' % (SECTION_RECEIVER, option_value))
+
+    def get_target_request_rate_limits(self):
+        """
+            @return: dictionary of rate limits by target glob, e.g.
+                     "target_request_rate_limits = dev*:10/60, pro*:2/60"
+        """
+        return self._get_option_as_dict(SECTION_RECEIVER, 'target_request_rate_limits', parse_rate_limit)
+
+    def get_target_timeouts(self):
+        """
+            @return: dictionary of timeouts by target glob, e.g.
+                     "target_timeouts = dev*:600"
+        """
+        return self._get_option_as_dict(SECTION_RECEIVER, 'target_timeouts', int)
+
+    def get_command_kill_grace_period(self):
+        """
+            @return: the seconds between SIGTERM and SIGKILL of a timed out
+                     command as int, otherwise DEFAULT_COMMAND_KILL_GRACE_PERIOD.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'command_kill_grace_period',
+                                              DEFAULT_COMMAND_KILL_GRACE_PERIOD)
+
+    def get_setsid_command(self):
+        """
+            @return: the setsid command used to start commands with a timeout in
+                     their own process group, otherwise DEFAULT_SETSID_COMMAND.
+        """
+        return self._parser.get_option(SECTION_RECEIVER, 'setsid_command', DEFAULT_SETSID_COMMAND)
+
     def get_hostname(self):
         """
             @return: if a hostname is given in the configuration file it will
@@ -103,6 +484,34 @@ class ReceiverConfigLoader (object):
         """
         return self._parser.get_option(SECTION_RECEIVER, 'log_filename', DEFAULT_LOG_FILENAME)
 
+    def get_log_rotate_bytes(self):
+        """
+            @return: the size in bytes at which the log is rotated as int
+                     (0 turns it off), otherwise DEFAULT_LOG_ROTATE_BYTES.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'log_rotate_bytes', DEFAULT_LOG_ROTATE_BYTES)
+
+    def get_log_rotate_interval(self):
+        """
+            @return: the seconds after which the log is rotated as int
+                     (0 turns it off), otherwise DEFAULT_LOG_ROTATE_INTERVAL.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'log_rotate_interval', DEFAULT_LOG_ROTATE_INTERVAL)
+
+    def get_log_rotated_files(self):
+        """
+            @return: the number of rotated log files to keep as int,
+                     otherwise DEFAULT_LOG_ROTATED_FILES.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'log_rotated_files', DEFAULT_LOG_ROTATED_FILES)
+
+    def get_log_compression(self):
+        """
+            @return: the compression of rotated log files (gzip, zstd or
+                     none), otherwise DEFAULT_LOG_COMPRESSION.
+        """
+        return self._parser.get_option(SECTION_RECEIVER, 'log_compression', DEFAULT_LOG_COMPRESSION)
+
     def get_python_command(self):
         """
             @return: the python command from the configuration file if given,
@@ -155,9 +564,58 @@ class ReceiverConfigLoader (object):
         if metrics_directory is not None:
             return os.path.join(metrics_directory, 'yrc.metrics')
 
+    def get_spool_directory(self):
+        """
+            @return: the spool_directory from the receiver configuration and
+            None otherwise
+        """
+        return self._parser.get_option(SECTION_RECEIVER, 'spool_directory',
+                                       None)
+
+    def get_spool_file(self):
+        """
+            @return: the derived spool_file or None
+        """
+        spool_directory = self.get_spool_directory()
+        if spool_directory is not None:
+            return os.path.join(spool_directory, 'outbound.spool')
+
+    def get_spool_max_bytes(self):
+        """
+            @return: the maximum size of the spool file in bytes as int,
+                     otherwise DEFAULT_SPOOL_MAX_BYTES.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'spool_max_bytes', DEFAULT_SPOOL_MAX_BYTES)
+
+    def get_journal_directory(self):
+        """
+            @return: the journal_directory from the receiver configuration and
+            None otherwise
+        """
+        return self._parser.get_option(SECTION_RECEIVER, 'journal_directory',
+                                       None)
+
+    def get_journal_file(self):
+        """
+            @return: the derived journal_file or None
+        """
+        journal_directory = self.get_journal_directory()
+        if journal_directory is not None:
+            return os.path.join(journal_directory, 'jobs.journal')
+
+    def get_journal_snapshot_interval(self):
+        """
+            @return: the number of journal records after which a snapshot is
+                     written as int, otherwise DEFAULT_JOURNAL_SNAPSHOT_INTERVAL.
+        """
+        return self._parser.get_option_as_int(SECTION_RECEIVER, 'journal_snapshot_interval',
+                                              DEFAULT_JOURNAL_SNAPSHOT_INTERVAL)
+
 
 class ReceiverConfig(object):
 
+    target_index = None
+
     def __init__(self, config_filename):
         self.config_filename = config_filename
         self.load()
@@ -169,8 +627,14 @@ class ReceiverConfig(object):
         self.configuration = {
             'broadcaster_host': parser.get_broadcaster_host(),
             'broadcaster_port': parser.get_broadcaster_port(),
+            'broadcasters': parser.get_broadcasters(),
+            'broadcaster_recent_ids': parser.get_broadcaster_recent_ids(),
             'hostname': parser.get_hostname(),
             'log_filename': parser.get_log_filename(),
+            'log_rotate_bytes': parser.get_log_rotate_bytes(),
+            'log_rotate_interval': parser.get_log_rotate_interval(),
+            'log_rotated_files': parser.get_log_rotated_files(),
+            'log_compression': parser.get_log_compression(),
             'python_command': parser.get_python_command(),
             'script_to_execute': parser.get_script_to_execute(),
             'targets': parser.get_targets(),
@@ -178,19 +642,79 @@ class ReceiverConfig(object):
             'metrics_directory': parser.get_metrics_directory(),
             'metrics_file': parser.get_metrics_file(),
             'app_status_port': parser.get_app_status_port(),
+            'app_status_cache_ttl': parser.get_app_status_cache_ttl(),
+            'command_timeout': parser.get_command_timeout(),
+            'command_timeouts': parser.get_command_timeouts(),
+            'target_timeouts': parser.get_target_timeouts(),
+            'command_kill_grace_period': parser.get_command_kill_grace_period(),
+            'setsid_command': parser.get_setsid_command(),
+            'reactor_lag_interval': parser.get_reactor_lag_interval(),
+            'reactor_lag_threshold': parser.get_reactor_lag_threshold(),
+            'profiling_token': parser.get_profiling_token(),
+            'profiling_max_seconds': parser.get_profiling_max_seconds(),
+            'profiling_sample_interval': parser.get_profiling_sample_interval(),
+            'event_serializers': parser.get_event_serializers(),
+            'failure_message_max_bytes': parser.get_failure_message_max_bytes(),
+            'failure_output_chunk_bytes': parser.get_failure_output_chunk_bytes(),
+            'failure_output_directory': parser.get_failure_output_directory(),
+            'failure_outputs_kept': parser.get_failure_outputs_kept(),
+            'event_recording_file': parser.get_event_recording_file(),
+            'event_recording_max_bytes': parser.get_event_recording_max_bytes(),
+            'event_recordings_kept': parser.get_event_recordings_kept(),
+            'run_output_directory': parser.get_run_output_directory(),
+            'run_output_max_bytes': parser.get_run_output_max_bytes(),
+            'run_output_max_age': parser.get_run_output_max_age(),
+            'max_running_commands': parser.get_max_running_commands(),
+            'lease_duration': parser.get_lease_duration(),
+            'heartbeat_interval': parser.get_heartbeat_interval(),
+            'drain_timeout': parser.get_drain_timeout(),
+            'drain_token': parser.get_drain_token(),
+            'spawn_helper': parser.get_spawn_helper(),
+            'request_rate_limit': parser.get_request_rate_limit(),
+            'target_request_rate_limits': parser.get_target_request_rate_limits(),
+            'priority_classes': parser.get_priority_classes(),
+            'default_priority_class': parser.get_default_priority_class(),
+            'command_priorities': parser.get_command_priorities(),
+            'target_priorities': parser.get_target_priorities(),
+            'admission_control': parser.get_admission_control(),
+            'admission_max_load_per_cpu': parser.get_admission_max_load_per_cpu(),
+            'admission_min_memory_available_percent': parser.get_admission_min_memory_available_percent(),
+            'admission_max_pressure_percent': parser.get_admission_max_pressure_percent(),
+            'admission_sample_interval': parser.get_admission_sample_interval(),
+            'spool_directory': parser.get_spool_directory(),
+            'spool_file': parser.get_spool_file(),
+            'spool_max_bytes': parser.get_spool_max_bytes(),
+            'journal_file': parser.get_journal_file(),
+            'journal_snapshot_interval': parser.get_journal_snapshot_interval(),
         }
         self.compute_allowed_targets()
 
     def compute_allowed_targets(self):
-        def _path_to_name(target):
-            return filepath.FilePath(target).basename()
-        allowed_targets = []
-        for target_glob in self['targets']:
-            new_allowed_targets = glob(
-                os.path.join(self['targets_directory'], target_glob))
-            allowed_targets.extend(new_allowed_targets)
-        allowed_targets = [_path_to_name(target) for target in allowed_targets]
-        self.configuration['allowed_targets'] = allowed_targets
+        """
+            Matches the target globs against the in-memory index of the
+            targets directory, which is filled on first use. The index is
+            shared with the FileSystemWatcher, so a changed targets directory
+            is indexed in place.
+        """
+        if self.target_index is None:
+            self.target_index = TargetDirectoryIndex(self['targets_directory'])
+            self.target_index.refresh()
+        elif self.target_index.targets_directory != self['targets_directory']:
+            self.target_index.targets_directory = self['targets_directory']
+            self.target_index.refresh()
+        self.configuration['allowed_targets'] = self.target_index.match(self['targets'])
+
+    def reload(self):
+        """
+            Loads the configuration file again.
+
+            @return: the sorted names of the settings which changed
+        """
+        old_configuration = self.configuration
+        self.load()
+        keys = set(old_configuration) | set(self.configuration)
+        return sorted(key for key in keys
+                      if old_configuration.get(key) != self.configuration.get(key))
 
     def reload_targets(self):
         parser = ReceiverConfigLoader()
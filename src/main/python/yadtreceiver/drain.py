@@ -0,0 +1,91 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Drains the receiver before it stops, triggered by SIGUSR1 or by
+    POST /drain on the app status port (which needs the drain token as
+    "Authorization: Bearer <token>").
+
+    A draining receiver does not vote on new requests and releases its
+    leases, but finishes the votes in progress and the requests it has
+    already won or runs under a lease. Once no vote is in progress, no
+    request is queued and no command is running, or
+    when the drain timeout is reached, it flushes the spooled events and the
+    metrics and stops the reactor. Commands still running then are re-adopted
+    from the job journal after the restart.
+"""
+
+import functools
+from time import time
+
+WAITING = 'waiting'
+FLUSHING = 'flushing'
+STOPPING = 'stopping'
+
+CHECK_INTERVAL = 1
+FLUSH_SECONDS = 1
+
+
+class RunningCommands(object):
+
+    """
+        The process protocols of the commands which have not exited yet.
+    """
+
+    def __init__(self):
+        self.process_protocols = set()
+
+    def started(self, process_protocol):
+        self.process_protocols.add(process_protocol)
+        process_protocol.add_exit_callback(functools.partial(self.process_protocols.discard, process_protocol))
+
+    def __len__(self):
+        return len(self.process_protocols)
+
+
+class Drain(object):
+
+    def __init__(self, reason, timeout, now=None):
+        self.reason = reason
+        self.started_at = time() if now is None else now
+        self.deadline = self.started_at + timeout
+        self.phase = WAITING
+        self.votes_in_progress = None
+        self.queued_requests = None
+        self.running_commands = None
+
+    def update(self, votes_in_progress, queued_requests, running_commands):
+        self.votes_in_progress = votes_in_progress
+        self.queued_requests = queued_requests
+        self.running_commands = running_commands
+
+    @property
+    def is_done(self):
+        return not self.votes_in_progress and not self.queued_requests and not self.running_commands
+
+    def is_overdue(self, now=None):
+        return (time() if now is None else now) >= self.deadline
+
+    def state(self, now=None):
+        if now is None:
+            now = time()
+        return {'reason': self.reason,
+                'phase': self.phase,
+                'seconds_draining': round(now - self.started_at, 1),
+                'seconds_left': round(max(self.deadline - now, 0), 1),
+                'votes_in_progress': self.votes_in_progress,
+                'queued_requests': self.queued_requests,
+                'running_commands': self.running_commands}
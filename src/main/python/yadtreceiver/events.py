@@ -41,6 +41,7 @@ TYPE_SERVICE_CHANGE = 'service-change'
 TYPE_HEARTBEAT = 'heartbeat'
 TYPE_VOTE = 'vote'
 TYPE_CALL_INFO = 'call-info'
+TYPE_LEASE = 'lease'
 
 KNOWN_EVENT_TYPES = [TYPE_COMMAND,
                      TYPE_FULL_UPDATE,
@@ -48,7 +49,8 @@ KNOWN_EVENT_TYPES = [TYPE_COMMAND,
                      TYPE_SERVICE_CHANGE,
                      TYPE_HEARTBEAT,
                      TYPE_VOTE,
-                     TYPE_CALL_INFO]
+                     TYPE_CALL_INFO,
+                     TYPE_LEASE]
 
 
 class IncompleteEventDataException(Exception):
@@ -117,12 +119,25 @@ class Event (object):
         if self.is_a_call_info:
             self._initialize_call_info()
 
+        if self.is_a_lease:
+            self._initialize_lease()
+
+        if self.is_a_heartbeat:
+            self._initialize_heartbeat()
+
     def _initialize_vote(self):
         self.vote = self._ensure_attribute_in_data(ATTRIBUTE_PAYLOAD)
 
     def _initialize_call_info(self):
         pass
 
+    def _initialize_lease(self):
+        self.lease = self._ensure_attribute_in_data(ATTRIBUTE_PAYLOAD)
+
+    def _initialize_heartbeat(self):
+        # only the heartbeats of receivers carry a payload
+        self.heartbeat = self.data.get(ATTRIBUTE_PAYLOAD)
+
     def _initialize_request(self):
         self.command = self._ensure_attribute_in_data(ATTRIBUTE_COMMAND)
         self.arguments = self._ensure_attribute_in_data(ATTRIBUTE_ARGUMENTS)
@@ -196,6 +211,10 @@ class Event (object):
     def is_a_heartbeat(self):
         return self.event_type == TYPE_HEARTBEAT
 
+    @property
+    def is_a_lease(self):
+        return self.event_type == TYPE_LEASE
+
     def __str__(self):
         if self.is_a_request:
             return 'target[{0}] requested command "{1}" using arguments "{2}"'.format(
@@ -225,6 +244,9 @@ class Event (object):
         if self.is_a_call_info:
             return 'Call info from target {0}'.format(self.target)
 
+        if self.is_a_lease:
+            return 'Lease of target {0}: {1}'.format(self.target, self.lease)
+
         return 'Unknown event type {0}'.format(self.event_type)
 
     class ServiceState (object):
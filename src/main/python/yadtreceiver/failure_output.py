@@ -0,0 +1,188 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Keeps the error output of failed commands out of the broadcaster. The
+    message of a failed-event is capped at a configurable size (showing the
+    head and the tail of the output). The full output can be sent compressed
+    as ordered failure-output events and/or kept locally, where it is served
+    by tracking id (/failure-output/<tracking-id> on the app status port).
+"""
+
+import base64
+import gzip
+import os
+import re
+import zlib
+
+from twisted.python import log
+
+from yadtreceiver import METRICS
+
+FAILURE_OUTPUT_EVENT = 'failure-output'
+CHUNK_ENCODING = 'zlib+base64'
+
+DEFAULT_MAX_MESSAGE_BYTES = 16384
+DEFAULT_CHUNK_BYTES = 32768
+DEFAULT_KEPT_OUTPUTS = 100
+
+VALID_TRACKING_ID = re.compile(r'^[A-Za-z0-9_.:-]+$')
+
+
+def excerpt(output, max_bytes, hint=''):
+    """
+        @return: the output when it fits into max_bytes, otherwise its head
+                 and its tail with a marker showing how much was left out.
+    """
+    if len(output) <= max_bytes:
+        return output
+    marker_template = '\n[... %d bytes omitted%s ...]\n'
+    marker = marker_template % (len(output), hint)
+    available = max(max_bytes - len(marker), 0)
+    head_length = available // 2
+    tail_length = available - head_length
+    marker = marker_template % (len(output) - head_length - tail_length, hint)
+    tail = output[-tail_length:] if tail_length else ''
+    return output[:head_length] + marker + tail
+
+
+def compress_to_chunks(output, chunk_bytes):
+    """
+        @return: the zlib compressed and base64 encoded output, split into
+                 chunks of at most chunk_bytes.
+    """
+    encoded = base64.b64encode(zlib.compress(output))
+    return [encoded[start:start + chunk_bytes] for start in range(0, len(encoded), chunk_bytes)] or ['']
+
+
+def decompress_chunks(chunks):
+    return zlib.decompress(base64.b64decode(''.join(chunks)))
+
+
+class FailureOutputStore(object):
+
+    def __init__(self, directory, kept_outputs=DEFAULT_KEPT_OUTPUTS):
+        self.directory = directory
+        self.kept_outputs = kept_outputs
+
+    def _filename(self, tracking_id):
+        if not tracking_id or not VALID_TRACKING_ID.match(tracking_id):
+            return None
+        return os.path.join(self.directory, '%s.gz' % tracking_id)
+
+    def save(self, tracking_id, output):
+        """
+            @return: True when the output was kept.
+        """
+        filename = self._filename(tracking_id)
+        if not filename:
+            return False
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            output_file = gzip.open(filename, 'wb')
+            try:
+                output_file.write(output)
+            finally:
+                output_file.close()
+        except (IOError, OSError) as e:
+            log.err(None, 'Could not keep failure output of %s: %s' % (tracking_id, e))
+            return False
+        self.prune()
+        return True
+
+    def load(self, tracking_id):
+        """
+            @return: the kept output of the given tracking id or None.
+        """
+        filename = self._filename(tracking_id)
+        if not filename or not os.path.exists(filename):
+            return None
+        output_file = gzip.open(filename, 'rb')
+        try:
+            return output_file.read()
+        finally:
+            output_file.close()
+
+    def prune(self):
+        """
+            Removes the oldest outputs, keeping kept_outputs files.
+        """
+        filenames = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                     if name.endswith('.gz')]
+        if len(filenames) <= self.kept_outputs:
+            return
+        filenames.sort(key=os.path.getmtime)
+        for filename in filenames[:len(filenames) - self.kept_outputs]:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+
+class FailureOutputPublisher(object):
+
+    def __init__(self, hostname, max_message_bytes=DEFAULT_MAX_MESSAGE_BYTES, chunk_bytes=None, store=None):
+        """
+            chunk_bytes enables sending the full output as failure-output
+            events, store enables keeping it locally.
+        """
+        self.hostname = hostname
+        self.max_message_bytes = max_message_bytes
+        self.chunk_bytes = chunk_bytes
+        self.store = store
+
+    def publish(self, broadcaster, target, cmd, output, tracking_id=None):
+        """
+            Sends and/or keeps the full output if it does not fit into a
+            message.
+
+            @return: the message for the failed-event
+        """
+        METRICS['failure_output_bytes'] += len(output)
+        if len(output) <= self.max_message_bytes:
+            METRICS['failure_message_bytes'] += len(output)
+            return output
+
+        hints = []
+        if self.chunk_bytes and tracking_id:
+            chunks = self.publish_chunks(broadcaster, target, cmd, output, tracking_id)
+            hints.append('sent in %d %s events' % (chunks, FAILURE_OUTPUT_EVENT))
+        if self.store and self.store.save(tracking_id, output):
+            hints.append('kept on %s' % self.hostname)
+        message = excerpt(output, self.max_message_bytes, ', full output ' + ' and '.join(hints) if hints else '')
+        METRICS['failure_messages_truncated'] += 1
+        METRICS['failure_message_bytes'] += len(message)
+        return message
+
+    def publish_chunks(self, broadcaster, target, cmd, output, tracking_id):
+        """
+            @return: the number of chunks sent
+        """
+        chunks = compress_to_chunks(output, self.chunk_bytes)
+        for index, chunk in enumerate(chunks):
+            broadcaster._sendEvent(FAILURE_OUTPUT_EVENT,
+                                   data=chunk,
+                                   tracking_id=tracking_id,
+                                   target=target,
+                                   cmd=cmd,
+                                   chunk=index,
+                                   chunks=len(chunks),
+                                   encoding=CHUNK_ENCODING)
+            METRICS['failure_output_chunk_bytes'] += len(chunk)
+        METRICS['failure_output_chunks'] += len(chunks)
+        return len(chunks)
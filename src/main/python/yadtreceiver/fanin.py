@@ -0,0 +1,233 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Provides the fan-in of several broadcasters.
+
+    The receiver holds a session to every configured broadcaster and
+    subscribes its targets on all of them, so a slow or restarting
+    broadcaster does not stall it. Requests and votes usually arrive on
+    every session: they are passed on once, keyed by tracking id (and vote),
+    using a bounded cache of recently seen events. Other events are only
+    passed on from the session used for publishing.
+
+    When an event arrives again on another session, the delay since its
+    first arrival is that broadcaster's lag. Outbound events are published
+    on the connected broadcaster with the lowest lag.
+"""
+
+from collections import OrderedDict
+from time import time
+
+from twisted.internet import defer, reactor
+from twisted.python import log
+
+from yadtreceiver import METRICS
+from yadtreceiver import events
+
+DEFAULT_RECENT_IDS = 10000
+LAG_SMOOTHING = 0.2
+
+
+class RecentIds(object):
+
+    """
+        Remembers when and from which broadcaster events were first seen,
+        forgetting the oldest ones beyond max_size.
+    """
+
+    def __init__(self, max_size=DEFAULT_RECENT_IDS):
+        self.max_size = max_size
+        self.first_seen = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.first_seen
+
+    def __len__(self):
+        return len(self.first_seen)
+
+    def add(self, key, broadcaster_url, now):
+        self.first_seen[key] = (now, broadcaster_url)
+        while len(self.first_seen) > self.max_size:
+            self.first_seen.popitem(last=False)
+
+    def get(self, key):
+        """
+            @return: (time, broadcaster url) of the first arrival
+        """
+        return self.first_seen[key]
+
+
+def deduplication_key(event_data):
+    """
+        @return: the key identifying a request or vote, None for other events
+    """
+    if not isinstance(event_data, dict):
+        return None
+    event_type = event_data.get(events.ATTRIBUTE_TYPE)
+    tracking_id = event_data.get('tracking_id')
+    if event_type == events.TYPE_REQUEST and tracking_id:
+        return (event_type, tracking_id)
+    if event_type == events.TYPE_VOTE and tracking_id:
+        return (event_type, tracking_id, event_data.get(events.ATTRIBUTE_PAYLOAD))
+    return None
+
+
+def metrics_name(broadcaster):
+    return '%s_%s' % (broadcaster.host, broadcaster.port)
+
+
+class FanInClient(object):
+
+    """
+        Stands in for the WAMP session of a single broadcaster: subscriptions
+        are made on every connected session and remembered, so they are
+        made again when a session (re)opens.
+    """
+
+    def __init__(self, fan_in):
+        self.fan_in = fan_in
+
+    def subscribe(self, handler, topic):
+        """
+            @return: a deferred which fires when all sessions acknowledged
+                     the subscription.
+        """
+        self.fan_in.subscriptions[topic] = handler
+        return defer.gatherResults([defer.maybeDeferred(self.fan_in.subscribe_on, broadcaster, handler, topic)
+                                    for broadcaster in self.fan_in.connected_broadcasters()])
+
+    def unsubscribe(self, topic):
+        self.fan_in.subscriptions.pop(topic, None)
+        for broadcaster in self.fan_in.connected_broadcasters():
+            broadcaster.client.unsubscribe(topic)
+
+    def publish(self, topic, event):
+        self.fan_in.healthiest().client.publish(topic, event)
+
+    def sendClose(self):
+        for broadcaster in self.fan_in.connected_broadcasters():
+            broadcaster.client.sendClose()
+
+
+class FanInBroadcaster(object):
+
+    """
+        Holds sessions to several broadcasters and behaves like a single
+        broadcaster towards the receiver. Everything which is not part of
+        the fan-in is delegated to the healthiest broadcaster.
+    """
+
+    def __init__(self, broadcasters, recent_ids=DEFAULT_RECENT_IDS):
+        self.broadcasters = broadcasters
+        self.recent_ids = RecentIds(recent_ids)
+        self.subscriptions = OrderedDict()
+        self.lags = dict((broadcaster.url, 0.0) for broadcaster in broadcasters)
+        self.on_session_open_handlers = []
+        self.fan_in_client = FanInClient(self)
+        for broadcaster in broadcasters:
+            broadcaster.addOnSessionOpenHandler(self._session_handler(broadcaster))
+
+    def __getattr__(self, name):
+        return getattr(self.healthiest(), name)
+
+    @property
+    def client(self):
+        """
+            @return: the client of the fan-in or None while no broadcaster
+                     is connected.
+        """
+        if self.connected_broadcasters():
+            return self.fan_in_client
+        return None
+
+    def connected_broadcasters(self):
+        return [broadcaster for broadcaster in self.broadcasters if broadcaster.client]
+
+    def healthiest(self):
+        """
+            @return: the connected broadcaster with the lowest lag (the first
+                     configured one on a tie) or the first broadcaster, which
+                     queues events, while none is connected.
+        """
+        connected = self.connected_broadcasters()
+        if not connected:
+            return self.broadcasters[0]
+        return min(connected, key=lambda broadcaster: self.lags[broadcaster.url])
+
+    def addOnSessionOpenHandler(self, handler):
+        """
+            The handler is called once, when the first session opens.
+            Later sessions get the subscriptions made so far.
+        """
+        self.on_session_open_handlers.append(handler)
+
+    def _session_handler(self, broadcaster):
+        return lambda: self.on_session_open(broadcaster)
+
+    def on_session_open(self, broadcaster):
+        log.msg('Session to broadcaster %s opened' % broadcaster.url)
+        METRICS['broadcaster_sessions_opened.%s' % metrics_name(broadcaster)] += 1
+        # the broadcaster runs its handlers only once and forgets them afterwards,
+        # so register again for the next session once it is done
+        reactor.callLater(0, broadcaster.addOnSessionOpenHandler, self._session_handler(broadcaster))
+
+        for topic, handler in self.subscriptions.items():
+            self.subscribe_on(broadcaster, handler, topic)
+
+        handlers, self.on_session_open_handlers = self.on_session_open_handlers, []
+        for handler in handlers:
+            handler()
+
+    def subscribe_on(self, broadcaster, handler, topic):
+        return broadcaster.client.subscribe(
+            lambda *args: self.on_event(broadcaster, handler, args), topic)
+
+    def on_event(self, broadcaster, handler, args):
+        """
+            Passes the event to the handler unless it is a request or vote
+            which already arrived on another session.
+        """
+        now = time()
+        key = deduplication_key(args[-1])
+        if key is None:
+            if broadcaster is self.healthiest():
+                handler(*args)
+            return
+
+        if key in self.recent_ids:
+            first_seen, first_broadcaster_url = self.recent_ids.get(key)
+            if first_broadcaster_url != broadcaster.url:
+                self.record_lag(broadcaster, now - first_seen)
+            METRICS['events_deduplicated'] += 1
+            return
+
+        self.recent_ids.add(key, broadcaster.url, now)
+        self.record_lag(broadcaster, 0.0)
+        handler(*args)
+
+    def record_lag(self, broadcaster, lag):
+        smoothed_lag = (1 - LAG_SMOOTHING) * self.lags[broadcaster.url] + LAG_SMOOTHING * lag
+        self.lags[broadcaster.url] = smoothed_lag
+        METRICS['broadcaster_lag.%s' % metrics_name(broadcaster)] = smoothed_lag
+
+    def state(self):
+        healthiest = self.healthiest()
+        return [{'url': broadcaster.url,
+                 'connected': bool(broadcaster.client),
+                 'lag': self.lags[broadcaster.url],
+                 'publishing': broadcaster is healthiest}
+                for broadcaster in self.broadcasters]
@@ -0,0 +1,168 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Provides a write-ahead journal of the jobs handled by the receiver, so
+    that a restarted receiver knows which yadtshell processes it started.
+
+    Every state change of a job (accepted, won, spawned, exited) is appended
+    to the journal file as one JSON record per line. A job which this
+    receiver will not run (folded, not spawned) is closed with a discarded
+    record. The records are fsynced in batches of fsync_batch_size and by
+    the receiver every second. Every
+    snapshot_interval records the open jobs are written to a snapshot file
+    and the journal is truncated, so replaying on startup only has to read
+    the snapshot and the records written since.
+"""
+
+import json
+import os
+
+from twisted.python import log
+
+from yadtreceiver import METRICS
+
+ACCEPTED = 'accepted'
+WON = 'won'
+SPAWNED = 'spawned'
+EXITED = 'exited'
+DISCARDED = 'discarded'
+
+DEFAULT_SNAPSHOT_INTERVAL = 1000
+DEFAULT_FSYNC_BATCH_SIZE = 16
+
+
+class JobJournal(object):
+
+    def __init__(self, filename, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL,
+                 fsync_batch_size=DEFAULT_FSYNC_BATCH_SIZE):
+        self.filename = filename
+        self.snapshot_filename = filename + '.snapshot'
+        self.snapshot_interval = snapshot_interval
+        self.fsync_batch_size = fsync_batch_size
+        self.jobs = {}
+        self._records_since_snapshot = 0
+        self._unsynced_records = 0
+        self._file = None
+
+    def open(self):
+        """
+            Replays snapshot and journal and opens the journal for appending.
+
+            @return: dictionary of the jobs which did not exit, by tracking id
+        """
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        if os.path.exists(self.snapshot_filename):
+            with open(self.snapshot_filename) as snapshot_file:
+                self.jobs = json.load(snapshot_file)
+
+        if os.path.exists(self.filename):
+            with open(self.filename) as journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        log.msg('Ignoring truncated journal record %r' % line)
+                        continue
+                    self._apply(record)
+                    self._records_since_snapshot += 1
+
+        self._file = open(self.filename, 'a')
+        return dict(self.jobs)
+
+    def accepted(self, tracking_id, target, command):
+        self._append({'event': ACCEPTED, 'tracking_id': tracking_id,
+                      'target': target, 'cmd': command})
+
+    def won(self, tracking_id):
+        self._append({'event': WON, 'tracking_id': tracking_id})
+
+    def spawned(self, tracking_id, pid):
+        self._append({'event': SPAWNED, 'tracking_id': tracking_id, 'pid': pid})
+
+    def exited(self, tracking_id, return_code):
+        self._append({'event': EXITED, 'tracking_id': tracking_id, 'return_code': return_code})
+
+    def discarded(self, tracking_id, reason):
+        """
+            Closes a job which this receiver will not run, e.g. because it
+            lost the vote or could not spawn the command.
+        """
+        self._append({'event': DISCARDED, 'tracking_id': tracking_id, 'reason': reason})
+
+    def _append(self, record):
+        if record['tracking_id'] is None:
+            return
+        self._apply(record)
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        self._unsynced_records += 1
+        if self._unsynced_records >= self.fsync_batch_size:
+            self.sync()
+        self._records_since_snapshot += 1
+        if self._records_since_snapshot >= self.snapshot_interval:
+            self.snapshot()
+
+    def sync(self):
+        """
+            Forces all written records to disk.
+        """
+        if self._unsynced_records:
+            os.fsync(self._file.fileno())
+            self._unsynced_records = 0
+
+    def _apply(self, record):
+        tracking_id = record['tracking_id']
+        event = record['event']
+        if event == ACCEPTED:
+            self.jobs[tracking_id] = {'target': record['target'],
+                                      'cmd': record['cmd'],
+                                      'state': ACCEPTED,
+                                      'pid': None}
+        elif tracking_id not in self.jobs:
+            return
+        elif event in (EXITED, DISCARDED):
+            del self.jobs[tracking_id]
+        else:
+            self.jobs[tracking_id]['state'] = event
+            if event == SPAWNED:
+                self.jobs[tracking_id]['pid'] = record['pid']
+
+    def snapshot(self):
+        """
+            Writes the open jobs to the snapshot file and truncates the
+            journal. Replaying the journal on top of the snapshot is
+            idempotent, so a crash in between does no harm.
+        """
+        temporary_filename = self.snapshot_filename + '.tmp'
+        with open(temporary_filename, 'w') as snapshot_file:
+            json.dump(self.jobs, snapshot_file)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.rename(temporary_filename, self.snapshot_filename)
+
+        self._file.close()
+        self._file = open(self.filename, 'w')
+        self._records_since_snapshot = 0
+        self._unsynced_records = 0
+        METRICS['journal_snapshots'] += 1
+
+    def close(self):
+        self.sync()
+        self._file.close()
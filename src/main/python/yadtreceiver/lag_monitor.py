@@ -0,0 +1,120 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Measures how late a periodic timer fires on the reactor (the reactor
+    lag) and finds the calls which block the reactor thread.
+
+    The lag is counted in a histogram in the metrics
+    (reactor_lag.le_<seconds>, reactor_lag.le_inf) together with the
+    highest lag (reactor_lag_max). A watchdog thread looks at the reactor
+    thread whenever the timer is late by more than the threshold and logs
+    the stack of the blocking call, once per distinct call site.
+"""
+
+import sys
+import threading
+import traceback
+from time import time
+
+from twisted.internet import reactor
+from twisted.python import log
+
+from yadtreceiver import METRICS
+
+LAG_BUCKETS = [0.01, 0.05, 0.1, 0.5, 1, 5]
+
+
+class ReactorLagMonitor(object):
+
+    def __init__(self, interval, threshold):
+        self.interval = interval
+        self.threshold = threshold
+        self.expected = None
+        self.last_tick = None
+        self.delayed_call = None
+        self.reactor_thread_id = None
+        self.stall_reported = False
+        self.reported_call_sites = set()
+        self.stopped = threading.Event()
+        self.watchdog = None
+
+    def start(self):
+        """
+            Has to be called on the reactor thread.
+        """
+        self.reactor_thread_id = threading.current_thread().ident
+        self.schedule(time())
+        self.watchdog = threading.Thread(target=self.watch, name='reactor-lag-watchdog')
+        self.watchdog.daemon = True
+        self.watchdog.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.delayed_call is not None and self.delayed_call.active():
+            self.delayed_call.cancel()
+
+    def schedule(self, now):
+        self.last_tick = now
+        self.stall_reported = False
+        self.expected = now + self.interval
+        self.delayed_call = reactor.callLater(self.interval, self.tick)
+
+    def tick(self):
+        now = time()
+        self.record(max(now - self.expected, 0))
+        self.schedule(now)
+
+    def record(self, lag):
+        for bucket in LAG_BUCKETS:
+            if lag <= bucket:
+                METRICS['reactor_lag.le_%s' % bucket] += 1
+                break
+        else:
+            METRICS['reactor_lag.le_inf'] += 1
+        if lag > METRICS['reactor_lag_max']:
+            METRICS['reactor_lag_max'] = lag
+
+    def watch(self):
+        while not self.stopped.is_set():
+            self.stopped.wait(self.interval)
+            self.check(time())
+
+    def check(self, now):
+        """
+            Called by the watchdog thread: captures the stack of the reactor
+            thread when the timer is late by more than the threshold.
+        """
+        if self.stall_reported or self.last_tick is None:
+            return
+        if now - self.last_tick <= self.interval + self.threshold:
+            return
+        frame = sys._current_frames().get(self.reactor_thread_id)
+        self.stall_reported = True
+        if frame is not None:
+            self.report_blocking_call(traceback.extract_stack(frame), now - self.last_tick - self.interval)
+
+    def report_blocking_call(self, stack, lag):
+        reactor.callFromThread(self._count_blocking_call)
+        call_site = tuple((filename, line_number) for filename, line_number, _, _ in stack)
+        if call_site in self.reported_call_sites:
+            return
+        self.reported_call_sites.add(call_site)
+        log.msg('Reactor is blocked for more than %.2f seconds in:\n%s' % (lag, ''.join(traceback.format_list(stack))))
+
+    def _count_blocking_call(self):
+        METRICS['reactor_blocked'] += 1
@@ -0,0 +1,190 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Keeps the leases of the targets. The receiver holding the lease of a
+    target runs its requests without voting, the other receivers ignore
+    them; without a valid lease the receivers vote as usual and the winner
+    acquires the lease.
+
+    A lease is announced as "lease" event on the target with the payload
+    {"holder": ..., "term": ..., "duration": ...}. The duration is relative,
+    so the receivers do not need synchronized clocks: the holder counts it
+    from sending, the others from receiving, so the holder always gives up
+    first. A duration of 0 releases the lease.
+
+    Concurrent leases (two receivers winning votes on the same target at
+    the same time) are resolved by the higher term, then the higher holder
+    name. A new lease is only used after SETTLE_SECONDS, so that such a
+    conflict is resolved before any request runs without voting.
+"""
+
+from time import time
+
+from twisted.python import log
+
+from yadtreceiver import METRICS
+
+SETTLE_SECONDS = 2
+RENEWALS_PER_DURATION = 3
+
+
+class Lease(object):
+
+    def __init__(self, holder, term, expires_at, usable_at):
+        self.holder = holder
+        self.term = term
+        self.expires_at = expires_at
+        self.usable_at = usable_at
+
+    def ranks_above(self, holder, term):
+        return (self.term, self.holder) > (term, holder)
+
+
+class LeaseTable(object):
+
+    def __init__(self, holder, duration, settle_seconds=SETTLE_SECONDS):
+        self.holder = holder
+        self.duration = duration
+        self.settle_seconds = settle_seconds
+        self.leases = {}
+        self.terms = {}
+
+    @property
+    def renewal_interval(self):
+        return float(self.duration) / RENEWALS_PER_DURATION
+
+    def _valid_lease(self, target, now):
+        lease = self.leases.get(target)
+        if lease is None or lease.expires_at <= now:
+            return None
+        return lease
+
+    def holds(self, target, now=None):
+        """
+            @return: True when this receiver may run requests for the target
+                     without voting.
+        """
+        if now is None:
+            now = time()
+        lease = self._valid_lease(target, now)
+        return lease is not None and lease.holder == self.holder and lease.usable_at <= now
+
+    def holder_of(self, target, now=None):
+        """
+            @return: the holder of the valid lease of the target, otherwise
+                     None.
+        """
+        lease = self._valid_lease(target, time() if now is None else now)
+        return lease.holder if lease else None
+
+    def _payload(self, lease, duration):
+        return {'holder': lease.holder, 'term': lease.term, 'duration': duration}
+
+    def acquire(self, target, now=None):
+        """
+            @return: the payload of the lease event to announce.
+        """
+        if now is None:
+            now = time()
+        term = self.terms.get(target, 0) + 1
+        self.terms[target] = term
+        lease = Lease(self.holder, term, now + self.duration, now + self.settle_seconds)
+        self.leases[target] = lease
+        METRICS['leases_acquired'] += 1
+        return self._payload(lease, self.duration)
+
+    def renew(self, now=None):
+        """
+            Extends the own leases which are still valid. An own lease which
+            has expired meanwhile (e.g. while the reactor was blocked) is
+            given up, since another receiver may have taken over.
+
+            @return: list of (target, payload) of the lease events to announce.
+        """
+        if now is None:
+            now = time()
+        renewals = []
+        for target, lease in sorted(self.leases.items()):
+            if lease.holder != self.holder:
+                continue
+            if lease.expires_at <= now:
+                del self.leases[target]
+                METRICS['leases_expired'] += 1
+                continue
+            lease.expires_at = now + self.duration
+            renewals.append((target, self._payload(lease, self.duration)))
+        return renewals
+
+    def release(self, target):
+        """
+            @return: the payload of the lease event to announce or None when
+                     this receiver does not hold the lease.
+        """
+        lease = self.leases.get(target)
+        if lease is None or lease.holder != self.holder:
+            return None
+        del self.leases[target]
+        METRICS['leases_released'] += 1
+        return self._payload(lease, 0)
+
+    def release_all(self):
+        """
+            @return: list of (target, payload) of the lease events to announce.
+        """
+        own_targets = sorted(target for target, lease in self.leases.items() if lease.holder == self.holder)
+        return [(target, self.release(target)) for target in own_targets]
+
+    def on_lease(self, target, payload, now=None):
+        """
+            Records a lease announced by another receiver.
+        """
+        if now is None:
+            now = time()
+        try:
+            holder = payload['holder']
+            term = int(payload['term'])
+            duration = float(payload['duration'])
+        except (KeyError, TypeError, ValueError):
+            log.msg('Ignoring invalid lease %r on %s' % (payload, target))
+            return
+        self.terms[target] = max(term, self.terms.get(target, 0))
+        if holder == self.holder:
+            return
+
+        current = self._valid_lease(target, now)
+        if current is not None and current.holder != holder and current.ranks_above(holder, term):
+            if current.holder == self.holder:
+                METRICS['lease_conflicts'] += 1
+            return
+        if current is not None and current.holder == self.holder:
+            log.msg('%s took over the lease of %s' % (holder, target))
+            METRICS['leases_lost'] += 1
+
+        if duration <= 0:
+            if target in self.leases and self.leases[target].holder == holder:
+                del self.leases[target]
+            return
+        self.leases[target] = Lease(holder, term, now + duration, now)
+
+    def state(self, now=None):
+        """
+            @return: dictionary of the targets with a valid lease and their
+                     holder.
+        """
+        if now is None:
+            now = time()
+        return dict((target, lease.holder) for target, lease in self.leases.items() if lease.expires_at > now)
@@ -0,0 +1,231 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Rotates the receiver log by size and/or time and compresses the rotated
+    segments in a background thread.
+
+    On rotation the log file is renamed once to "<log>.<timestamp>" and
+    reopened, which is all that happens on the thread writing the log.
+    Compressing the segment ("<log>.<timestamp>.gz" or ".zst") and removing
+    the oldest segments happens in the "log-compressor" thread, so that a
+    slow disk cannot stall the reactor. The compressor thread hands its
+    metrics to the reactor thread.
+
+    zstd needs the zstandard module, otherwise gzip is used.
+"""
+
+import gzip
+import os
+import re
+import threading
+from Queue import Queue
+from time import localtime, strftime, time
+from timeit import default_timer
+
+from twisted.internet import reactor
+from twisted.python import threadable
+from twisted.python.logfile import LogFile
+
+from yadtreceiver import METRICS
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+NONE = 'none'
+
+EXTENSIONS = {GZIP: '.gz', ZSTD: '.zst', NONE: ''}
+COPY_SIZE = 1024 * 1024
+SEGMENT_SUFFIX = re.compile(r'^\.(\d{8}-\d{6})(-\d+)?(\.gz|\.zst)?$')
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def available_compressions():
+    """
+        @return: the compressions which can be used with the installed modules.
+    """
+    if _zstandard() is None:
+        return [GZIP, NONE]
+    return [GZIP, ZSTD, NONE]
+
+
+def usable_compression(compression):
+    """
+        @return: the given compression when it is available, otherwise gzip.
+    """
+    if compression in available_compressions():
+        return compression
+    return GZIP
+
+
+def compress(filename, compression):
+    """
+        Compresses the file next to it and removes the uncompressed file.
+
+        @return: the name of the compressed file.
+    """
+    if compression == NONE:
+        return filename
+    compressed_filename = filename + EXTENSIONS[compression]
+    with open(filename, 'rb') as source:
+        if compression == ZSTD:
+            with open(compressed_filename, 'wb') as target:
+                _zstandard().ZstdCompressor().copy_stream(source, target, read_size=COPY_SIZE)
+        else:
+            target = gzip.open(compressed_filename, 'wb')
+            try:
+                for chunk in iter(lambda: source.read(COPY_SIZE), b''):
+                    target.write(chunk)
+            finally:
+                target.close()
+    os.remove(filename)
+    return compressed_filename
+
+
+def rotated_segments(path):
+    """
+        @return: the rotated segments of the log, oldest first.
+    """
+    directory, basename = os.path.split(path)
+    segments = []
+    for name in os.listdir(directory or '.'):
+        match = SEGMENT_SUFFIX.match(name[len(basename):]) if name.startswith(basename) else None
+        if match:
+            timestamp, number, _ = match.groups()
+            segments.append((timestamp, int(number[1:]) if number else 0, os.path.join(directory, name)))
+    return [segment for _, _, segment in sorted(segments)]
+
+
+class CompressingLogFile(LogFile):
+
+    """
+        A log file which rotates when it reaches rotateLength bytes (None
+        or 0 turns it off) or is older than rotate_interval seconds (0 turns
+        it off), keeping maxRotatedFiles compressed segments.
+    """
+
+    synchronized = ['rotate']  # write is synchronized by LogFile
+
+    def __init__(self, name, directory, rotateLength=None, defaultMode=None, maxRotatedFiles=None,
+                 rotate_interval=0, compression=GZIP):
+        self.rotate_interval = rotate_interval
+        self.compression = usable_compression(compression)
+        self.segments = Queue()
+        self.pending_segments = set()
+        LogFile.__init__(self, name, directory, rotateLength, defaultMode, maxRotatedFiles)
+        self.compressor = threading.Thread(target=self.compress_segments, name='log-compressor')
+        self.compressor.daemon = True
+        self.compressor.start()
+        for segment in rotated_segments(self.path):
+            if not segment.endswith(('.gz', '.zst')):  # left over from a crash while compressing
+                self.queue_segment(segment)
+
+    def _openFile(self):
+        """
+            A log file which is continued after a restart counts as opened
+            when it was last written, so restarts do not postpone rotating it.
+        """
+        LogFile._openFile(self)
+        self.opened_at = min(os.path.getmtime(self.path), time()) if self.size else time()
+
+    def shouldRotate(self):
+        if self.rotateLength and self.size >= self.rotateLength:
+            return True
+        return bool(self.rotate_interval) and self.size > 0 and time() - self.opened_at >= self.rotate_interval
+
+    def rotate(self):
+        """
+            Renames the log file to a new segment and reopens it. Keeps
+            writing to the current file when that fails.
+        """
+        if not (os.access(self.directory, os.W_OK) and os.access(self.path, os.W_OK)):
+            return
+        start = default_timer()
+        segment = self.segment_name()
+        self._file.close()
+        try:
+            os.rename(self.path, segment)
+        except OSError:
+            METRICS['log_rotation_failures'] += 1
+            self._openFile()
+            return
+        self._openFile()
+        self.queue_segment(segment)
+        METRICS['log_rotations'] += 1
+        METRICS['log_rotation_seconds'] = default_timer() - start
+
+    def segment_name(self):
+        timestamp = strftime('%Y%m%d-%H%M%S', localtime())
+        segment = '%s.%s' % (self.path, timestamp)
+        number = 0
+        while any(os.path.exists(segment + extension) for extension in EXTENSIONS.values()):
+            number += 1
+            segment = '%s.%s-%d' % (self.path, timestamp, number)
+        return segment
+
+    def queue_segment(self, segment):
+        self.pending_segments.add(segment)
+        self.segments.put(segment)
+
+    def compress_segments(self):
+        while True:
+            segment = self.segments.get()
+            if segment is None:
+                return
+            start = default_timer()
+            try:
+                compress(segment, self.compression)
+                self.pending_segments.discard(segment)
+                self.remove_oldest_segments()
+            except (IOError, OSError):
+                reactor.callFromThread(self._count_compression_failure)
+                continue
+            reactor.callFromThread(self._record_compression_seconds, default_timer() - start)
+
+    def _count_compression_failure(self):
+        METRICS['log_compression_failures'] += 1
+
+    def _record_compression_seconds(self, seconds):
+        METRICS['log_compression_seconds'] = seconds
+
+    def remove_oldest_segments(self):
+        """
+            Removes the oldest segments beyond maxRotatedFiles, except the
+            ones still waiting for the compressor.
+        """
+        if self.maxRotatedFiles is None:
+            return
+        segments = rotated_segments(self.path)
+        for segment in segments[:max(len(segments) - self.maxRotatedFiles, 0)]:
+            if segment not in self.pending_segments:
+                os.remove(segment)
+
+    def wait_for_compression(self, timeout=None):
+        """
+            Stops the compressor thread once the queued segments are
+            compressed.
+        """
+        self.segments.put(None)
+        self.compressor.join(timeout)
+
+
+threadable.synchronize(CompressingLogFile)
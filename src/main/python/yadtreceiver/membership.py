@@ -0,0 +1,196 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Keeps the table of the receivers sharing the broadcaster, built from the
+    heartbeats they publish on the MEMBERSHIP_TOPIC.
+
+    A heartbeat carries the receiver's hostname, a digest of its subscribed
+    targets, the number of running commands, its capacity (max_running_commands,
+    None when unlimited) and its heartbeat interval. The target list itself is
+    only sent when it changed and every FULL_TARGETS_EVERY heartbeats, a peer
+    whose digest does not match the last known list has unknown targets until
+    then.
+
+    A peer is suspected after SUSPECT_AFTER_INTERVALS of its intervals without
+    heartbeat and removed after DEAD_AFTER_INTERVALS, or right away when it
+    announces that it is leaving.
+"""
+
+from hashlib import sha1
+from time import time
+
+from twisted.python import log
+
+from yadtreceiver import METRICS
+
+MEMBERSHIP_TOPIC = 'yadtreceiver-membership'
+
+ALIVE = 'alive'
+SUSPECT = 'suspect'
+
+FULL_TARGETS_EVERY = 10
+SUSPECT_AFTER_INTERVALS = 3
+DEAD_AFTER_INTERVALS = 10
+
+
+def targets_digest(targets):
+    return sha1('\n'.join(sorted(targets)).encode('utf-8')).hexdigest()[:16]
+
+
+class Member(object):
+
+    def __init__(self, name, first_seen):
+        self.name = name
+        self.first_seen = first_seen
+        self.last_seen = first_seen
+        self.interval = None
+        self.targets_digest = None
+        self.targets = None
+        self.running_commands = None
+        self.capacity = None
+
+    def status(self, now):
+        if now - self.last_seen > SUSPECT_AFTER_INTERVALS * self.interval:
+            return SUSPECT
+        return ALIVE
+
+    def is_dead(self, now):
+        return now - self.last_seen > DEAD_AFTER_INTERVALS * self.interval
+
+    @property
+    def known_targets(self):
+        """
+            @return: the targets of the member or None when they are unknown.
+        """
+        if self.targets is None or targets_digest(self.targets) != self.targets_digest:
+            return None
+        return self.targets
+
+
+class MembershipTable(object):
+
+    def __init__(self, name, interval, now=None):
+        self.name = name
+        self.interval = interval
+        self.started_at = time() if now is None else now
+        self.members = {}
+        self.heartbeats_sent = 0
+        self.sent_digest = None
+
+    def heartbeat(self, targets, running_commands, capacity, leaving=False):
+        """
+            @return: the payload of the next own heartbeat.
+        """
+        digest = targets_digest(targets)
+        payload = {'receiver': self.name,
+                   'targets_digest': digest,
+                   'running_commands': running_commands,
+                   'capacity': capacity or None,
+                   'interval': self.interval}
+        if digest != self.sent_digest or self.heartbeats_sent % FULL_TARGETS_EVERY == 0:
+            payload['targets'] = sorted(targets)
+            self.sent_digest = digest
+        if leaving:
+            payload['leaving'] = True
+        self.heartbeats_sent += 1
+        return payload
+
+    def on_heartbeat(self, payload, now=None):
+        """
+            Records the heartbeat of a peer.
+        """
+        if now is None:
+            now = time()
+        try:
+            name = payload['receiver']
+            interval = float(payload['interval'])
+            digest = payload['targets_digest']
+        except (KeyError, TypeError, ValueError):
+            log.msg('Ignoring invalid heartbeat %r' % (payload,))
+            return
+        if name == self.name:
+            return
+        if payload.get('leaving'):
+            if self.members.pop(name, None):
+                log.msg('Receiver %s left' % name)
+                METRICS['members_left'] += 1
+            return
+
+        member = self.members.get(name)
+        if member is None:
+            log.msg('Receiver %s joined' % name)
+            METRICS['members_joined'] += 1
+            member = self.members[name] = Member(name, now)
+        member.last_seen = now
+        member.interval = interval
+        member.targets_digest = digest
+        member.running_commands = payload.get('running_commands')
+        member.capacity = payload.get('capacity')
+        if 'targets' in payload:
+            member.targets = set(payload['targets'])
+        METRICS['heartbeats_received'] += 1
+
+    def expire(self, now=None):
+        """
+            Removes the peers which have not sent a heartbeat for
+            DEAD_AFTER_INTERVALS of their intervals.
+        """
+        if now is None:
+            now = time()
+        for name, member in sorted(self.members.items()):
+            if member.is_dead(now):
+                log.msg('Receiver %s did not send a heartbeat for %d seconds, removing it'
+                        % (name, now - member.last_seen))
+                del self.members[name]
+                METRICS['members_dead'] += 1
+
+    def peers_on(self, target, now=None):
+        """
+            @return: the names of the peers subscribed to the target or None
+                     when that is unknown: during the first
+                     DEAD_AFTER_INTERVALS after start (peers may not have sent
+                     a heartbeat yet) or while the targets of a peer are unknown.
+        """
+        if now is None:
+            now = time()
+        if now - self.started_at < DEAD_AFTER_INTERVALS * self.interval:
+            return None
+        peers = []
+        for name, member in sorted(self.members.items()):
+            targets = member.known_targets
+            if targets is None:
+                return None
+            if target in targets:
+                peers.append(name)
+        return peers
+
+    def is_alone_on(self, target, now=None):
+        return self.peers_on(target, now) == []
+
+    def state(self, now=None):
+        """
+            @return: dictionary of the known peers with their status, running
+                     commands and capacity.
+        """
+        if now is None:
+            now = time()
+        return dict((name, {'status': member.status(now),
+                            'last_seen_seconds_ago': round(now - member.last_seen, 1),
+                            'targets': len(member.targets) if member.known_targets is not None else None,
+                            'running_commands': member.running_commands,
+                            'capacity': member.capacity})
+                    for name, member in self.members.items())
@@ -0,0 +1,184 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Provides on-demand profiling of the running receiver on the app status
+    port. It is off unless a profiling token is configured, every request
+    has to send it as "Authorization: Bearer <token>".
+
+        /profile/cprofile?seconds=N -- cProfile of the reactor thread for N
+                                       seconds, returned as pstats text
+        /profile/sample?seconds=N   -- samples the stack of the reactor
+                                       thread, returned as collapsed stacks
+                                       (input for flamegraph.pl)
+        /profile/stacks             -- the current stacks of all threads
+
+    Only one capture runs at a time and captures are limited to
+    max_seconds.
+"""
+
+import cProfile
+import pstats
+import sys
+import threading
+import traceback
+from collections import defaultdict
+from StringIO import StringIO
+
+from twisted.internet import reactor
+from twisted.python import log
+from twisted.web import http, resource, server
+
+from yadtreceiver import METRICS
+
+try:
+    from hmac import compare_digest
+except ImportError:  # python < 2.7.7
+    def compare_digest(a, b):
+        return len(a) == len(b) and sum(ord(x) ^ ord(y) for x, y in zip(a, b)) == 0
+
+DEFAULT_MAX_SECONDS = 30
+DEFAULT_SAMPLE_INTERVAL = 0.01
+DEFAULT_SECONDS = 5
+PSTATS_LINES = 50
+
+
+def format_thread_stacks():
+    thread_names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+    output = []
+    for thread_id, frame in sorted(sys._current_frames().items()):
+        output.append('Thread %s (%s):\n' % (thread_names.get(thread_id, 'unknown'), thread_id))
+        output.extend(traceback.format_stack(frame))
+        output.append('\n')
+    return ''.join(output)
+
+
+def collapse_stack(frame):
+    """
+        @return: the stack of the frame as "outermost;...;innermost"
+    """
+    functions = []
+    while frame is not None:
+        code = frame.f_code
+        functions.append('%s (%s:%d)' % (code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    return ';'.join(reversed(functions))
+
+
+class StackSampler(threading.Thread):
+
+    def __init__(self, thread_id, interval):
+        threading.Thread.__init__(self, name='stack-sampler')
+        self.daemon = True
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = defaultdict(lambda: 0)
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[collapse_stack(frame)] += 1
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return ''.join('%s %d\n' % (stack, count) for stack, count in sorted(self.samples.items()))
+
+
+class ProfilingResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, token, max_seconds=DEFAULT_MAX_SECONDS, sample_interval=DEFAULT_SAMPLE_INTERVAL):
+        self.token = token
+        self.max_seconds = max_seconds
+        self.sample_interval = sample_interval
+        self.capturing = False
+        resource.Resource.__init__(self)
+
+    def render_GET(self, request):
+        if not self.is_authorized(request):
+            request.setResponseCode(http.UNAUTHORIZED)
+            request.setHeader('WWW-Authenticate', 'Bearer')
+            return ''
+
+        request.setHeader('Content-Type', 'text/plain')
+        action = request.postpath[0] if request.postpath else ''
+        if action == 'stacks':
+            return format_thread_stacks()
+        if action not in ('cprofile', 'sample'):
+            request.setResponseCode(http.NOT_FOUND)
+            return 'Use /profile/cprofile, /profile/sample or /profile/stacks\n'
+
+        if self.capturing:
+            request.setResponseCode(http.CONFLICT)
+            return 'Another capture is running\n'
+        try:
+            seconds = float(request.args.get('seconds', [DEFAULT_SECONDS])[0])
+        except ValueError:
+            request.setResponseCode(http.BAD_REQUEST)
+            return 'seconds must be a number\n'
+        seconds = min(max(seconds, 0), self.max_seconds)
+
+        log.msg('Starting %s capture for %s seconds' % (action, seconds))
+        METRICS['profiling_captures'] += 1
+        self.capturing = True
+        if action == 'cprofile':
+            self.capture_cprofile(request, seconds)
+        else:
+            self.capture_samples(request, seconds)
+        return server.NOT_DONE_YET
+
+    def is_authorized(self, request):
+        authorization = request.getHeader('Authorization') or ''
+        scheme, _, token = authorization.partition(' ')
+        return bool(self.token) and scheme == 'Bearer' and compare_digest(token.strip(), self.token)
+
+    def capture_cprofile(self, request, seconds):
+        """
+            Profiles the reactor thread, which is the thread rendering this
+            request.
+        """
+        profile = cProfile.Profile()
+        profile.enable()
+
+        def finish():
+            profile.disable()
+            output = StringIO()
+            pstats.Stats(profile, stream=output).sort_stats('cumulative').print_stats(PSTATS_LINES)
+            self.finish_capture(request, output.getvalue())
+        reactor.callLater(seconds, finish)
+
+    def capture_samples(self, request, seconds):
+        sampler = StackSampler(threading.current_thread().ident, self.sample_interval)
+        sampler.start()
+
+        def finish():
+            sampler.stop()
+            self.finish_capture(request, sampler.collapsed())
+        reactor.callLater(seconds, finish)
+
+    def finish_capture(self, request, output):
+        self.capturing = False
+        if request.finished or getattr(request, '_disconnected', False):
+            return
+        request.write(output)
+        request.finish()
@@ -19,11 +19,15 @@
     how the receiver interacts with spawned processes.
 """
 
-from twisted.internet import protocol
+import os
+import signal
+
+from twisted.internet import protocol, reactor
 from twisted.python import log
 
 from yadtreceiver import events
 from yadtreceiver import METRICS
+from yadtreceiver.run_output import DEFAULT_TAIL_BYTES, read_tail
 
 try:
     import cStringIO
@@ -34,16 +38,27 @@ except:
 
 class ProcessProtocol(protocol.ProcessProtocol):
 
-    def __init__(self, hostname, broadcaster, target, readable_command, tracking_id=None):
+    def __init__(self, hostname, broadcaster, target, readable_command, tracking_id=None, journal=None,
+                 failure_output=None, output_file=None):
         """
             Initializes the process protocol with the given properties.
+            failure_output is the FailureOutputPublisher which limits the
+            error output sent with a failed-event. output_file is the file
+            the output of the process is written to instead of the protocol.
         """
+        self.journal = journal
+        self.failure_output = failure_output
+        self.output_file = output_file
         self.broadcaster = broadcaster
         self.hostname = hostname
         self.readable_command = readable_command
         self.target = target
         self.tracking_id = tracking_id
         self.error_buffer = StringIO.StringIO()
+        self.timed_out = False
+        self.timeout_call = None
+        self.kill_call = None
+        self.exit_callbacks = []
 
         log.msg('(%s) target[%s] executing "%s"' %
                 (self.hostname, target, readable_command))
@@ -54,6 +69,13 @@ class ProcessProtocol(protocol.ProcessProtocol):
             otherwise publishes a failed-event.
         """
         return_code = reason.value.exitCode
+        self.record_exit(return_code)
+        self.cancel_timeout()
+        self.notify_exit()
+
+        if self.timed_out:
+            self.publish_failed(return_code, reason='timeout')
+            return
 
         if return_code != 0:
             self.publish_failed(return_code)
@@ -61,6 +83,75 @@ class ProcessProtocol(protocol.ProcessProtocol):
 
         self.publish_finished()
 
+    def schedule_timeout(self, timeout, grace_period):
+        """
+            Terminates the process group of the process when it is still
+            running after timeout seconds. When it does not exit within the
+            grace period after SIGTERM it is killed with SIGKILL.
+        """
+        self.timeout_call = reactor.callLater(timeout, self.terminate, timeout, grace_period)
+
+    def terminate(self, timeout, grace_period):
+        log.err('(%s) target[%s] request "%s" timed out after %d seconds, sending SIGTERM.'
+                % (self.hostname, self.target, self.readable_command, timeout))
+        METRICS['commands_timed_out.%s' % (self.target)] += 1
+        self.timed_out = True
+        self.timeout_call = None
+        self.signal_process_group(signal.SIGTERM)
+        self.kill_call = reactor.callLater(grace_period, self.kill)
+
+    def kill(self):
+        log.err('(%s) target[%s] request "%s" did not terminate, sending SIGKILL.'
+                % (self.hostname, self.target, self.readable_command))
+        METRICS['commands_killed.%s' % (self.target)] += 1
+        self.kill_call = None
+        self.signal_process_group(signal.SIGKILL)
+
+    def signal_process_group(self, signal_number):
+        """
+            Signals the process group led by the process, so that the commands
+            started by yadtshell are stopped as well. Falls back to signalling
+            only the process when it does not lead its own group.
+        """
+        pid = self.transport.pid
+        if pid is None:  # already exited
+            return
+        try:
+            if os.getpgid(pid) == pid:
+                os.killpg(pid, signal_number)
+                return
+        except OSError:
+            return
+        os.kill(pid, signal_number)
+
+    def cancel_timeout(self):
+        for delayed_call in (self.timeout_call, self.kill_call):
+            if delayed_call is not None and delayed_call.active():
+                delayed_call.cancel()
+        self.timeout_call = None
+        self.kill_call = None
+
+    def add_exit_callback(self, callback):
+        """
+            Registers a function which is called without arguments when the
+            process has exited.
+        """
+        self.exit_callbacks.append(callback)
+
+    def notify_exit(self):
+        for callback in self.exit_callbacks:
+            try:
+                callback()
+            except Exception:
+                log.err(None, 'Exit callback of target[%s] failed' % self.target)
+
+    def record_exit(self, return_code):
+        """
+            Records the exit of the process in the job journal (if any).
+        """
+        if self.journal:
+            self.journal.exited(self.tracking_id, return_code)
+
     def publish_finished(self):
         """
             Uses the broadcaster-client to publish a finished-event.
@@ -74,20 +165,37 @@ class ProcessProtocol(protocol.ProcessProtocol):
             self.target, self.readable_command, events.FINISHED,
             message, tracking_id=self.tracking_id)
 
-    def publish_failed(self, return_code):
+    def publish_failed(self, return_code, reason=None):
         """
             Uses the broadcaster-client to publish a failed-event.
             The given return code will be included into the message of the event.
+            A given reason (e.g. "timeout") is put in front of the error output.
         """
         error_output = self.error_buffer.getvalue()
         self.error_buffer.close()
+        if self.output_file:
+            error_output = self.read_output_file()
         error_message = '(%s) target[%s] request "%s" failed: return code was %s.' \
                         % (self.hostname, self.target, self.readable_command, return_code)
+        if reason:
+            error_message = '(%s) target[%s] request "%s" failed: %s.' \
+                            % (self.hostname, self.target, self.readable_command, reason)
+            error_output = '%s\n%s' % (error_message, error_output)
         log.err(error_message)
         METRICS['commands_failed.%s' % (self.target)] += 1
+        if self.failure_output:
+            error_output = self.failure_output.publish(self.broadcaster, self.target, self.readable_command,
+                                                       error_output, tracking_id=self.tracking_id)
         self.broadcaster.publish_cmd_for_target(
             self.target, self.readable_command, events.FAILED,
             message=error_output, tracking_id=self.tracking_id)
 
+    def read_output_file(self):
+        try:
+            return read_tail(self.output_file, DEFAULT_TAIL_BYTES)
+        except IOError as e:
+            log.err('Could not read output of target[%s] from %s: %s' % (self.target, self.output_file, e))
+            return ''
+
     def errReceived(self, data):
         self.error_buffer.write(str(data))
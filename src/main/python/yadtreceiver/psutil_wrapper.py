@@ -1,4 +1,4 @@
-import psutil
+import os
 
 
 """
@@ -11,15 +11,33 @@ Newer psutil versions expose those contents through methods (you can choose
 blocking/nonblocking, and the result is cached).
 The function get_processes does not block on newer psutil versions and
 always returns items where contents are exposed through methods.
+
+On Linux, get_python_processes_containing reads /proc directly: the command
+line of every process is read once and only the processes running the
+script are looked at further.
+
+psutil is imported on first use, the receiver does not need it to start.
 """
 
+PROC_DIRECTORY = '/proc'
+
+psutil = None
+
+
+def _psutil():
+    global psutil
+    if psutil is None:
+        import psutil as psutil_module
+        psutil = psutil_module
+    return psutil
+
 
 def safe_access(default_value):
     def safe_inner(func):
         def wrapped(*args):
             try:
                 return func(*args)
-            except psutil.AccessDenied:
+            except _psutil().AccessDenied:
                 return default_value
         return wrapped
     return safe_inner
@@ -27,28 +45,33 @@ def safe_access(default_value):
 
 class Process(object):
 
-    def __init__(self, process):
+    def __init__(self, process, info=None):
+        """
+            info is a dictionary of already fetched attributes
+            (name, cwd, cmdline), as returned by process_iter(attrs=...).
+        """
         self.pid = process.pid
         self.process = process
-        self._cmdline = None
-        self._cwd = None
-        self._name = None
+        info = info or {}
+        self._cmdline = info.get('cmdline')
+        self._cwd = info.get('cwd')
+        self._name = info.get('name')
 
     def name(self):
         if not self._name:
             try:
-                return self.process.name()
+                self._name = self.process.name()
             except TypeError:  # in old psutil, name is a field
-                return self.process.name
+                self._name = self.process.name
         return self._name
 
     @safe_access("unknown")
     def cwd(self):
         if not self._cwd:
             try:
-                return self.process.cwd()
+                self._cwd = self.process.cwd()
             except AttributeError:  # old psutil does not have cwd()
-                return self.process.getcwd()
+                self._cwd = self.process.getcwd()
         return self._cwd
 
     def cmdline(self):
@@ -60,5 +83,75 @@ class Process(object):
         return self._cmdline
 
 
-def get_processes():
-    return (Process(p) for p in psutil.process_iter())
+class ProcProcess(Process):
+
+    """
+        A process read from the proc filesystem. The command line is always
+        known, name and cwd are read when needed.
+    """
+
+    def __init__(self, pid, cmdline, proc_directory):
+        self.pid = pid
+        self.process = None
+        self.proc_directory = proc_directory
+        self._cmdline = cmdline
+        self._cwd = None
+        self._name = None
+
+    def name(self):
+        if not self._name:
+            self._name = _read_proc_file(self.proc_directory, self.pid, 'comm').strip()
+        return self._name
+
+    def cwd(self):
+        if not self._cwd:
+            try:
+                self._cwd = os.readlink(os.path.join(self.proc_directory, str(self.pid), 'cwd'))
+            except OSError:
+                return "unknown"
+        return self._cwd
+
+
+def get_processes(attrs=None):
+    """
+        @param attrs: names of the attributes to fetch in one pass, if the
+                      installed psutil supports it.
+    """
+    if attrs:
+        try:
+            return (Process(p, p.info) for p in _psutil().process_iter(attrs=attrs))
+        except TypeError:  # old psutil does not support attrs
+            pass
+    return (Process(p) for p in _psutil().process_iter())
+
+
+def get_python_processes_containing(script_name, proc_directory=None):
+    proc_directory = proc_directory or PROC_DIRECTORY
+    if os.path.isdir(os.path.join(proc_directory, 'self')):
+        candidates = _get_proc_processes_containing(script_name, proc_directory)
+    else:
+        candidates = get_processes(attrs=['name'])
+    return [p for p in candidates if p.name() == "python" and script_name in p.cmdline()]
+
+
+def _get_proc_processes_containing(script_name, proc_directory):
+    for entry in os.listdir(proc_directory):
+        if not entry.isdigit():
+            continue
+        pid = int(entry)
+        raw_cmdline = _read_proc_file(proc_directory, pid, 'cmdline')
+        if script_name not in raw_cmdline:
+            continue
+        yield ProcProcess(pid, raw_cmdline.rstrip('\0').split('\0'), proc_directory)
+
+
+def _read_proc_file(proc_directory, pid, name):
+    try:
+        with open(os.path.join(proc_directory, str(pid), name)) as proc_file:
+            return proc_file.read()
+    except (IOError, OSError):  # process is gone or not accessible
+        return ''
+
+
+def pid_exists(pid):
+    return _psutil().pid_exists(pid)
@@ -0,0 +1,110 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Limits the rate of incoming requests with token buckets, so that a
+    flood of requests is rejected before it creates voting state.
+
+    A limit is given as "<requests>/<seconds>": a bucket holds up to
+    <requests> tokens and refills at <requests> per <seconds>, so bursts of
+    up to <requests> pass. There is one bucket per target for every target
+    glob matching it and one global bucket; a request needs a token from
+    each of them and takes none when one of them is empty.
+"""
+
+from fnmatch import fnmatch
+from time import time
+
+GLOBAL = 'global'
+
+
+def parse_rate_limit(value):
+    """
+        @return: the limit "<requests>/<seconds>" as tuple (requests, seconds)
+                 or None for "0" (no limit).
+        @raise ValueError: when the value is not a valid limit.
+    """
+    value = value.strip()
+    if value == '0':
+        return None
+    requests, _, seconds = value.partition('/')
+    requests, seconds = float(requests), float(seconds)
+    if requests < 1 or seconds <= 0:
+        raise ValueError(value)
+    return requests, seconds
+
+
+def format_rate_limit(limit):
+    return '%g/%g' % limit
+
+
+class TokenBucket(object):
+
+    def __init__(self, limit, now):
+        self.limit = limit
+        self.capacity, seconds = limit
+        self.rate = float(self.capacity) / seconds
+        self.tokens = self.capacity
+        self.updated_at = now
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + max(now - self.updated_at, 0) * self.rate)
+        self.updated_at = now
+
+    def has_token(self, now):
+        self.refill(now)
+        return self.tokens >= 1
+
+    def take(self):
+        self.tokens -= 1
+
+
+class RequestRateLimiter(object):
+
+    def __init__(self):
+        self.buckets = {}
+
+    def _bucket(self, key, limit, now):
+        bucket = self.buckets.get(key)
+        if bucket is None or bucket.limit != limit:  # new or changed by a reload
+            bucket = self.buckets[key] = TokenBucket(limit, now)
+        return bucket
+
+    def take(self, target, global_limit, target_limits, now=None):
+        """
+            Takes a token for a request on the target.
+
+            @return: None when the request may pass, otherwise a description
+                     of the exhausted limit, e.g. "dev*:10/60".
+        """
+        if now is None:
+            now = time()
+        limits = [((target_glob, target), target_glob, limit)
+                  for target_glob, limit in sorted((target_limits or {}).items())
+                  if limit and fnmatch(target, target_glob)]
+        if global_limit:
+            limits.append((GLOBAL, GLOBAL, global_limit))
+
+        buckets = []
+        for key, name, limit in limits:
+            bucket = self._bucket(key, limit, now)
+            if not bucket.has_token(now):
+                return '%s:%s' % (name, format_rate_limit(limit))
+            buckets.append(bucket)
+        for bucket in buckets:
+            bucket.take()
+        return None
@@ -0,0 +1,87 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Records the events delivered to the receiver, so that the real event mix
+    can be replayed later (see yadtreceiver.replay).
+
+    A recording is an append-only file with one compact JSON array per event:
+    [arrival time, target, event data]. The file is rotated like the log
+    file: "events" becomes "events.1", "events.1" becomes "events.2" and so
+    on, the oldest file is deleted.
+"""
+
+import json
+import os
+import re
+from time import time
+
+from twisted.python.logfile import LogFile
+
+from yadtreceiver import METRICS
+
+
+class EventRecorder(object):
+
+    def __init__(self, filename, max_bytes, kept_files):
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.log_file = LogFile.fromFullPath(filename, rotateLength=max_bytes, maxRotatedFiles=kept_files)
+
+    def record(self, target, event_data, arrived_at=None):
+        if arrived_at is None:
+            arrived_at = time()
+        self.log_file.write(json.dumps([round(arrived_at, 6), target, event_data], separators=(',', ':')) + '\n')
+        self.log_file.flush()
+        METRICS['events_recorded'] += 1
+
+    def close(self):
+        self.log_file.close()
+
+
+def recording_files(filename):
+    """
+        @return: the rotated files of the recording followed by the file
+                 itself, oldest first.
+    """
+    directory, basename = os.path.split(os.path.abspath(filename))
+    rotated_number = re.compile(r'^%s\.(\d+)$' % re.escape(basename))
+    rotated_files = []
+    for name in os.listdir(directory):
+        match = rotated_number.match(name)
+        if match:
+            rotated_files.append((int(match.group(1)), os.path.join(directory, name)))
+    rotated_files = [rotated_file for _, rotated_file in sorted(rotated_files, reverse=True)]
+    if os.path.exists(filename):
+        rotated_files.append(filename)
+    return rotated_files
+
+
+def read_recording(filename):
+    """
+        @return: generator of (arrival time, target, event data) of all
+                 recorded events, oldest first. A truncated last line is
+                 skipped.
+    """
+    for recording_file in recording_files(filename):
+        with open(recording_file) as lines:
+            for line in lines:
+                try:
+                    arrived_at, target, event_data = json.loads(line)
+                except ValueError:
+                    continue
+                yield arrived_at, target, event_data
@@ -0,0 +1,276 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Replays an event recording (see yadtreceiver.recorder) into a receiver
+    which is wired to a stub broadcaster and a stub executor, and reports
+    the throughput and the handling time per event type.
+
+    The events are replayed at their recorded pace divided by --speed, or as
+    fast as possible with --speed 0. Commands won by the receiver "run" for
+    --command-seconds without spawning anything; since the receiver starts
+    a command 10 seconds after the request (the voting showdown), use
+    --drain to wait for them after the last event.
+
+    usage: python -m yadtreceiver.replay [options] <recording file>
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import sys
+from collections import defaultdict
+from optparse import OptionParser
+from shutil import rmtree
+from tempfile import mkdtemp
+from timeit import default_timer
+
+from twisted.internet import error, reactor
+from twisted.python import failure
+
+from yadtreceiver import METRICS, Receiver
+from yadtreceiver.configuration import ReceiverConfig
+from yadtreceiver.recorder import read_recording
+
+CONFIGURATION_TEMPLATE = """[receiver]
+hostname = %(hostname)s
+targets = *
+targets_directory = %(targets_directory)s
+log_filename = %(directory)s/yadtreceiver.log
+"""
+
+
+class StubClient(object):
+
+    def subscribe(self, handler, topic):
+        pass
+
+    def unsubscribe(self, topic):
+        pass
+
+    def sendClose(self):
+        pass
+
+
+class StubBroadcaster(object):
+
+    """
+        Counts the events the receiver publishes instead of sending them.
+    """
+
+    def __init__(self):
+        self.client = StubClient()
+        self.published = defaultdict(lambda: 0)
+
+    def addOnSessionOpenHandler(self, handler):
+        pass
+
+    def _sendEvent(self, id, data, tracking_id=None, target=None, **kwargs):
+        self.published[id] += 1
+
+    def publish_cmd_for_target(self, target, cmd, state, message=None, tracking_id=None):
+        self.published['cmd.%s' % state] += 1
+
+    def publish_request_for_target(self, target, cmd, args, tracking_id=None):
+        self.published['request'] += 1
+
+
+class StubProcess(object):
+
+    def __init__(self, pid):
+        self.pid = pid
+
+    def signalProcess(self, signal_id):
+        raise error.ProcessExitedAlready()
+
+
+class StubExecutor(object):
+
+    """
+        Takes the place of reactor.spawnProcess: every command succeeds
+        after command_seconds.
+    """
+
+    def __init__(self, command_seconds):
+        self.command_seconds = command_seconds
+        self.spawned = 0
+
+    def spawnProcess(self, process_protocol, executable, args, env=None, path=None, childFDs=None):
+        self.spawned += 1
+        process = StubProcess(self.spawned)
+        process_protocol.makeConnection(process)
+        reactor.callLater(self.command_seconds, self._exit, process_protocol)
+        return process
+
+    def _exit(self, process_protocol):
+        reason = failure.Failure(error.ProcessDone(0))
+        process_protocol.processExited(reason)
+        process_protocol.processEnded(reason)
+
+
+class Replay(object):
+
+    def __init__(self, recorded_events, speed, command_seconds, directory):
+        self.recorded_events = recorded_events
+        self.speed = speed
+        self.broadcaster = StubBroadcaster()
+        self.executor = StubExecutor(command_seconds)
+        self.receiver = self.create_receiver(directory)
+        self.handling_times = defaultdict(list)
+        self.started_at = None
+        self.finished_at = None
+
+    def create_receiver(self, directory):
+        """
+            @return: a receiver for all recorded targets, whose directories
+                     are created in the given directory. Events delivered
+                     without a topic (WAMP v2) carry their target in the
+                     event data.
+        """
+        targets_directory = os.path.join(directory, 'targets')
+        targets = set(target or (event_data.get('target') if isinstance(event_data, dict) else None)
+                      for _, target, event_data in self.recorded_events)
+        for target in targets - set([None]):
+            target_directory = os.path.join(targets_directory, target)
+            if not os.path.isdir(target_directory):
+                os.makedirs(target_directory)
+        configuration_file = os.path.join(directory, 'receiver.cfg')
+        with open(configuration_file, 'w') as configuration:
+            configuration.write(CONFIGURATION_TEMPLATE % {'hostname': 'replay',
+                                                          'targets_directory': targets_directory,
+                                                          'directory': directory})
+
+        receiver = Receiver()
+        receiver.set_configuration(ReceiverConfig(configuration_file))
+        receiver.broadcaster = self.broadcaster
+        receiver.states = {}
+        receiver.executor = self.executor
+        receiver.start_failure_output()
+        return receiver
+
+    def start(self):
+        """
+            Schedules all events relative to the first one.
+        """
+        self.started_at = default_timer()
+        if not self.recorded_events:
+            self.finished_at = self.started_at
+            return
+        if not self.speed:
+            try:
+                for _, target, event_data in self.recorded_events:
+                    self.deliver(target, event_data)
+            finally:
+                self.finished_at = default_timer()
+            return
+
+        first_arrival = self.recorded_events[0][0]
+        for index, (arrived_at, target, event_data) in enumerate(self.recorded_events):
+            reactor.callLater((arrived_at - first_arrival) / self.speed, self.deliver, target, event_data,
+                              index == len(self.recorded_events) - 1)
+
+    def deliver(self, target, event_data, last=False):
+        event_type = event_data.get('id', 'unknown') if isinstance(event_data, dict) else 'unknown'
+        start = default_timer()
+        try:
+            if target is None:
+                self.receiver.onEvent(event_data)
+            else:
+                self.receiver.onEvent(target, event_data)
+        finally:
+            self.handling_times[event_type].append(default_timer() - start)
+            if last:
+                self.finished_at = default_timer()
+
+    def report(self):
+        """
+            @return: dictionary with the throughput, the handling time per
+                     event type and what the receiver published.
+        """
+        events = sum(len(times) for times in self.handling_times.values())
+        duration = (self.finished_at or default_timer()) - self.started_at
+        return {'events': events,
+                'duration_seconds': duration,
+                'events_per_second': events / duration if duration else None,
+                'event_types': dict((event_type, {'events': len(times),
+                                                  'mean_ms': 1000 * sum(times) / len(times),
+                                                  'max_ms': 1000 * max(times)})
+                                    for event_type, times in self.handling_times.items()),
+                'published': dict(self.broadcaster.published),
+                'commands_spawned': self.executor.spawned}
+
+
+def print_report(report):
+    print('%d events in %.3f s' % (report['events'], report['duration_seconds']))
+    if report['events_per_second']:
+        print('%.1f events/s' % report['events_per_second'])
+    for event_type in sorted(report['event_types']):
+        times = report['event_types'][event_type]
+        print('%-16s %8d events  mean %8.3f ms  max %8.3f ms'
+              % (event_type, times['events'], times['mean_ms'], times['max_ms']))
+    print('published: %s' % ', '.join('%s=%d' % item for item in sorted(report['published'].items())))
+    print('commands spawned: %d' % report['commands_spawned'])
+
+
+def run(recording_file, speed=1.0, command_seconds=0.0, drain_seconds=0.0):
+    """
+        Replays the recording with a running reactor.
+
+        @return: the report of the replay
+    """
+    recorded_events = list(read_recording(recording_file))
+    directory = mkdtemp(prefix='yadtreceiver-replay-')
+    try:
+        replay = Replay(recorded_events, speed, command_seconds, directory)
+
+        def stop_when_finished():
+            if replay.finished_at is None:
+                reactor.callLater(0.1, stop_when_finished)
+            else:
+                reactor.callLater(drain_seconds, reactor.stop)
+
+        reactor.callWhenRunning(replay.start)
+        reactor.callWhenRunning(stop_when_finished)
+        reactor.run()
+        return replay.report()
+    finally:
+        rmtree(directory)
+
+
+def main(arguments):
+    option_parser = OptionParser(usage='%prog [options] <recording file>')
+    option_parser.add_option('--speed', dest='speed', type='float', default=1.0,
+                             help='replay N times faster than recorded, 0 replays as fast as possible')
+    option_parser.add_option('--command-seconds', dest='command_seconds', type='float', default=0.0)
+    option_parser.add_option('--drain', dest='drain_seconds', type='float', default=0.0,
+                             help='seconds to wait after the last event')
+    option_parser.add_option('--json', dest='json_file', help='also write the report to this file')
+    options, recording_files = option_parser.parse_args(arguments)
+    if len(recording_files) != 1:
+        option_parser.error('expected one recording file')
+
+    report = run(recording_files[0], options.speed, options.command_seconds, options.drain_seconds)
+    report['metrics'] = dict(METRICS)
+    print_report(report)
+    if options.json_file:
+        with open(options.json_file, 'w') as json_file:
+            json.dump(report, json_file, indent=4, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
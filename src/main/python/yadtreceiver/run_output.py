@@ -0,0 +1,134 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Keeps the output of every run in a file of its own. The stdout and
+    stderr of the spawned command are connected to the file (childFDs), so
+    the output never passes through the receiver. The tail of a run's output
+    is served by tracking id (/run-output/<tracking-id>?bytes=N on the app
+    status port).
+
+    Old outputs are pruned every PRUNE_INTERVAL seconds in a worker thread,
+    since listing a directory of many outputs would block the reactor.
+"""
+
+import os
+from time import time
+
+from twisted.python import log
+
+from yadtreceiver import METRICS
+from yadtreceiver.failure_output import VALID_TRACKING_ID
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+DEFAULT_TAIL_BYTES = 65536
+MAX_TAIL_BYTES = 1024 * 1024
+PRUNE_INTERVAL = 60
+
+
+def read_tail(filename, max_bytes):
+    """
+        @return: the last max_bytes of the file, seeking instead of reading
+                 the whole file.
+    """
+    with open(filename, 'rb') as output_file:
+        output_file.seek(0, os.SEEK_END)
+        size = output_file.tell()
+        output_file.seek(max(size - max_bytes, 0))
+        return output_file.read(max_bytes)
+
+
+class RunOutputStore(object):
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def filename(self, tracking_id):
+        """
+            @return: the output file of the run or None for invalid tracking
+                     ids, which must not escape the directory.
+        """
+        if not tracking_id or not VALID_TRACKING_ID.match(tracking_id) or tracking_id.startswith('.'):
+            return None
+        return os.path.join(self.directory, '%s.log' % tracking_id)
+
+    def open(self, tracking_id):
+        """
+            @return: a file descriptor for the output of the run (to be
+                     closed by the caller once the process is spawned) or
+                     None when the output cannot be kept.
+        """
+        filename = self.filename(tracking_id)
+        if not filename:
+            return None
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            output_fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        except OSError as e:
+            log.err(None, 'Could not open output file of %s: %s' % (tracking_id, e))
+            return None
+        METRICS['run_outputs'] += 1
+        return output_fd
+
+    def tail(self, tracking_id, max_bytes=DEFAULT_TAIL_BYTES):
+        """
+            @return: the end of the run's output or None when it is unknown.
+        """
+        filename = self.filename(tracking_id)
+        if not filename or not os.path.exists(filename):
+            return None
+        return read_tail(filename, max_bytes)
+
+    def prune(self, now=None):
+        """
+            Removes outputs older than max_age and the oldest outputs until
+            all outputs together fit into max_bytes. Does not touch METRICS,
+            so it can run in a worker thread.
+
+            @return: the number of removed outputs.
+        """
+        if now is None:
+            now = time()
+        if not os.path.isdir(self.directory):
+            return 0
+        outputs = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.log'):
+                continue
+            filename = os.path.join(self.directory, name)
+            try:
+                status = os.stat(filename)
+            except OSError:
+                continue
+            outputs.append((status.st_mtime, status.st_size, filename))
+        outputs.sort()
+
+        total_bytes = sum(size for _, size, _ in outputs)
+        pruned = 0
+        for modified, size, filename in outputs:
+            if now - modified <= self.max_age and total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            total_bytes -= size
+            pruned += 1
+        return pruned
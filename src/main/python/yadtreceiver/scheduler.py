@@ -0,0 +1,112 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Provides the RequestScheduler which limits the number of commands
+    running at the same time and hands free slots to the queued requests.
+
+    Each priority class has its own queue and a weight. Free slots are given
+    to the classes with a smooth weighted round robin: a class with weight 9
+    gets nine slots for every slot of a class with weight 1 while both have
+    waiting requests, so higher classes are preferred but lower classes
+    never starve.
+"""
+
+from collections import deque
+from time import time
+
+from twisted.python import log
+
+from yadtreceiver import METRICS
+
+
+class RequestScheduler(object):
+
+    def __init__(self, max_running, weights, default_priority_class=None):
+        self.max_running = max_running
+        self.weights = weights
+        self.default_priority_class = default_priority_class
+        self.running = 0
+        self.queues = dict((priority_class, deque()) for priority_class in weights)
+        self.credits = dict.fromkeys(weights, 0)
+        self.starting = False
+
+    def submit(self, priority_class, start):
+        """
+            Queues a request of the given priority class. start is called once
+            a slot is free (possibly right away) and must lead to a call of
+            release when the request has finished.
+        """
+        self.queues[priority_class].append((time(), start))
+        if self.running >= self.max_running:
+            log.msg('All %d slots are busy, queueing %s request' % (self.max_running, priority_class))
+        self.start_queued()
+
+    def release(self):
+        """
+            Frees the slot of a finished request and hands it to the next
+            queued request.
+        """
+        self.running -= 1
+        self.start_queued()
+
+    def start_queued(self):
+        if self.starting:  # release was called from within start
+            return
+        self.starting = True
+        try:
+            while self.running < self.max_running:
+                priority_class = self.next_priority_class()
+                if priority_class is None:
+                    return
+                queued_at, start = self.queues[priority_class].popleft()
+                METRICS['queue_wait_seconds.%s' % priority_class] += time() - queued_at
+                METRICS['queue_waits.%s' % priority_class] += 1
+                self.running += 1
+                start()
+        finally:
+            self.starting = False
+
+    def next_priority_class(self):
+        """
+            @return: the priority class which gets the next free slot, or None
+                     when no request is queued.
+        """
+        candidates = [priority_class for priority_class in self.queues if self.queues[priority_class]]
+        for priority_class in self.queues:
+            if priority_class not in candidates:
+                self.credits[priority_class] = 0
+        if not candidates:
+            return None
+
+        for priority_class in candidates:
+            self.credits[priority_class] += self.weights[priority_class]
+        chosen = max(candidates,
+                     key=lambda priority_class: (self.credits[priority_class], self.weights[priority_class]))
+        self.credits[chosen] -= sum(self.weights[priority_class] for priority_class in candidates)
+        return chosen
+
+    def queued(self):
+        """
+            @return: the number of requests waiting for a slot.
+        """
+        return sum(len(queue) for queue in self.queues.values())
+
+    def state(self):
+        return {'running': self.running,
+                'max_running': self.max_running,
+                'queued': dict((priority_class, len(queue)) for priority_class, queue in self.queues.items())}
@@ -0,0 +1,114 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Provides the serialization of the events the receiver exchanges with the
+    broadcaster (votes, cmd and request events) on the wire.
+
+    The serializers are negotiated per broadcaster session: the WAMP
+    websocket transport offers the configured serializers in order of
+    preference and the broadcaster picks the first one it supports. JSON is
+    always offered last, so a broadcaster which only speaks JSON keeps
+    working. The compact msgpack serializer is only available when the
+    msgpack package is installed.
+"""
+
+from autobahn.twisted import wamp, websocket
+from autobahn.wamp import serializer, types
+from twisted.internet import reactor
+from twisted.internet.endpoints import clientFromString
+from twisted.python import log
+
+from yadtbroadcastclient import WampBroadcaster
+
+from yadtreceiver import METRICS
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+
+# not every serializer is available, e.g. MsgPackSerializer needs msgpack
+SERIALIZER_CLASS_NAMES = {JSON: 'JsonSerializer',
+                          MSGPACK: 'MsgPackSerializer'}
+
+
+def available_serializers():
+    return sorted(name for name, class_name in SERIALIZER_CLASS_NAMES.items()
+                  if hasattr(serializer, class_name))
+
+
+def create_wamp_serializers(names):
+    """
+        @return: the WAMP serializers for the given names in the given
+                 order, skipping unavailable ones and ending with JSON.
+    """
+    serializers = []
+    for name in list(names) + [JSON]:
+        serializer_class = getattr(serializer, SERIALIZER_CLASS_NAMES.get(name, ''), None)
+        if serializer_class is None:
+            log.msg('Event serializer %s is not available, available are %s'
+                    % (name, ', '.join(available_serializers())))
+            continue
+        if serializer_class not in [type(known) for known in serializers]:
+            serializers.append(serializer_class())
+    return serializers
+
+
+class NegotiatingWampBroadcaster(WampBroadcaster):
+
+    """
+        A WampBroadcaster which offers several serializers when connecting.
+    """
+
+    def __init__(self, host, port, target=None, serializer_names=None):
+        self.serializer_names = serializer_names or [JSON]
+        self.negotiated_serializer = None
+        WampBroadcaster.__init__(self, host, port, target)
+
+    def _connect(self):
+        if self.client:
+            self.logger.debug('already connected to broadcaster %s' % self.url)
+            return
+        broadcaster = self
+
+        class BroadcasterComponent(wamp.ApplicationSession):
+
+            def onJoin(self, details):
+                broadcaster.client = self
+                broadcaster.onSerializerNegotiated(self._transport._serializer.SERIALIZER_ID)
+                broadcaster.onSessionOpen()
+
+            def onDisconnect(self):
+                broadcaster.logger.debug("Disconnected from broadcaster at %s, will reconnect" % broadcaster.host)
+                broadcaster.client = None
+
+        session_factory = wamp.ApplicationSessionFactory(config=types.ComponentConfig(realm="yadt"))
+        session_factory.session = BroadcasterComponent
+        transport_factory = websocket.WampWebSocketClientFactory(session_factory,
+                                                                 serializers=create_wamp_serializers(
+                                                                     self.serializer_names),
+                                                                 url="ws://{0}:{1}/wamp".format(self.host, self.port),
+                                                                 debug=False,
+                                                                 debug_wamp=False)
+        client = clientFromString(reactor, "tcp:{0}:{1}".format(self.host, self.port))
+        client.connect(transport_factory).addErrback(
+            lambda failure: self.logger.warning("Could not connect to broadcaster at %s: %s" % (self.url, failure)))
+
+    def onSerializerNegotiated(self, serializer_id):
+        if serializer_id != self.negotiated_serializer:
+            log.msg('Using %s serialization for broadcaster session' % serializer_id)
+        self.negotiated_serializer = serializer_id
+        METRICS['broadcaster_sessions.%s' % serializer_id] += 1
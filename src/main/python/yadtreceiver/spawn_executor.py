@@ -0,0 +1,246 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Spawns the commands through the spawn helper (see spawn_helper.py), a
+    small process started while the receiver is still small, so that the
+    receiver does not fork its whole address space for every command.
+
+    SpawnHelperExecutor takes the place of the reactor for spawning: the
+    pid, the output and the exit status the helper relays are passed to the
+    process protocol of the command. When the helper is not running, or the
+    output file of a command cannot be passed to it, the command is spawned
+    by the reactor as before.
+"""
+
+import base64
+import json
+import os
+import signal
+import sys
+
+from twisted.internet import defer, error, protocol, reactor
+from twisted.python import failure, log
+
+from yadtreceiver import METRICS
+
+HELPER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spawn_helper.py')
+
+
+def output_path(fd):
+    """
+        @return: the path of the file open as fd, so that the helper can open
+                 it, or None when it cannot be determined.
+    """
+    try:
+        path = os.readlink('/proc/self/fd/%d' % fd)
+    except OSError:
+        return None
+    return path if os.path.isabs(path) and os.path.exists(path) else None
+
+
+def kill_command(pid):
+    """
+        Kills the process group of a command started with setsid (its
+        process group id is its pid), otherwise the command alone.
+    """
+    try:
+        os.killpg(pid, signal.SIGKILL)
+        return
+    except OSError:
+        pass
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except OSError as e:
+        log.msg('Could not kill command %s: %s' % (pid, e))
+
+
+def exit_reason(status):
+    """
+        @return: ProcessDone or ProcessTerminated for the wait status, as
+                 the reactor passes it to the process protocol.
+    """
+    if os.WIFSIGNALED(status):
+        return failure.Failure(error.ProcessTerminated(signal=os.WTERMSIG(status), status=status))
+    exit_code = os.WEXITSTATUS(status)
+    if exit_code == 0:
+        return failure.Failure(error.ProcessDone(status))
+    return failure.Failure(error.ProcessTerminated(exitCode=exit_code, status=status))
+
+
+class HelperProcess(object):
+
+    """
+        The process transport of a command spawned by the helper. The
+        receiver signals the command itself, the helper is only needed to
+        fork and wait.
+    """
+
+    def __init__(self, process_protocol, pid):
+        self.process_protocol = process_protocol
+        self.pid = pid
+        self.reason = None
+
+    def signalProcess(self, signal_id):
+        """
+            Sends a signal given as number or name ('TERM', 'KILL', 'INT').
+        """
+        if self.pid is None:
+            raise error.ProcessExitedAlready()
+        if not isinstance(signal_id, int):
+            signal_id = getattr(signal, 'SIG%s' % signal_id)
+        os.kill(self.pid, signal_id)
+
+    def closeStdin(self):
+        pass
+
+    def loseConnection(self):
+        pass
+
+
+class SpawnHelperProtocol(protocol.ProcessProtocol):
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.buffer = ''
+
+    def outReceived(self, data):
+        self.buffer += data
+        while '\n' in self.buffer:
+            line, self.buffer = self.buffer.split('\n', 1)
+            try:
+                reply = json.loads(line)
+            except ValueError:
+                log.msg('Ignoring invalid reply of the spawn helper %r' % line)
+                continue
+            self.executor.on_reply(reply)
+
+    def errReceived(self, data):
+        log.msg('spawn helper: %s' % data.strip())
+
+    def processEnded(self, reason):
+        self.executor.helper_ended(reason)
+
+
+class SpawnHelperExecutor(object):
+
+    def __init__(self):
+        self.helper = None
+        self.next_id = 0
+        self.pending = {}
+        self.processes = {}
+        self.stopping = False
+
+    def start(self):
+        self.helper = reactor.spawnProcess(SpawnHelperProtocol(self), sys.executable,
+                                           [sys.executable, '-S', HELPER_SCRIPT], env=os.environ)
+        log.msg('Started spawn helper (pid %s)' % self.helper.pid)
+        METRICS['spawn_helper_starts'] += 1
+
+    def stop(self):
+        """
+            Lets the helper exit, the commands it spawned keep running and
+            are re-adopted from the job journal after a restart.
+        """
+        self.stopping = True
+        if self.helper is not None:
+            self.helper.closeStdin()
+
+    def spawnProcess(self, process_protocol, executable, args, env=None, path=None, childFDs=None):
+        """
+            Spawns the command through the helper.
+
+            @return: a deferred which fires with the process transport once
+                     the helper reports the pid, or the transport of the
+                     reactor when the helper cannot spawn the command.
+        """
+        output = None
+        if childFDs:
+            output = output_path(childFDs[1])
+        if self.helper is None or (childFDs and output is None):
+            METRICS['spawn_helper_fallbacks'] += 1
+            return reactor.spawnProcess(process_protocol, executable, args, env=env, path=path, childFDs=childFDs)
+
+        self.next_id += 1
+        spawned = defer.Deferred()
+        self.pending[self.next_id] = (process_protocol, spawned)
+        request = {'id': self.next_id,
+                   'executable': executable,
+                   'args': list(args),
+                   'env': env or {},
+                   'path': path,
+                   'output': output}
+        self.helper.write(json.dumps(request) + '\n')
+        return spawned
+
+    def on_reply(self, reply):
+        op = reply.get('op')
+        if op in ('spawned', 'spawn_failed'):
+            process_protocol, spawned = self.pending.pop(reply.get('id'), (None, None))
+            if spawned is None:
+                log.msg('Ignoring reply of the spawn helper for unknown request %r' % reply)
+            elif op == 'spawned':
+                process = self.processes[reply['pid']] = HelperProcess(process_protocol, reply['pid'])
+                process_protocol.makeConnection(process)
+                METRICS['spawn_helper_spawns'] += 1
+                spawned.callback(process)
+            else:
+                spawned.errback(failure.Failure(OSError(reply.get('error'))))
+            return
+
+        process = self.processes.get(reply.get('pid'))
+        if process is None:
+            log.msg('Ignoring reply of the spawn helper for unknown process %r' % reply)
+        elif op == 'output':
+            data = base64.b64decode(reply['data'])
+            if reply.get('fd') == 2:
+                process.process_protocol.errReceived(data)
+            else:
+                process.process_protocol.outReceived(data)
+        elif op == 'exited':
+            process.pid = None
+            process.reason = exit_reason(reply['status'])
+            process.process_protocol.processExited(process.reason)
+        elif op == 'ended':
+            del self.processes[reply['pid']]
+            process.process_protocol.processEnded(process.reason)
+
+    def helper_ended(self, reason):
+        """
+            Fails the commands the helper has not reported as ended, their
+            exit cannot be observed anymore. Commands which are still running
+            are killed, so that they do not keep changing the target after
+            their failure was published. Further commands are spawned by the
+            reactor.
+        """
+        self.helper = None
+        if self.stopping:
+            log.msg('Spawn helper stopped')
+            return
+        log.err(reason, 'The spawn helper exited, spawning the commands with the reactor')
+        METRICS['spawn_helper_exits'] += 1
+        pending, self.pending = self.pending, {}
+        for request_id, (process_protocol, spawned) in sorted(pending.items()):
+            spawned.errback(failure.Failure(OSError('the spawn helper exited')))
+        processes, self.processes = self.processes, {}
+        for pid, process in sorted(processes.items()):
+            lost = failure.Failure(error.ProcessTerminated(exitCode=None))
+            if process.reason is None:
+                kill_command(pid)
+                METRICS['spawn_helper_commands_killed'] += 1
+                process.pid = None
+                process.process_protocol.processExited(lost)
+            process.process_protocol.processEnded(process.reason or lost)
@@ -0,0 +1,192 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    The spawn helper: a small process which the receiver starts early and
+    which spawns the commands, so that the large receiver process does not
+    have to fork for every command. It is run as a script
+    ("python -S spawn_helper.py") and only imports the standard library,
+    do not import twisted or yadtreceiver here.
+
+    The receiver sends one JSON request per line on stdin:
+
+        {"id": 1, "executable": ..., "args": [...], "env": {...}, "path": ...,
+         "output": null or the file stdout and stderr are appended to}
+
+    and the helper replies with one JSON message per line on stdout:
+
+        {"op": "spawned", "id": 1, "pid": 4711}
+        {"op": "spawn_failed", "id": 1, "error": "..."}
+        {"op": "output", "pid": 4711, "fd": 1, "data": "<base64>"}
+        {"op": "exited", "pid": 4711, "status": <wait status>}
+        {"op": "ended", "pid": 4711}
+
+    "ended" follows "exited" once stdout and stderr of the command are
+    closed. The helper exits when its stdin is closed, the commands it
+    spawned keep running.
+"""
+
+import base64
+import errno
+import json
+import os
+import select
+import subprocess
+import sys
+
+READ_SIZE = 65536
+REAP_INTERVAL = 0.1
+DRAIN_READS = 16
+
+
+class Child(object):
+
+    def __init__(self, process):
+        # keep the Popen, otherwise subprocess reaps the command when it is collected
+        self.process = process
+        self.pid = process.pid
+        self.streams = {}
+        self.status = None
+
+
+class SpawnHelper(object):
+
+    def __init__(self, requests_fd, replies_fd):
+        self.requests_fd = requests_fd
+        self.replies_fd = replies_fd
+        self.buffer = b''
+        self.children = {}
+        self.pipes = {}
+        self.devnull = os.open(os.devnull, os.O_RDONLY)
+
+    def reply(self, **message):
+        data = (json.dumps(message) + '\n').encode('utf-8')
+        while data:
+            data = data[os.write(self.replies_fd, data):]
+
+    def spawn(self, request):
+        output_fd = None
+        try:
+            if request.get('output'):
+                output_fd = os.open(request['output'], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            output = subprocess.PIPE if output_fd is None else output_fd
+            env = dict((str(key), str(value)) for key, value in (request.get('env') or {}).items())
+            process = subprocess.Popen([str(arg) for arg in request['args']], executable=str(request['executable']),
+                                       env=env,
+                                       cwd=request.get('path'), stdin=self.devnull, stdout=output, stderr=output,
+                                       close_fds=True)
+        except (EnvironmentError, ValueError, KeyError, TypeError) as e:
+            self.reply(op='spawn_failed', id=request.get('id'), error=str(e))
+            return
+        finally:
+            if output_fd is not None:
+                os.close(output_fd)
+
+        child = self.children[process.pid] = Child(process)
+        if output_fd is None:
+            for number, stream in ((1, process.stdout), (2, process.stderr)):
+                child.streams[number] = stream
+                self.pipes[stream.fileno()] = (child, number)
+        self.reply(op='spawned', id=request.get('id'), pid=process.pid)
+
+    def read_requests(self):
+        """
+            @return: False when the receiver closed stdin.
+        """
+        data = os.read(self.requests_fd, READ_SIZE)
+        if not data:
+            return False
+        self.buffer += data
+        while b'\n' in self.buffer:
+            line, self.buffer = self.buffer.split(b'\n', 1)
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError:
+                sys.stderr.write('Ignoring invalid request %r\n' % line)
+                continue
+            self.spawn(request)
+        return True
+
+    def read_output(self, fd):
+        child, number = self.pipes[fd]
+        data = os.read(fd, READ_SIZE)
+        if data:
+            self.reply(op='output', pid=child.pid, fd=number, data=base64.b64encode(data).decode('ascii'))
+            return
+        del self.pipes[fd]
+        child.streams.pop(number).close()
+        self.report(child)
+
+    def drain_output(self, child):
+        """
+            Reads the output which is already waiting, so that it is relayed
+            before the exit of the command. Bounded, since processes started
+            in the background by the command may keep writing to the pipes.
+        """
+        for _ in range(DRAIN_READS):
+            if not child.streams:
+                return
+            fds = [stream.fileno() for stream in child.streams.values()]
+            readable = select.select(fds, [], [], 0)[0]
+            if not readable:
+                return
+            for fd in readable:
+                self.read_output(fd)
+
+    def reap(self):
+        for child in list(self.children.values()):
+            if child.status is not None:
+                continue
+            try:
+                pid, status = os.waitpid(child.pid, os.WNOHANG)
+            except OSError as e:
+                if e.errno != errno.ECHILD:
+                    raise
+                pid, status = child.pid, 255 << 8
+            if pid == 0:
+                continue
+            self.drain_output(child)
+            child.status = status
+            child.process.returncode = status
+            self.reply(op='exited', pid=child.pid, status=status)
+            self.report(child)
+
+    def report(self, child):
+        if child.status is not None and not child.streams:
+            del self.children[child.pid]
+            self.reply(op='ended', pid=child.pid)
+
+    def run(self):
+        while True:
+            try:
+                readable = select.select([self.requests_fd] + list(self.pipes), [], [], REAP_INTERVAL)[0]
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd in readable:
+                if fd == self.requests_fd:
+                    if not self.read_requests():
+                        return
+                elif fd in self.pipes:
+                    self.read_output(fd)
+            self.reap()
+
+
+if __name__ == '__main__':
+    SpawnHelper(sys.stdin.fileno(), sys.stdout.fileno()).run()
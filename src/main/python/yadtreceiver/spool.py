@@ -0,0 +1,238 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Provides a durable spool for outbound status events. Events are appended
+    to a local file before they are published, so that STARTED, FINISHED and
+    FAILED events survive a lost broadcaster connection (or a restart of the
+    receiver) and are replayed in order once the connection is back.
+
+    The spool file contains one JSON record per line. A record is either an
+    event ({"seq": 1, "target": ..., "cmd": ..., ...}) or the acknowledgement
+    of a delivered event ({"ack": 1}).
+"""
+
+import json
+import os
+from collections import deque
+
+from twisted.python import log
+
+from yadtreceiver import METRICS
+
+RECORD_ACK = 'ack'
+RECORD_SEQUENCE = 'seq'
+
+DEFAULT_FSYNC_BATCH_SIZE = 16
+DEFAULT_REMEMBERED_KEYS = 1000
+
+
+class EventSpool(object):
+
+    """
+        An append-only file of outbound events which have not been delivered
+        to the broadcaster yet.
+    """
+
+    def __init__(self, filename, max_bytes, fsync_batch_size=DEFAULT_FSYNC_BATCH_SIZE):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.fsync_batch_size = fsync_batch_size
+        self.pending = []
+        self.next_sequence = 1
+        self._unsynced_records = 0
+        self._delivered_keys = deque(maxlen=DEFAULT_REMEMBERED_KEYS)
+        self._file = None
+
+    def open(self):
+        """
+            Loads the undelivered events from the spool file and opens it
+            for appending.
+        """
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        if os.path.exists(self.filename):
+            self._load()
+
+        self._file = open(self.filename, 'a')
+        if self.pending:
+            log.msg('Spool %s contains %d undelivered events' % (self.filename, len(self.pending)))
+
+    def _load(self):
+        events_by_sequence = {}
+        with open(self.filename) as spool_file:
+            for line in spool_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    log.msg('Ignoring truncated spool record %r' % line)
+                    continue
+                if RECORD_ACK in record:
+                    events_by_sequence.pop(record[RECORD_ACK], None)
+                else:
+                    events_by_sequence[record[RECORD_SEQUENCE]] = record
+                    self.next_sequence = max(self.next_sequence, record[RECORD_SEQUENCE] + 1)
+        self.pending = [events_by_sequence[sequence] for sequence in sorted(events_by_sequence)]
+
+    def is_duplicate(self, tracking_id, state):
+        """
+            @return: True if an event with the same tracking id and state is
+                     already pending or has been delivered recently.
+        """
+        if tracking_id is None:
+            return False
+        key = (tracking_id, state)
+        if key in self._delivered_keys:
+            return True
+        for record in self.pending:
+            if _key_of(record) == key:
+                return True
+        return False
+
+    def append(self, target, cmd, state, message=None, tracking_id=None):
+        """
+            Appends an event to the spool.
+
+            @return: the spooled record
+        """
+        record = {RECORD_SEQUENCE: self.next_sequence,
+                  'target': target,
+                  'cmd': cmd,
+                  'state': state,
+                  'message': message,
+                  'tracking_id': tracking_id}
+        self.next_sequence += 1
+        self.pending.append(record)
+        self._write(record)
+        return record
+
+    def mark_delivered(self, record):
+        """
+            Removes the given record from the pending events and writes an
+            acknowledgement to the spool file. A record which compact has
+            already dropped from the spool is only remembered as delivered.
+        """
+        self._delivered_keys.append(_key_of(record))
+        if record not in self.pending:
+            return
+        self.pending.remove(record)
+        self._write({RECORD_ACK: record[RECORD_SEQUENCE]})
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        self._unsynced_records += 1
+        if self._unsynced_records >= self.fsync_batch_size:
+            self.sync()
+        if self._file.tell() > self.max_bytes:
+            self.compact()
+
+    def sync(self):
+        """
+            Forces all written records to disk.
+        """
+        if self._unsynced_records:
+            os.fsync(self._file.fileno())
+            self._unsynced_records = 0
+
+    def compact(self):
+        """
+            Rewrites the spool file so that it only contains the pending
+            events. When the pending events alone exceed the size cap the
+            oldest ones are dropped.
+        """
+        lines = [json.dumps(record) + '\n' for record in self.pending]
+        size = sum(len(line) for line in lines)
+        while lines and size > self.max_bytes:
+            size -= len(lines.pop(0))
+            dropped = self.pending.pop(0)
+            METRICS['spool_dropped'] += 1
+            log.err('Spool is full, dropping event %r' % dropped)
+
+        temporary_filename = self.filename + '.tmp'
+        with open(temporary_filename, 'w') as temporary_file:
+            temporary_file.writelines(lines)
+            temporary_file.flush()
+            os.fsync(temporary_file.fileno())
+        self._file.close()
+        os.rename(temporary_filename, self.filename)
+        self._file = open(self.filename, 'a')
+        self._unsynced_records = 0
+        METRICS['spool_compactions'] += 1
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+
+class SpoolingBroadcaster(object):
+
+    """
+        Wraps a broadcaster so that command events are spooled before they
+        are published. Everything else is delegated to the wrapped
+        broadcaster.
+    """
+
+    def __init__(self, broadcaster, spool):
+        self.__dict__['_broadcaster'] = broadcaster
+        self.__dict__['spool'] = spool
+
+    def __getattr__(self, name):
+        return getattr(self._broadcaster, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._broadcaster, name, value)
+
+    def publish_cmd_for_target(self, target, cmd, state, message=None, tracking_id=None):
+        if self.spool.is_duplicate(tracking_id, state):
+            log.msg('Suppressing duplicate %s event for tracking-id %r' % (state, tracking_id))
+            METRICS['spool_duplicates'] += 1
+            return
+
+        older_events_pending = bool(self.spool.pending)
+        record = self.spool.append(target, cmd, state, message, tracking_id)
+        if not self._broadcaster.client:
+            return
+        if older_events_pending:  # publish after them, so the events arrive in order
+            self.replay()
+        else:
+            self._publish(record)
+
+    def replay(self):
+        """
+            Publishes all pending events in the order they were spooled.
+            Does nothing while not connected.
+        """
+        if not self._broadcaster.client or not self.spool.pending:
+            return
+        log.msg('Replaying %d spooled events' % len(self.spool.pending))
+        for record in list(self.spool.pending):
+            self._publish(record)
+            METRICS['spool_replayed'] += 1
+
+    def _publish(self, record):
+        self._broadcaster.publish_cmd_for_target(record['target'],
+                                                 record['cmd'],
+                                                 record['state'],
+                                                 record['message'],
+                                                 tracking_id=record['tracking_id'])
+        self.spool.mark_delivered(record)
+
+
+def _key_of(record):
+    return (record['tracking_id'], record['state'])
@@ -0,0 +1,90 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Times the start-up of the receiver in phases:
+
+        imports    -- from the start of the process until the application
+                      modules are imported
+        config     -- loading the configuration
+        connect    -- until the session with the broadcaster is open
+        subscribe  -- until all target subscriptions are acknowledged
+
+    The durations are logged, put into the metrics (startup_<phase>_seconds,
+    startup_ready_seconds) and shown on the app status page.
+"""
+
+import os
+from time import time
+
+from twisted.python import log
+
+from yadtreceiver import METRICS
+
+PROC_DIRECTORY = '/proc'
+
+
+def process_start_time(proc_directory=PROC_DIRECTORY):
+    """
+        @return: the start time of the current process (seconds since the
+                 epoch) or None when the proc filesystem is not available.
+    """
+    try:
+        with open(os.path.join(proc_directory, 'self', 'stat')) as stat_file:
+            # the process name may contain spaces, the fields follow after ')'
+            start_ticks = int(stat_file.read().rsplit(')', 1)[1].split()[19])
+        with open(os.path.join(proc_directory, 'stat')) as system_stat_file:
+            for line in system_stat_file:
+                if line.startswith('btime '):
+                    return int(line.split()[1]) + start_ticks / float(os.sysconf('SC_CLK_TCK'))
+    except (IOError, OSError, IndexError, ValueError):
+        pass
+    return None
+
+
+class StartupTimer(object):
+
+    def __init__(self, started_at=None):
+        self.started_at = started_at or process_start_time() or time()
+        self.last_mark = self.started_at
+        self.phases = []
+        self.ready_after = None
+
+    def mark(self, phase):
+        """
+            Ends the given phase, which started when the previous one ended.
+        """
+        now = time()
+        duration = now - self.last_mark
+        self.last_mark = now
+        self.phases.append((phase, duration))
+        METRICS['startup_%s_seconds' % phase] = duration
+        log.msg('Start-up phase %s took %.3f seconds' % (phase, duration))
+
+    def ready(self):
+        self.ready_after = time() - self.started_at
+        METRICS['startup_ready_seconds'] = self.ready_after
+        log.msg('Ready after %.3f seconds (%s)' % (
+            self.ready_after, ', '.join('%s %.3f' % phase for phase in self.phases)))
+
+    @property
+    def is_ready(self):
+        return self.ready_after is not None
+
+    def state(self):
+        return {'phases': [{'phase': phase, 'seconds': duration} for phase, duration in self.phases],
+                'ready_after': self.ready_after}
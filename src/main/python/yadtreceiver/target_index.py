@@ -0,0 +1,90 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Provides an in-memory index of the entries in the targets directory.
+    The index is filled once by listing the directory and kept current by
+    the FileSystemWatcher, so that computing the allowed targets and
+    looking up a target directory do not touch the (possibly NFS mounted)
+    file system.
+"""
+
+import os
+import re
+from fnmatch import translate
+
+
+def compile_target_patterns(patterns):
+    """
+        Compiles the given glob patterns into one matcher. Like glob, hidden
+        entries are only matched by patterns starting with a dot.
+
+        @return: a function which returns True for matching target names
+    """
+    def _compile(patterns):
+        if not patterns:
+            return None
+        return re.compile('|'.join('(?:%s)' % translate(pattern) for pattern in patterns))
+
+    visible_matcher = _compile([pattern for pattern in patterns if not pattern.startswith('.')])
+    hidden_matcher = _compile([pattern for pattern in patterns if pattern.startswith('.')])
+
+    def matches(name):
+        matcher = hidden_matcher if name.startswith('.') else visible_matcher
+        return matcher is not None and matcher.match(name) is not None
+    return matches
+
+
+class TargetDirectoryIndex(object):
+
+    def __init__(self, targets_directory):
+        self.targets_directory = targets_directory
+        self.entries = set()
+
+    def refresh(self):
+        """
+            Fills the index by listing the targets directory.
+        """
+        try:
+            self.entries = set(os.listdir(self.targets_directory))
+        except OSError:
+            self.entries = set()
+
+    def add(self, name):
+        self.entries.add(name)
+
+    def discard(self, name):
+        self.entries.discard(name)
+
+    def __contains__(self, name):
+        """
+            A miss is verified on disk since inotify does not see every
+            change (e.g. changes made by other NFS clients).
+        """
+        if name in self.entries:
+            return True
+        if os.path.exists(os.path.join(self.targets_directory, name)):
+            self.entries.add(name)
+            return True
+        return False
+
+    def match(self, patterns):
+        """
+            @return: the sorted names of all entries matching any of the
+                     given glob patterns
+        """
+        matches = compile_target_patterns(patterns)
+        return sorted(name for name in self.entries if matches(name))
@@ -18,8 +18,6 @@
     determine which receiver handles a specific request.
 """
 
-from fysom import Fysom
-
 
 def create_voting_fsm(tracking_id,
                       vote,
@@ -27,6 +25,8 @@ def create_voting_fsm(tracking_id,
                       spawn_yadtshell,
                       fold,
                       cleanup_fsm):
+    from fysom import Fysom  # imported on first use to start faster
+
     fsm = Fysom({
         'initial': 'negotiating',
         'events': [
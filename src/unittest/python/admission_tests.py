@@ -0,0 +1,153 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from mock import Mock, patch
+
+from yadtreceiver import Receiver
+from yadtreceiver.admission import (AdmissionController,
+                                    ADMIT,
+                                    DEFER,
+                                    REFUSE,
+                                    read_memory_available_percent,
+                                    read_pressure_percent)
+
+
+class ProcReaderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.temporary_directory)
+
+    def _write(self, name, content):
+        with open(join(self.temporary_directory, name), 'w') as proc_file:
+            proc_file.write(content)
+
+    def test_should_read_available_memory(self):
+        self._write('meminfo', 'MemTotal:  1000 kB\nMemFree:  100 kB\nMemAvailable:  250 kB\n')
+
+        self.assertEqual(25.0, read_memory_available_percent(join(self.temporary_directory, 'meminfo')))
+
+    def test_should_estimate_available_memory_on_old_kernels(self):
+        self._write('meminfo', 'MemTotal:  1000 kB\nMemFree:  100 kB\nBuffers:  50 kB\nCached:  50 kB\n')
+
+        self.assertEqual(20.0, read_memory_available_percent(join(self.temporary_directory, 'meminfo')))
+
+    def test_should_return_none_without_total_memory(self):
+        self._write('meminfo', 'MemFree:  100 kB\nMemAvailable:  250 kB\n')
+
+        self.assertEqual(None, read_memory_available_percent(join(self.temporary_directory, 'meminfo')))
+
+    def test_should_return_none_when_total_memory_is_zero(self):
+        self._write('meminfo', 'MemTotal:  0 kB\nMemAvailable:  0 kB\n')
+
+        self.assertEqual(None, read_memory_available_percent(join(self.temporary_directory, 'meminfo')))
+
+    def test_should_read_highest_pressure(self):
+        self._write('cpu', 'some avg10=1.50 avg60=1.00 avg300=0.50 total=100\n')
+        self._write('memory', 'some avg10=12.25 avg60=1.00 avg300=0.50 total=100\n'
+                              'full avg10=50.00 avg60=1.00 avg300=0.50 total=100\n')
+
+        self.assertEqual(12.25, read_pressure_percent(self.temporary_directory))
+
+    def test_should_return_none_without_pressure_stall_information(self):
+        self.assertEqual(None, read_pressure_percent(join(self.temporary_directory, 'missing')))
+
+
+class AdmissionControllerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = AdmissionController(max_load_per_cpu=2.0,
+                                              min_memory_available_percent=10,
+                                              max_pressure_percent=40)
+
+    @patch('yadtreceiver.admission.log')
+    def test_should_admit_without_pressure(self, _):
+        self.controller.update({'load_per_cpu': 1.0, 'memory_available_percent': 50, 'pressure_percent': None})
+
+        self.assertEqual(ADMIT, self.controller.decide('id-1', 'dev01'))
+
+    @patch('yadtreceiver.admission.log')
+    def test_should_defer_under_pressure_with_hysteresis(self, _):
+        self.controller.update({'load_per_cpu': 2.5})
+        self.assertEqual(DEFER, self.controller.decide('id-1', 'dev01'))
+
+        self.controller.update({'load_per_cpu': 1.8})
+        self.assertEqual(DEFER, self.controller.decide('id-2', 'dev01'))
+
+        self.controller.update({'load_per_cpu': 1.5})
+        self.assertEqual(ADMIT, self.controller.decide('id-3', 'dev01'))
+
+    @patch('yadtreceiver.admission.log')
+    def test_should_refuse_under_critical_pressure(self, _):
+        self.controller.update({'memory_available_percent': 4})
+
+        self.assertEqual(REFUSE, self.controller.decide('id-1', 'dev01'))
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    @patch('yadtreceiver.admission.log')
+    def test_should_expose_state_and_decisions(self, _):
+        self.controller.update({'pressure_percent': 50.0})
+        self.controller.decide('id-1', 'dev01')
+
+        state = self.controller.state()
+
+        self.assertTrue(state['under_pressure'])
+        self.assertEqual([('id-1', 'dev01', DEFER)],
+                         [(d['tracking_id'], d['target'], d['decision']) for d in state['decisions']])
+
+
+class AdmissionVotingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.receiver = Mock(Receiver)
+        self.receiver.broadcaster = Mock()
+        self.receiver.states = {}
+        self.receiver.leases = None
+        self.receiver.drain = None
+        self.event = Mock()
+        self.event.arguments = ['--tracking-id=foo']
+        self.event.target = 'dev01'
+
+    @patch('yadtreceiver.reactor')
+    @patch('yadtreceiver.random_uuid')
+    def test_should_vote_lower_than_any_regular_vote_when_deferring(self, uuid_fun, _):
+        uuid_fun.return_value = '00000000-0000'
+        self.receiver.admission_controller.decide.return_value = DEFER
+
+        Receiver.handle_request(self.receiver, self.event)
+
+        deferred_vote = self.receiver.states['foo'].vote
+        self.assertEqual('!00000000-0000', deferred_vote)
+        self.assertTrue(deferred_vote < '00000000-0000')
+
+    @patch('yadtreceiver.reactor')
+    @patch('yadtreceiver.log')
+    def test_should_not_vote_when_refusing(self, _, mock_reactor):
+        self.receiver.admission_controller.decide.return_value = REFUSE
+
+        Receiver.handle_request(self.receiver, self.event)
+
+        self.assertEqual({}, self.receiver.states)
+        self.assertFalse(self.receiver.broadcaster._sendEvent.called)
+        self.assertFalse(mock_reactor.callLater.called)
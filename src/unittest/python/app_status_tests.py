@@ -1,6 +1,10 @@
 from unittest import TestCase
 
-from yadtreceiver.app_status import AppStatusResource
+from twisted.internet.defer import Deferred, maybeDeferred
+from twisted.web import http
+from twisted.web.test.requesthelper import DummyRequest
+
+from yadtreceiver.app_status import AppStatusResource, StatusSnapshot
 
 from mock import patch, Mock
 
@@ -11,31 +15,118 @@ class AppStatusResourceTests(TestCase):
     def setUp(self, gethostname):
         gethostname.return_value = "any-hostname"
         self.receiver = Mock()
+        self.receiver.admission_controller = None
+        self.receiver.scheduler = None
+        self.receiver.startup = None
+        self.receiver.fan_in = None
+        self.receiver.leases = None
+        self.receiver.membership = None
+        self.receiver.drain = None
         self.app_status = AppStatusResource(self.receiver)
 
     def test_should_cache_hostname_when_instantiated(self):
         self.assertEqual(self.app_status.hostname, "any-hostname")
 
+    def test_should_serve_status_on_root_and_its_children(self):
+        child = Mock()
+        self.app_status.putChild('failure-output', child)
+
+        self.assertEqual(self.app_status, self.app_status.getChildWithDefault('', DummyRequest([])))
+        self.assertEqual(child, self.app_status.getChildWithDefault('failure-output', DummyRequest([])))
+
+    def test_should_answer_not_found_for_unknown_children(self):
+        request = DummyRequest([])
+
+        self.app_status.getChildWithDefault('status', request).render(request)
+
+        self.assertEqual(404, request.responseCode)
+
+    @patch("yadtreceiver.app_status.threads.deferToThread", side_effect=maybeDeferred)
     @patch("yadtreceiver.app_status.AppStatusResource.get_list_of_running_yadtshell_processes_spawned_by_receiver")
-    def test_should_cache_hostname_when_instantiated(self, processes):
+    def test_should_render_compact_status(self, processes, _):
         processes.return_value = ["process-1", "process-2"]
+        request = DummyRequest([])
+
+        request.render(self.app_status)
 
-        get_result = self.app_status.render_GET(Mock())
+        self.assertEqual(''.join(request.written),
+                         '{"running_commands":["process-1","process-2"],'
+                         '"name":"yadtreceiver v${version} on any-hostname"}')
+        self.assertEqual(request.finished, 1)
 
-        self.assertEqual(get_result, '''{
+    @patch("yadtreceiver.app_status.threads.deferToThread", side_effect=maybeDeferred)
+    @patch("yadtreceiver.app_status.AppStatusResource.get_list_of_running_yadtshell_processes_spawned_by_receiver")
+    def test_should_render_pretty_status_when_asked_for(self, processes, _):
+        processes.return_value = ["process-1", "process-2"]
+        request = DummyRequest([])
+        request.addArg('pretty', '1')
+
+        request.render(self.app_status)
+
+        self.assertEqual(''.join(request.written), '''{
     "running_commands": [
         "process-1", \n        "process-2"
     ], \n    "name": "yadtreceiver v${version} on any-hostname"
 }''')
 
+    @patch("yadtreceiver.app_status.threads.deferToThread", side_effect=maybeDeferred)
+    @patch("yadtreceiver.app_status.AppStatusResource.get_list_of_running_yadtshell_processes_spawned_by_receiver")
+    def test_should_serve_cached_snapshot_within_ttl(self, processes, defer_to_thread):
+        processes.return_value = []
+
+        DummyRequest([]).render(self.app_status)
+        request = DummyRequest([])
+        request.render(self.app_status)
+
+        self.assertEqual(defer_to_thread.call_count, 1)
+        self.assertEqual(request.finished, 1)
+
+    @patch("yadtreceiver.app_status.threads.deferToThread")
+    def test_should_coalesce_concurrent_requests_onto_one_computation(self, defer_to_thread):
+        computation = Deferred()
+        defer_to_thread.return_value = computation
+        first_request = DummyRequest([])
+        second_request = DummyRequest([])
+
+        first_request.render(self.app_status)
+        second_request.render(self.app_status)
+        computation.callback(StatusSnapshot({"name": "foo"}))
+
+        self.assertEqual(defer_to_thread.call_count, 1)
+        self.assertEqual(first_request.written, ['{"name":"foo"}'])
+        self.assertEqual(second_request.written, ['{"name":"foo"}'])
+
+    @patch("yadtreceiver.app_status.AppStatusResource.get_list_of_running_yadtshell_processes_spawned_by_receiver")
+    def test_should_include_admission_state_when_admission_control_is_enabled(self, processes):
+        processes.return_value = []
+        self.receiver.admission_controller = Mock()
+        self.receiver.admission_controller.state.return_value = {"under_pressure": True}
+
+        snapshot = self.app_status.compute_snapshot()
+
+        self.assertEqual(snapshot.status["admission"], {"under_pressure": True})
+
+    def test_should_not_render_body_when_etag_matches(self):
+        self.app_status.snapshot = StatusSnapshot({"name": "foo"})
+        request = Mock()
+        request.setETag.return_value = http.CACHED
+
+        result = self.app_status.render_GET(request)
+
+        self.assertEqual(result, '')
+        request.setETag.assert_called_with(self.app_status.snapshot.etag)
+
+    @patch("yadtreceiver.psutil_wrapper.PROC_DIRECTORY", "/no/proc/filesystem")
     @patch("yadtreceiver.psutil_wrapper.psutil")
     def test_should_filter_processes_when_they_are_not_python(self, psutil):
         p1 = Mock()
         p1.name.return_value = "python"
         p1.cmdline.return_value = ["bar", "searchterm", "rebar"]
+        p1.info = {"name": p1.name.return_value, "cmdline": p1.cmdline.return_value}
         p2 = Mock()
         p2.name.return_value = "java"
         p2.cmdline.return_value = ["bar", "searchterm", "rebar"]
+        p2.info = {"name": p2.name.return_value, "cmdline": p2.cmdline.return_value}
         psutil.process_iter.return_value = [p1, p2]
 
         result = self.app_status.get_python_processes_containing("searchterm")
@@ -43,14 +134,17 @@ class AppStatusResourceTests(TestCase):
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].cmdline(), ["bar", "searchterm", "rebar"])
 
+    @patch("yadtreceiver.psutil_wrapper.PROC_DIRECTORY", "/no/proc/filesystem")
     @patch("yadtreceiver.psutil_wrapper.psutil")
     def test_should_filter_processes_when_they_are_not_matching_the_term(self, psutil):
         p1 = Mock()
         p1.name.return_value = "python"
         p1.cmdline.return_value = ["bar", "searchterm", "rebar"]
+        p1.info = {"name": p1.name.return_value, "cmdline": p1.cmdline.return_value}
         p2 = Mock()
         p2.name.return_value = "python"
         p2.cmdline.return_value = ["bar", "fuuuuu", "rebar"]
+        p2.info = {"name": p2.name.return_value, "cmdline": p2.cmdline.return_value}
         psutil.process_iter.return_value = [p1, p2]
 
         result = self.app_status.get_python_processes_containing("searchterm")
@@ -58,14 +152,17 @@ class AppStatusResourceTests(TestCase):
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].cmdline(), ["bar", "searchterm", "rebar"])
 
+    @patch("yadtreceiver.psutil_wrapper.PROC_DIRECTORY", "/no/proc/filesystem")
     @patch("yadtreceiver.psutil_wrapper.psutil")
     def test_should_filter_processes_when_they_are_neither_python_nor_matching_the_term(self, psutil):
         p1 = Mock()
         p1.name.return_value = "python"
         p1.cmdline.return_value = ["bar", "foo", "rebar"]
+        p1.info = {"name": p1.name.return_value, "cmdline": p1.cmdline.return_value}
         p2 = Mock()
         p2.name.return_value = "rustc"
         p2.cmdline.return_value = ["bar", "fuuuuu", "rebar"]
+        p2.info = {"name": p2.name.return_value, "cmdline": p2.cmdline.return_value}
         psutil.process_iter.return_value = [p1, p2]
 
         result = self.app_status.get_python_processes_containing("foo")
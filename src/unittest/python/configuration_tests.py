@@ -34,7 +34,8 @@ from yadtreceiver.configuration import (DEFAULT_BROADCASTER_HOST,
                                         ReceiverConfigLoader,
                                         ReceiverConfig,
                                         load)
-from yadtcommons.configuration import YadtConfigParser
+from yadtreceiver.ratelimit import parse_rate_limit
+from yadtcommons.configuration import ConfigurationException, YadtConfigParser
 
 
 class ReceiverConfigLoaderTests (unittest.TestCase):
@@ -191,6 +192,73 @@ class ReceiverConfigLoaderTests (unittest.TestCase):
         self.assertEqual(
             call(SECTION_RECEIVER, 'metrics_directory', None), mock_parser.get_option.call_args)
 
+    def test_should_return_timeouts_by_name(self):
+        mock_loader = Mock(ReceiverConfigLoader)
+        mock_parser = Mock(YadtConfigParser)
+        mock_parser.get_option_as_list.return_value = ['dev*:600', 'pro*: 3600']
+        mock_loader._parser = mock_parser
+
+        actual_timeouts = ReceiverConfigLoader._get_option_as_dict(mock_loader, SECTION_RECEIVER, 'target_timeouts',
+                                                                   int)
+
+        self.assertEqual({'dev*': 600, 'pro*': 3600}, actual_timeouts)
+
+    def test_should_raise_exception_when_timeout_is_not_a_number(self):
+        mock_loader = Mock(ReceiverConfigLoader)
+        mock_parser = Mock(YadtConfigParser)
+        mock_parser.get_option_as_list.return_value = ['dev*:ten']
+        mock_loader._parser = mock_parser
+
+        self.assertRaises(ConfigurationException, ReceiverConfigLoader._get_option_as_dict,
+                          mock_loader, SECTION_RECEIVER, 'target_timeouts', int)
+
+    def test_should_return_request_rate_limit(self):
+        mock_loader = Mock(ReceiverConfigLoader)
+        mock_parser = Mock(YadtConfigParser)
+        mock_parser.get_option.return_value = '100/60'
+        mock_loader._parser = mock_parser
+
+        self.assertEqual((100, 60), ReceiverConfigLoader.get_request_rate_limit(mock_loader))
+        self.assertEqual(call(SECTION_RECEIVER, 'request_rate_limit', '0'), mock_parser.get_option.call_args)
+
+    def test_should_raise_exception_when_request_rate_limit_is_invalid(self):
+        mock_loader = Mock(ReceiverConfigLoader)
+        mock_parser = Mock(YadtConfigParser)
+        mock_parser.get_option.return_value = '100 per minute'
+        mock_loader._parser = mock_parser
+
+        self.assertRaises(ConfigurationException, ReceiverConfigLoader.get_request_rate_limit, mock_loader)
+
+    def test_should_return_target_request_rate_limits(self):
+        mock_loader = Mock(ReceiverConfigLoader)
+        mock_parser = Mock(YadtConfigParser)
+        mock_parser.get_option_as_list.return_value = ['dev*:10/60', 'pro*: 2/60']
+        mock_loader._parser = mock_parser
+
+        actual_limits = ReceiverConfigLoader._get_option_as_dict(mock_loader, SECTION_RECEIVER,
+                                                                 'target_request_rate_limits', parse_rate_limit)
+
+        self.assertEqual({'dev*': (10, 60), 'pro*': (2, 60)}, actual_limits)
+
+    def test_should_return_broadcasters(self):
+        mock_loader = Mock(ReceiverConfigLoader)
+        mock_parser = Mock(YadtConfigParser)
+        mock_parser.get_option_as_list.return_value = ['broadcaster1:8081', 'broadcaster2: 8082']
+        mock_loader._parser = mock_parser
+
+        actual_broadcasters = ReceiverConfigLoader.get_broadcasters(mock_loader)
+
+        self.assertEqual([('broadcaster1', 8081), ('broadcaster2', 8082)], actual_broadcasters)
+        self.assertEqual(call(SECTION_BROADCASTER, 'hosts', []), mock_parser.get_option_as_list.call_args)
+
+    def test_should_raise_exception_when_broadcaster_has_no_port(self):
+        mock_loader = Mock(ReceiverConfigLoader)
+        mock_parser = Mock(YadtConfigParser)
+        mock_parser.get_option_as_list.return_value = ['broadcaster1']
+        mock_loader._parser = mock_parser
+
+        self.assertRaises(ConfigurationException, ReceiverConfigLoader.get_broadcasters, mock_loader)
+
     def test_should_return_metrics_file(self):
         mock_loader = Mock(ReceiverConfigLoader)
         mock_loader.get_metrics_directory.return_value = '/tmp/metrics'
@@ -281,15 +349,50 @@ class LoadTest (unittest.TestCase):
 class ReceiverConfigTests(unittest.TestCase):
 
     @patch('yadtreceiver.configuration.ReceiverConfigLoader')
-    @patch('yadtreceiver.configuration.glob')
-    def test_should_compute_allowed_targets(self, mock_glob, mock_loader_class):
-        mock_glob.return_value = ['/foo/dev', '/foo/dev01', '/foo/dev02']
+    @patch('yadtreceiver.target_index.os.listdir')
+    def test_should_compute_allowed_targets(self, mock_listdir, mock_loader_class):
+        mock_listdir.return_value = ['dev', 'dev01', 'dev02', 'pro01', '.dev03']
         config = ReceiverConfig('blah')
-        config.configuration['targets'] = ['foo']
+        config.configuration['targets'] = ['dev*']
         config.compute_allowed_targets()
 
         self.assertEqual(config['allowed_targets'], ['dev', 'dev01', 'dev02'])
 
+    @patch('yadtreceiver.configuration.ReceiverConfigLoader')
+    @patch('yadtreceiver.target_index.os.listdir')
+    def test_should_list_targets_directory_only_once(self, mock_listdir, mock_loader_class):
+        mock_listdir.return_value = ['dev01', 'pro01']
+        mock_loader_class.return_value.get_targets_directory.return_value = '/etc/yadtshell/targets'
+        config = ReceiverConfig('blah')
+
+        config.configuration['targets'] = ['dev*']
+        config.compute_allowed_targets()
+        config.configuration['targets'] = ['pro*']
+        config.compute_allowed_targets()
+
+        self.assertEqual(config['allowed_targets'], ['pro01'])
+        self.assertEqual(mock_listdir.call_count, 1)
+
+    @patch('yadtreceiver.configuration.ReceiverConfigLoader')
+    @patch('yadtreceiver.target_index.os.listdir')
+    def test_should_index_changed_targets_directory_in_place_when_reloading(self, mock_listdir, mock_loader_class):
+        mock_listdir.side_effect = lambda directory: {'/etc/yadtshell/targets': ['dev01'],
+                                                      '/srv/yadtshell/targets': ['dev02']}[directory]
+        mock_loader = mock_loader_class.return_value
+        mock_loader.get_targets_directory.return_value = '/etc/yadtshell/targets'
+        mock_loader.get_targets.return_value = ['dev*']
+        config = ReceiverConfig('blah')
+        config.load()
+        target_index = config.target_index
+
+        mock_loader.get_targets_directory.return_value = '/srv/yadtshell/targets'
+        changed_settings = config.reload()
+
+        self.assertTrue(config.target_index is target_index)
+        self.assertEqual('/srv/yadtshell/targets', target_index.targets_directory)
+        self.assertEqual(['dev02'], config['allowed_targets'])
+        self.assertTrue('targets_directory' in changed_settings)
+
     @patch('yadtreceiver.configuration.ReceiverConfig.compute_allowed_targets')
     @patch('yadtreceiver.configuration.ReceiverConfigLoader')
     def test_should_reload_targets(self, mock_loader_class, _):
@@ -301,3 +404,19 @@ class ReceiverConfigTests(unittest.TestCase):
         config.reload_targets()
 
         self.assertEqual(config['targets'], ['foo'])
+
+    @patch('yadtreceiver.configuration.ReceiverConfig.compute_allowed_targets')
+    @patch('yadtreceiver.configuration.ReceiverConfigLoader')
+    def test_should_return_changed_settings_when_reloading(self, mock_loader_class, _):
+        mock_loader = Mock(ReceiverConfigLoader)
+        mock_loader.get_broadcaster_host.return_value = 'broadcaster-1'
+        mock_loader.get_python_command.return_value = '/usr/bin/python'
+        mock_loader_class.return_value = mock_loader
+        config = ReceiverConfig('/etc/yadtshell/receiver.cfg')
+
+        mock_loader.get_broadcaster_host.return_value = 'broadcaster-2'
+        mock_loader.get_python_command.return_value = '/usr/bin/python2.7'
+        changed_settings = config.reload()
+
+        self.assertEqual(['broadcaster_host', 'python_command'], changed_settings)
+        self.assertEqual('broadcaster-2', config['broadcaster_host'])
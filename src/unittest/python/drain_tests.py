@@ -0,0 +1,211 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import unittest
+
+from mock import Mock, call, patch
+from twisted.internet.task import Clock
+from twisted.web.test.requesthelper import DummyRequest
+
+from yadtreceiver import METRICS, Receiver
+from yadtreceiver.app_status import DrainResource
+from yadtreceiver.drain import FLUSHING, STOPPING, WAITING, Drain, RunningCommands
+from yadtreceiver.membership import MembershipTable
+from yadtreceiver.protocols import ProcessProtocol
+from yadtreceiver.scheduler import RequestScheduler
+
+
+class RunningCommandsTests(unittest.TestCase):
+
+    def test_should_forget_command_when_it_exits(self):
+        running_commands = RunningCommands()
+        process_protocol = ProcessProtocol('hostname', Mock(), 'dev01', 'yadtshell update')
+
+        running_commands.started(process_protocol)
+        self.assertEqual(1, len(running_commands))
+        process_protocol.notify_exit()
+
+        self.assertEqual(0, len(running_commands))
+
+
+class DrainTests(unittest.TestCase):
+
+    def test_should_report_progress(self):
+        drain = Drain('SIGUSR1', 600, now=100)
+        drain.update(2, 1, 3)
+
+        self.assertEqual({'reason': 'SIGUSR1', 'phase': WAITING, 'seconds_draining': 10, 'seconds_left': 590,
+                          'votes_in_progress': 2, 'queued_requests': 1, 'running_commands': 3},
+                         drain.state(now=110))
+        self.assertFalse(drain.is_done)
+        self.assertFalse(drain.is_overdue(now=699))
+        self.assertTrue(drain.is_overdue(now=700))
+
+
+class ReceiverDrainTests(unittest.TestCase):
+
+    def setUp(self):
+        self.receiver = Mock(Receiver)
+        self.receiver.broadcaster = Mock()
+        self.receiver.configuration = {'drain_timeout': 600}
+        self.receiver.drain = None
+        self.receiver.leases = None
+        self.receiver.membership = None
+        self.receiver.scheduler = None
+        self.receiver.spool = None
+        self.receiver.states = {}
+        self.receiver.running_commands = RunningCommands()
+        self.receiver.check_drain = lambda: Receiver.check_drain(self.receiver)
+
+    @patch('yadtreceiver.reactor')
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_wait_for_votes_and_running_commands(self, mock_reactor):
+        self.receiver.states = {'id-1': Mock()}
+
+        Receiver.start_drain(self.receiver, 'SIGUSR1')
+
+        self.assertEqual('SIGUSR1', self.receiver.drain.reason)
+        self.assertEqual(call(1, self.receiver.check_drain), mock_reactor.callLater.call_args)
+        self.assertFalse(self.receiver.write_metrics_to_file.called)
+        self.assertEqual(1, METRICS['drains'])
+
+    @patch('yadtreceiver.reactor')
+    @patch('yadtreceiver.log')
+    def test_should_wait_for_requests_queued_under_a_lease(self, _, mock_reactor):
+        self.receiver.scheduler = RequestScheduler(1, {'normal': 1}, 'normal')
+        self.receiver.scheduler.running = 1
+        self.receiver.get_priority_class.return_value = 'normal'
+        event = Mock()
+        event.target = 'dev01'
+        Receiver.schedule_request(self.receiver, event, None)
+
+        Receiver.start_drain(self.receiver, 'SIGUSR1')
+
+        self.assertEqual({}, self.receiver.states)
+        self.assertEqual(1, self.receiver.drain.queued_requests)
+        self.assertEqual(WAITING, self.receiver.drain.phase)
+        self.assertEqual(call(1, self.receiver.check_drain), mock_reactor.callLater.call_args)
+
+    @patch('yadtreceiver.reactor')
+    def test_should_flush_and_stop_when_drained(self, mock_reactor):
+        self.receiver.spool = Mock()
+
+        Receiver.start_drain(self.receiver, 'SIGUSR1')
+
+        self.assertEqual(FLUSHING, self.receiver.drain.phase)
+        self.assertEqual(call(), self.receiver.spool.sync.call_args)
+        self.assertEqual(call(), self.receiver.broadcaster.replay.call_args)
+        self.assertEqual(call(), self.receiver.write_metrics_to_file.call_args)
+        self.assertEqual(call(1, self.receiver.finish_drain), mock_reactor.callLater.call_args)
+
+        Receiver.finish_drain(self.receiver)
+
+        self.assertEqual(STOPPING, self.receiver.drain.phase)
+        self.assertEqual(call(), mock_reactor.stop.call_args)
+
+    @patch('yadtreceiver.reactor')
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_stop_when_timeout_is_reached(self, mock_reactor):
+        self.receiver.configuration['drain_timeout'] = 0
+        self.receiver.running_commands.process_protocols.add(Mock())
+
+        Receiver.start_drain(self.receiver, 'SIGUSR1')
+
+        self.assertEqual(call(1, self.receiver.finish_drain), mock_reactor.callLater.call_args)
+        self.assertEqual(1, METRICS['drain_timeouts'])
+
+    @patch('yadtreceiver.reactor')
+    def test_should_release_leases_and_leave_membership(self, _):
+        self.receiver.leases = Mock()
+        self.receiver.leases.release_all.return_value = [('dev01', {'duration': 0})]
+        self.receiver.membership = Mock()
+
+        Receiver.start_drain(self.receiver, 'SIGUSR1')
+
+        self.assertEqual(call('dev01', {'duration': 0}), self.receiver.announce_lease.call_args)
+        self.assertEqual(call(leaving=True), self.receiver.send_heartbeat.call_args)
+
+    @patch('yadtreceiver.log')
+    def test_should_keep_leaving_in_heartbeats_while_draining(self, _):
+        clock = Clock()
+        self.receiver.configuration.update({'hostname': 'host-a', 'allowed_targets': ['dev01'],
+                                            'max_running_commands': 0})
+        self.receiver.membership = MembershipTable('host-a', 5)
+        self.receiver.running_commands.process_protocols.add(Mock())
+        self.receiver.schedule_heartbeat = lambda first_call=False: Receiver.schedule_heartbeat(self.receiver,
+                                                                                                first_call)
+        self.receiver.send_heartbeat = lambda leaving=False: Receiver.send_heartbeat(self.receiver, leaving)
+
+        with patch('yadtreceiver.reactor', clock):
+            self.receiver.schedule_heartbeat(first_call=True)
+            Receiver.start_drain(self.receiver, 'SIGUSR1')
+            clock.advance(5)
+
+        heartbeats = [sent[1]['data'] for sent in self.receiver.broadcaster._sendEvent.call_args_list]
+        self.assertEqual(2, len(heartbeats))
+        self.assertTrue(all(heartbeat.get('leaving') for heartbeat in heartbeats))
+
+    def test_should_start_draining_only_once(self):
+        self.receiver.drain = Drain('SIGUSR1', 600)
+
+        Receiver.start_drain(self.receiver, 'app status request')
+
+        self.assertEqual('SIGUSR1', self.receiver.drain.reason)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_not_vote_while_draining(self):
+        self.receiver.drain = Drain('SIGUSR1', 600)
+        event = Mock()
+        event.arguments = ['update', '--tracking-id=foo']
+
+        Receiver.handle_request(self.receiver, event)
+
+        self.assertEqual({}, self.receiver.states)
+        self.assertFalse(self.receiver.broadcaster._sendEvent.called)
+        self.assertEqual(1, METRICS['requests_ignored_draining'])
+
+
+class DrainResourceTests(unittest.TestCase):
+
+    def setUp(self):
+        self.receiver = Mock()
+        self.receiver.drain = None
+        self.resource = DrainResource(self.receiver, 'secret')
+
+    def test_should_show_that_receiver_is_not_draining(self):
+        self.assertEqual('null', self.resource.render_GET(DummyRequest([])))
+
+    def test_should_refuse_drain_without_token(self):
+        request = DummyRequest([])
+        request.method = 'POST'
+
+        self.resource.render_POST(request)
+
+        self.assertEqual(401, request.responseCode)
+        self.assertFalse(self.receiver.start_drain.called)
+
+    def test_should_start_drain_with_token(self):
+        request = DummyRequest([])
+        request.method = 'POST'
+        request.requestHeaders.setRawHeaders('Authorization', ['Bearer secret'])
+        self.receiver.start_drain.side_effect = lambda reason: setattr(self.receiver, 'drain', Drain(reason, 600))
+
+        state = json.loads(self.resource.render_POST(request))
+
+        self.assertEqual(202, request.responseCode)
+        self.assertEqual('app status request', state['reason'])
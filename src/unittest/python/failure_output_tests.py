@@ -0,0 +1,138 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from mock import Mock, patch
+from twisted.web.test.requesthelper import DummyRequest
+
+from yadtreceiver import METRICS
+from yadtreceiver.app_status import FailureOutputResource
+from yadtreceiver.failure_output import (FailureOutputPublisher,
+                                         FailureOutputStore,
+                                         decompress_chunks,
+                                         excerpt)
+
+
+class ExcerptTests(unittest.TestCase):
+
+    def test_should_keep_output_which_fits(self):
+        self.assertEqual('short output', excerpt('short output', 100))
+
+    def test_should_keep_head_and_tail_of_long_output(self):
+        output = 'head' + 'x' * 1000 + 'tail'
+
+        actual_excerpt = excerpt(output, 100)
+
+        self.assertTrue(len(actual_excerpt) <= 100)
+        self.assertTrue(actual_excerpt.startswith('headxxx'))
+        self.assertTrue(actual_excerpt.endswith('xxxtail'))
+        self.assertTrue('bytes omitted' in actual_excerpt)
+
+
+class FailureOutputPublisherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = mkdtemp()
+        self.broadcaster = Mock()
+
+    def tearDown(self):
+        rmtree(self.temporary_directory)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_send_small_output_as_it_is(self):
+        publisher = FailureOutputPublisher('hostname', max_message_bytes=100, chunk_bytes=10)
+
+        message = publisher.publish(self.broadcaster, 'dev123', 'update', 'it failed', tracking_id='id-1')
+
+        self.assertEqual('it failed', message)
+        self.assertFalse(self.broadcaster._sendEvent.called)
+        self.assertEqual(9, METRICS['failure_message_bytes'])
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_send_full_output_in_ordered_chunks(self):
+        publisher = FailureOutputPublisher('hostname', max_message_bytes=100, chunk_bytes=16)
+        output = ''.join(str(number) for number in range(1000))
+
+        message = publisher.publish(self.broadcaster, 'dev123', 'update', output, tracking_id='id-1')
+
+        chunk_events = [event_call[1] for event_call in self.broadcaster._sendEvent.call_args_list]
+        self.assertEqual(range(len(chunk_events)), [event['chunk'] for event in chunk_events])
+        self.assertEqual(set([len(chunk_events)]), set(event['chunks'] for event in chunk_events))
+        self.assertEqual(output, decompress_chunks([event['data'] for event in chunk_events]))
+        self.assertTrue('failure-output events' in message)
+        self.assertEqual(len(output), METRICS['failure_output_bytes'])
+        self.assertEqual(1, METRICS['failure_messages_truncated'])
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_keep_full_output_locally(self):
+        store = FailureOutputStore(join(self.temporary_directory, 'failures'))
+        publisher = FailureOutputPublisher('hostname', max_message_bytes=100, store=store)
+        output = 'x' * 1000
+
+        message = publisher.publish(self.broadcaster, 'dev123', 'update', output, tracking_id='id-1')
+
+        self.assertTrue('kept on hostname' in message)
+        self.assertEqual(output, store.load('id-1'))
+
+
+class FailureOutputStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = mkdtemp()
+        self.store = FailureOutputStore(self.temporary_directory, kept_outputs=2)
+        self.receiver = Mock()
+        self.receiver.failure_output.store = self.store
+
+    def tearDown(self):
+        rmtree(self.temporary_directory)
+
+    def test_should_keep_only_the_newest_outputs(self):
+        for tracking_id in ('id-1', 'id-2', 'id-3'):
+            self.store.save(tracking_id, tracking_id)
+
+        self.assertEqual(None, self.store.load('id-1'))
+        self.assertEqual('id-3', self.store.load('id-3'))
+
+    def test_should_not_keep_output_of_invalid_tracking_id(self):
+        self.assertFalse(self.store.save('../../etc/passwd', 'output'))
+        self.assertEqual(None, self.store.load('../../etc/passwd'))
+
+    def test_should_serve_kept_output(self):
+        self.store.save('id-1', 'full output')
+        request = DummyRequest(['id-1'])
+
+        self.assertEqual('full output', FailureOutputResource(self.receiver).render_GET(request))
+
+    def test_should_answer_not_found_for_unknown_tracking_id(self):
+        request = DummyRequest(['id-1'])
+
+        FailureOutputResource(self.receiver).render_GET(request)
+
+        self.assertEqual(404, request.responseCode)
+
+    def test_should_answer_not_found_below_tracking_id(self):
+        self.store.save('id-1', 'full output')
+        request = DummyRequest(['id-1', 'spam'])
+
+        FailureOutputResource(self.receiver).render_GET(request)
+
+        self.assertEqual(404, request.responseCode)
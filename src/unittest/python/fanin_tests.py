@@ -0,0 +1,158 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+from mock import Mock, call, patch
+
+from yadtreceiver import METRICS
+from yadtreceiver.fanin import FanInBroadcaster, RecentIds, deduplication_key
+
+
+def create_broadcaster(host, connected=True):
+    broadcaster = Mock()
+    broadcaster.host = host
+    broadcaster.port = 8081
+    broadcaster.url = 'ws://%s:8081/' % host
+    broadcaster.client = Mock() if connected else None
+    return broadcaster
+
+
+def request(tracking_id):
+    return {'id': 'request', 'tracking_id': tracking_id, 'target': 'dev01', 'cmd': 'yadtshell', 'args': ['status']}
+
+
+def vote(tracking_id, value):
+    return {'id': 'vote', 'tracking_id': tracking_id, 'target': 'dev01', 'payload': value}
+
+
+class RecentIdsTests(unittest.TestCase):
+
+    def test_should_forget_oldest_ids(self):
+        recent_ids = RecentIds(2)
+
+        recent_ids.add('a', 'ws://b1', 1)
+        recent_ids.add('b', 'ws://b1', 2)
+        recent_ids.add('c', 'ws://b1', 3)
+
+        self.assertFalse('a' in recent_ids)
+        self.assertEqual((3, 'ws://b1'), recent_ids.get('c'))
+        self.assertEqual(2, len(recent_ids))
+
+
+class DeduplicationKeyTests(unittest.TestCase):
+
+    def test_should_key_requests_by_tracking_id(self):
+        self.assertEqual(('request', 'abc'), deduplication_key(request('abc')))
+
+    def test_should_key_votes_by_tracking_id_and_vote(self):
+        self.assertNotEqual(deduplication_key(vote('abc', 'v1')), deduplication_key(vote('abc', 'v2')))
+
+    def test_should_not_key_other_events(self):
+        self.assertEqual(None, deduplication_key({'id': 'heartbeat', 'tracking_id': None}))
+        self.assertEqual(None, deduplication_key({'id': 'request', 'tracking_id': None}))
+
+
+@patch('yadtreceiver.fanin.log', Mock())
+@patch('yadtreceiver.fanin.reactor')
+class FanInBroadcasterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.broadcaster1 = create_broadcaster('broadcaster1')
+        self.broadcaster2 = create_broadcaster('broadcaster2')
+        self.fan_in = FanInBroadcaster([self.broadcaster1, self.broadcaster2], recent_ids=10)
+        self.handler = Mock()
+
+    def deliver(self, broadcaster, event_data):
+        self.fan_in.subscribe_on(broadcaster, self.handler, 'dev01')
+        callback = broadcaster.client.subscribe.call_args[0][0]
+        callback(event_data)
+
+    def test_should_subscribe_on_all_connected_sessions(self, _):
+        self.fan_in.client.subscribe(self.handler, 'dev01')
+
+        self.assertEqual('dev01', self.broadcaster1.client.subscribe.call_args[0][1])
+        self.assertEqual('dev01', self.broadcaster2.client.subscribe.call_args[0][1])
+
+    def test_should_have_no_client_while_no_session_is_open(self, _):
+        self.broadcaster1.client = None
+        self.broadcaster2.client = None
+
+        self.assertEqual(None, self.fan_in.client)
+
+    def test_should_run_handlers_on_first_session_and_subscribe_later_sessions(self, mock_reactor):
+        on_connect = Mock(side_effect=lambda: self.fan_in.client.subscribe(self.handler, 'dev01'))
+        self.fan_in.addOnSessionOpenHandler(on_connect)
+        self.broadcaster2.client = None
+
+        self.fan_in.on_session_open(self.broadcaster1)
+        self.broadcaster2.client = Mock()
+        self.fan_in.on_session_open(self.broadcaster2)
+
+        self.assertEqual(1, on_connect.call_count)
+        self.assertEqual('dev01', self.broadcaster2.client.subscribe.call_args[0][1])
+        self.assertEqual(call(0, self.broadcaster2.addOnSessionOpenHandler, mock_reactor.callLater.call_args[0][2]),
+                         mock_reactor.callLater.call_args)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_pass_request_arriving_on_several_sessions_once(self, _):
+        self.deliver(self.broadcaster1, request('abc'))
+        self.deliver(self.broadcaster2, request('abc'))
+
+        self.assertEqual([call(request('abc'))], self.handler.call_args_list)
+        self.assertEqual(1, METRICS['events_deduplicated'])
+
+    def test_should_pass_different_votes_with_same_tracking_id(self, _):
+        self.deliver(self.broadcaster1, vote('abc', 'v1'))
+        self.deliver(self.broadcaster2, vote('abc', 'v2'))
+
+        self.assertEqual(2, self.handler.call_count)
+
+    def test_should_pass_other_events_only_from_publishing_session(self, _):
+        heartbeat = {'id': 'heartbeat', 'tracking_id': None, 'target': 'dev01'}
+
+        self.deliver(self.broadcaster1, heartbeat)
+        self.deliver(self.broadcaster2, heartbeat)
+
+        self.assertEqual([call(heartbeat)], self.handler.call_args_list)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    @patch('yadtreceiver.fanin.time')
+    def test_should_publish_on_broadcaster_with_lowest_lag(self, mock_time, _):
+        mock_time.side_effect = [10, 12]
+
+        self.deliver(self.broadcaster2, request('abc'))
+        self.deliver(self.broadcaster1, request('abc'))
+
+        self.assertEqual(0.4, self.fan_in.lags['ws://broadcaster1:8081/'])
+        self.assertEqual(0.4, METRICS['broadcaster_lag.broadcaster1_8081'])
+        self.assertTrue(self.fan_in.healthiest() is self.broadcaster2)
+        self.fan_in.publish_cmd_for_target('dev01', 'status', 'started')
+        self.assertEqual(call('dev01', 'status', 'started'), self.broadcaster2.publish_cmd_for_target.call_args)
+
+    def test_should_publish_on_first_broadcaster_while_none_is_connected(self, _):
+        self.broadcaster1.client = None
+        self.broadcaster2.client = None
+
+        self.assertTrue(self.fan_in.healthiest() is self.broadcaster1)
+
+    def test_should_report_state_of_broadcasters(self, _):
+        self.broadcaster2.client = None
+
+        self.assertEqual([{'url': 'ws://broadcaster1:8081/', 'connected': True, 'lag': 0.0, 'publishing': True},
+                          {'url': 'ws://broadcaster2:8081/', 'connected': False, 'lag': 0.0, 'publishing': False}],
+                         self.fan_in.state())
@@ -0,0 +1,155 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from os.path import join, getsize
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from mock import Mock, call, patch
+
+from yadtreceiver import Receiver
+from yadtreceiver.journal import JobJournal
+
+
+class JobJournalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = mkdtemp()
+        self.journal_file = join(self.temporary_directory, 'journal', 'jobs.journal')
+
+    def tearDown(self):
+        rmtree(self.temporary_directory)
+
+    def test_should_replay_open_jobs(self):
+        journal = JobJournal(self.journal_file)
+        journal.open()
+        journal.accepted('id-1', 'dev01', 'update')
+        journal.won('id-1')
+        journal.spawned('id-1', 4711)
+        journal.accepted('id-2', 'dev02', 'status')
+        journal.won('id-2')
+        journal.spawned('id-2', 4712)
+        journal.exited('id-2', 0)
+        journal.accepted('id-3', 'dev03', 'status')
+        journal.close()
+
+        open_jobs = JobJournal(self.journal_file).open()
+
+        self.assertEqual({'id-1': {'target': 'dev01', 'cmd': 'update', 'state': 'spawned', 'pid': 4711},
+                          'id-3': {'target': 'dev03', 'cmd': 'status', 'state': 'accepted', 'pid': None}},
+                         open_jobs)
+
+    def test_should_not_journal_jobs_without_tracking_id(self):
+        journal = JobJournal(self.journal_file)
+        journal.open()
+
+        journal.accepted(None, 'dev01', 'update')
+        journal.close()
+
+        self.assertEqual(0, getsize(self.journal_file))
+
+    def test_should_close_discarded_jobs(self):
+        journal = JobJournal(self.journal_file)
+        journal.open()
+        journal.accepted('id-1', 'dev01', 'update')
+        journal.discarded('id-1', 'folded')
+        journal.close()
+
+        self.assertEqual({}, journal.jobs)
+        self.assertEqual({}, JobJournal(self.journal_file).open())
+
+    @patch('yadtreceiver.journal.os.fsync')
+    def test_should_fsync_in_batches(self, mock_fsync):
+        journal = JobJournal(self.journal_file, fsync_batch_size=3)
+        journal.open()
+
+        journal.accepted('id-1', 'dev01', 'update')
+        journal.won('id-1')
+        self.assertFalse(mock_fsync.called)
+        journal.spawned('id-1', 4711)
+        self.assertEqual(1, mock_fsync.call_count)
+        journal.exited('id-1', 0)
+        journal.sync()
+        self.assertEqual(2, mock_fsync.call_count)
+        journal.close()
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_write_snapshot_and_truncate_journal(self):
+        journal = JobJournal(self.journal_file, snapshot_interval=3)
+        journal.open()
+        journal.accepted('id-1', 'dev01', 'update')
+        journal.won('id-1')
+        journal.spawned('id-1', 4711)
+        self.assertEqual(0, getsize(self.journal_file))
+
+        journal.accepted('id-2', 'dev02', 'update')
+        journal.close()
+
+        open_jobs = JobJournal(self.journal_file).open()
+        self.assertEqual(['id-1', 'id-2'], sorted(open_jobs.keys()))
+        self.assertEqual(4711, open_jobs['id-1']['pid'])
+
+
+class JobRecoveryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.receiver = Receiver()
+        self.receiver.broadcaster = Mock()
+        self.receiver.set_configuration({'hostname': 'hostname',
+                                         'journal_file': '/var/lib/yadtreceiver/jobs.journal',
+                                         'journal_snapshot_interval': 1000})
+
+    @patch('yadtreceiver.reactor')
+    @patch('yadtreceiver.log')
+    @patch('yadtreceiver.pid_exists')
+    @patch('yadtreceiver.JobJournal')
+    def test_should_adopt_running_jobs_and_publish_lost_ones(self, mock_journal_class, mock_pid_exists, _,
+                                                             mock_reactor):
+        mock_journal_class.return_value.open.return_value = {
+            'running': {'target': 'dev01', 'cmd': 'update', 'state': 'spawned', 'pid': 1},
+            'lost': {'target': 'dev02', 'cmd': 'update', 'state': 'spawned', 'pid': 2},
+            'voting': {'target': 'dev03', 'cmd': 'update', 'state': 'accepted', 'pid': None}}
+        mock_pid_exists.side_effect = lambda pid: pid == 1
+
+        self.receiver.recover_jobs_from_journal()
+
+        self.assertEqual(['running'], list(self.receiver.adopted_jobs.keys()))
+        self.assertEqual(1, self.receiver.broadcaster.publish_cmd_for_target.call_count)
+        self.assertEqual(call('dev02', 'update', 'failed',
+                              '(hostname) target[dev02] request "update" was lost: '
+                              'receiver restarted, exit code unknown.',
+                              tracking_id='lost'),
+                         self.receiver.broadcaster.publish_cmd_for_target.call_args)
+        self.assertEqual(sorted([call('lost', None), call('voting', None)]),
+                         sorted(mock_journal_class.return_value.exited.call_args_list))
+        self.assertTrue(mock_reactor.callLater.called)
+
+    @patch('yadtreceiver.reactor')
+    @patch('yadtreceiver.log')
+    @patch('yadtreceiver.pid_exists')
+    def test_should_publish_adopted_job_when_process_is_gone(self, mock_pid_exists, _, mock_reactor):
+        self.receiver.journal = Mock()
+        self.receiver.adopted_jobs = {'running': {'target': 'dev01', 'cmd': 'update', 'state': 'spawned', 'pid': 1}}
+        mock_pid_exists.return_value = False
+
+        self.receiver.schedule_adopted_jobs_check()
+
+        self.assertEqual({}, self.receiver.adopted_jobs)
+        self.assertEqual(call('running', None), self.receiver.journal.exited.call_args)
+        self.assertTrue(self.receiver.broadcaster.publish_cmd_for_target.called)
+        self.assertFalse(mock_reactor.callLater.called)
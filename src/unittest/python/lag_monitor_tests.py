@@ -0,0 +1,93 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import threading
+import unittest
+
+from mock import Mock, patch
+
+from yadtreceiver import METRICS
+from yadtreceiver.lag_monitor import ReactorLagMonitor
+
+
+class ReactorLagMonitorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.monitor = ReactorLagMonitor(interval=0.25, threshold=0.5)
+        self.monitor.reactor_thread_id = threading.current_thread().ident
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    @patch('yadtreceiver.lag_monitor.reactor')
+    @patch('yadtreceiver.lag_monitor.time')
+    def test_should_count_lag_in_histogram(self, mock_time, mock_reactor):
+        mock_time.return_value = 100
+        self.monitor.schedule(100)
+
+        mock_time.return_value = 100.25 + 0.07
+        self.monitor.tick()
+
+        self.assertEqual(1, METRICS['reactor_lag.le_0.1'])
+        self.assertAlmostEqual(0.07, METRICS['reactor_lag_max'])
+        self.assertEqual(100.32 + 0.25, self.monitor.expected)
+        self.assertTrue(mock_reactor.callLater.called)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_count_lag_above_all_buckets(self):
+        self.monitor.record(60)
+
+        self.assertEqual(1, METRICS['reactor_lag.le_inf'])
+        self.assertEqual(60, METRICS['reactor_lag_max'])
+
+    @patch('yadtreceiver.lag_monitor.reactor')
+    @patch('yadtreceiver.lag_monitor.log')
+    def test_should_log_stack_of_blocking_call_once_per_call_site(self, mock_log, mock_reactor):
+        self.monitor.last_tick = 100
+
+        for _ in range(2):
+            self.monitor.stall_reported = False
+            self.monitor.check(101)
+
+        self.assertEqual(1, mock_log.msg.call_count)
+        self.assertTrue('test_should_log_stack_of_blocking_call_once_per_call_site' in mock_log.msg.call_args[0][0])
+        self.assertEqual(2, mock_reactor.callFromThread.call_count)
+
+    @patch('yadtreceiver.lag_monitor.reactor')
+    @patch('yadtreceiver.lag_monitor.log')
+    def test_should_report_stall_only_once(self, mock_log, mock_reactor):
+        self.monitor.last_tick = 100
+
+        self.monitor.check(101)
+        self.monitor.check(102)
+
+        self.assertEqual(1, mock_reactor.callFromThread.call_count)
+
+    @patch('yadtreceiver.lag_monitor.reactor')
+    def test_should_not_report_when_timer_is_on_time(self, mock_reactor):
+        self.monitor.last_tick = 100
+
+        self.monitor.check(100.5)
+
+        self.assertFalse(mock_reactor.callFromThread.called)
+
+    def test_should_cancel_timer_when_stopped(self):
+        self.monitor.delayed_call = Mock()
+        self.monitor.delayed_call.active.return_value = True
+
+        self.monitor.stop()
+
+        self.assertTrue(self.monitor.delayed_call.cancel.called)
+        self.assertTrue(self.monitor.stopped.is_set())
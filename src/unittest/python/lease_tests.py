@@ -0,0 +1,244 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+from mock import Mock, call, patch
+
+from yadtreceiver import METRICS, Receiver
+from yadtreceiver.admission import DEFER, REFUSE
+from yadtreceiver.drain import Drain
+from yadtreceiver.lease import LeaseTable
+
+
+def lease(holder, term, duration=30):
+    return {'holder': holder, 'term': term, 'duration': duration}
+
+
+class LeaseTableTests(unittest.TestCase):
+
+    def setUp(self):
+        self.leases = LeaseTable('host-a', 30, settle_seconds=2)
+
+    def test_should_hold_acquired_lease_after_settling(self):
+        payload = self.leases.acquire('dev01', now=100)
+
+        self.assertEqual(lease('host-a', 1), payload)
+        self.assertFalse(self.leases.holds('dev01', now=101))
+        self.assertEqual('host-a', self.leases.holder_of('dev01', now=101))
+        self.assertTrue(self.leases.holds('dev01', now=102))
+        self.assertFalse(self.leases.holds('dev01', now=130))
+
+    def test_should_acquire_with_term_above_the_last_seen(self):
+        self.leases.on_lease('dev01', lease('host-b', 7, duration=0), now=100)
+
+        self.assertEqual(8, self.leases.acquire('dev01', now=100)['term'])
+
+    def test_should_record_lease_of_other_receiver_until_it_expires(self):
+        self.leases.on_lease('dev01', lease('host-b', 1), now=100)
+
+        self.assertEqual('host-b', self.leases.holder_of('dev01', now=129))
+        self.assertEqual(None, self.leases.holder_of('dev01', now=130))
+        self.assertFalse(self.leases.holds('dev01', now=110))
+
+    def test_should_forget_released_lease(self):
+        self.leases.on_lease('dev01', lease('host-b', 1), now=100)
+        self.leases.on_lease('dev01', lease('host-b', 1, duration=0), now=101)
+
+        self.assertEqual(None, self.leases.holder_of('dev01', now=102))
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_keep_own_lease_when_it_ranks_higher(self):
+        self.leases.on_lease('dev01', lease('host-b', 3, duration=0), now=100)
+        self.leases.acquire('dev01', now=100)
+
+        self.leases.on_lease('dev01', lease('host-0', 4), now=101)
+
+        self.assertEqual('host-a', self.leases.holder_of('dev01', now=102))
+        self.assertEqual(1, METRICS['lease_conflicts'])
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_give_up_own_lease_when_other_ranks_higher(self):
+        self.leases.acquire('dev01', now=100)
+
+        self.leases.on_lease('dev01', lease('host-b', 1), now=101)
+
+        self.assertEqual('host-b', self.leases.holder_of('dev01', now=102))
+        self.assertFalse(self.leases.holds('dev01', now=110))
+        self.assertEqual(1, METRICS['leases_lost'])
+
+    def test_should_ignore_stale_lease_of_former_holder(self):
+        self.leases.on_lease('dev01', lease('host-c', 2), now=100)
+
+        self.leases.on_lease('dev01', lease('host-b', 1), now=101)
+
+        self.assertEqual('host-c', self.leases.holder_of('dev01', now=102))
+
+    def test_should_renew_only_valid_own_leases(self):
+        self.leases.acquire('dev01', now=100)
+        self.leases.acquire('dev02', now=100)
+        self.leases.on_lease('dev03', lease('host-b', 1), now=100)
+
+        self.assertEqual([('dev01', lease('host-a', 1)), ('dev02', lease('host-a', 1))],
+                         self.leases.renew(now=120))
+        self.assertTrue(self.leases.holds('dev01', now=149))
+        self.assertEqual([], self.leases.renew(now=150))
+        self.assertEqual(None, self.leases.holder_of('dev01', now=150))
+
+    def test_should_release_only_own_leases(self):
+        self.leases.acquire('dev01', now=100)
+        self.leases.on_lease('dev02', lease('host-b', 1), now=100)
+
+        self.assertEqual([('dev01', lease('host-a', 1, duration=0))], self.leases.release_all())
+        self.assertEqual(None, self.leases.release('dev02'))
+        self.assertEqual({'dev02': 'host-b'}, self.leases.state(now=101))
+
+    def test_should_ignore_invalid_lease(self):
+        self.leases.on_lease('dev01', {'holder': 'host-b'}, now=100)
+
+        self.assertEqual(None, self.leases.holder_of('dev01', now=100))
+
+
+class ReceiverLeaseTests(unittest.TestCase):
+
+    def setUp(self):
+        self.receiver = Mock(Receiver)
+        self.receiver.broadcaster = Mock()
+        self.receiver.states = {}
+        self.receiver.admission_controller = None
+        self.receiver.scheduler = None
+        self.receiver.journal = None
+        self.receiver.drain = None
+        self.receiver.configuration = {'hostname': 'host-a'}
+        self.receiver.leases = LeaseTable('host-a', 30, settle_seconds=0)
+        self.event = Mock()
+        self.event.arguments = ['update', '--tracking-id=foo']
+        self.event.target = 'dev01'
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_perform_request_without_voting_when_holding_the_lease(self):
+        self.receiver.leases.acquire('dev01')
+
+        Receiver.handle_request(self.receiver, self.event)
+
+        self.assertEqual(call(self.event, None), self.receiver.perform_request.call_args)
+        self.assertEqual({}, self.receiver.states)
+        self.assertFalse(self.receiver.broadcaster._sendEvent.called)
+        self.assertEqual(1, METRICS['lease_requests'])
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_not_vote_when_other_receiver_holds_the_lease(self):
+        self.receiver.leases.on_lease('dev01', lease('host-b', 1))
+
+        Receiver.handle_request(self.receiver, self.event)
+
+        self.assertEqual({}, self.receiver.states)
+        self.assertFalse(self.receiver.perform_request.called)
+        self.assertEqual(1, METRICS['lease_requests_left'])
+
+    @patch('yadtreceiver.reactor')
+    def test_should_vote_without_lease(self, _):
+        Receiver.handle_request(self.receiver, self.event)
+
+        self.assertTrue('foo' in self.receiver.states)
+
+    @patch('yadtreceiver.reactor')
+    def test_should_release_lease_and_vote_when_deferring(self, _):
+        self.receiver.admission_controller = Mock()
+        self.receiver.admission_controller.decide.return_value = DEFER
+        self.receiver.leases.acquire('dev01')
+        self.receiver.release_lease = lambda target: Receiver.release_lease(self.receiver, target)
+        self.receiver.announce_lease = lambda target, payload: Receiver.announce_lease(self.receiver, target, payload)
+
+        Receiver.handle_request(self.receiver, self.event)
+
+        self.assertEqual(call('lease', data=lease('host-a', 1, duration=0), target='dev01'),
+                         self.receiver.broadcaster._sendEvent.call_args_list[0])
+        self.assertTrue('foo' in self.receiver.states)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_release_lease_and_publish_failed_when_refusing(self):
+        self.receiver.admission_controller = Mock()
+        self.receiver.admission_controller.decide.return_value = REFUSE
+        self.receiver.leases.acquire('dev01')
+        self.receiver.release_lease = lambda target: Receiver.release_lease(self.receiver, target)
+        self.receiver.announce_lease = lambda target, payload: Receiver.announce_lease(self.receiver, target, payload)
+
+        Receiver.handle_request(self.receiver, self.event)
+
+        self.assertEqual(None, self.receiver.leases.holder_of('dev01'))
+        self.assertEqual(call(self.event, '(host-a) target[dev01] request refused: host is under critical pressure'),
+                         self.receiver.publish_failed.call_args)
+        self.assertEqual({}, self.receiver.states)
+        self.assertFalse(self.receiver.perform_request.called)
+        self.assertEqual(1, METRICS['lease_requests_refused'])
+
+    @patch('yadtreceiver.log')
+    def test_should_not_publish_failed_when_refusing_without_lease(self, _):
+        self.receiver.admission_controller = Mock()
+        self.receiver.admission_controller.decide.return_value = REFUSE
+
+        Receiver.handle_request(self.receiver, self.event)
+
+        self.assertFalse(self.receiver.publish_failed.called)
+
+    @patch('yadtreceiver.log')
+    def test_should_acquire_lease_when_winning_the_vote(self, _):
+        Receiver.perform_request(self.receiver, self.event, Mock())
+
+        self.assertEqual(call('dev01', lease('host-a', 1)), self.receiver.announce_lease.call_args)
+
+    @patch('yadtreceiver.log')
+    def test_should_not_acquire_lease_when_winning_the_vote_while_draining(self, _):
+        self.receiver.drain = Drain('SIGUSR1', 600)
+
+        Receiver.perform_request(self.receiver, self.event, Mock())
+
+        self.assertFalse(self.receiver.announce_lease.called)
+        self.assertEqual(None, self.receiver.leases.holder_of('dev01'))
+
+    @patch('yadtreceiver.log')
+    def test_should_not_acquire_lease_when_running_under_it(self, _):
+        self.receiver.leases.acquire('dev01')
+
+        Receiver.perform_request(self.receiver, self.event, None)
+
+        self.assertFalse(self.receiver.announce_lease.called)
+
+    def test_should_record_lease_event(self):
+        Receiver.onEvent(self.receiver, 'dev01', {'id': 'lease', 'target': 'dev01', 'payload': lease('host-b', 1)})
+
+        self.assertEqual('host-b', self.receiver.leases.holder_of('dev01'))
+
+    @patch('yadtreceiver.reactor')
+    def test_should_renew_leases_periodically(self, mock_reactor):
+        self.receiver.leases.acquire('dev01')
+
+        Receiver.schedule_lease_renewal(self.receiver)
+
+        self.assertEqual(call(10.0, self.receiver.schedule_lease_renewal), mock_reactor.callLater.call_args)
+        self.assertEqual(call('dev01', lease('host-a', 1)), self.receiver.announce_lease.call_args)
+
+    @patch('yadtreceiver.reactor')
+    def test_should_not_renew_leases_while_draining(self, mock_reactor):
+        self.receiver.leases.acquire('dev01')
+        self.receiver.drain = Drain('SIGUSR1', 600)
+
+        Receiver.schedule_lease_renewal(self.receiver)
+
+        self.assertEqual(call(10.0, self.receiver.schedule_lease_renewal), mock_reactor.callLater.call_args)
+        self.assertFalse(self.receiver.announce_lease.called)
@@ -0,0 +1,192 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import gzip
+import os
+import unittest
+
+from os.path import basename, exists, join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from mock import ANY, call, patch
+
+from yadtreceiver import METRICS
+from yadtreceiver.logrotation import (CompressingLogFile,
+                                      GZIP,
+                                      NONE,
+                                      compress,
+                                      rotated_segments,
+                                      usable_compression)
+
+
+def read_gzip(filename):
+    compressed_file = gzip.open(filename)
+    try:
+        return compressed_file.read()
+    finally:
+        compressed_file.close()
+
+
+class CompressionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.temporary_directory)
+
+    def test_should_replace_file_with_gzip_compressed_file(self):
+        filename = join(self.temporary_directory, 'log.20130101-120000')
+        with open(filename, 'w') as log_file:
+            log_file.write('log line\n' * 100)
+
+        compressed_filename = compress(filename, GZIP)
+
+        self.assertEqual(filename + '.gz', compressed_filename)
+        self.assertFalse(exists(filename))
+        self.assertEqual('log line\n' * 100, read_gzip(compressed_filename))
+
+    def test_should_fall_back_to_gzip_for_unknown_compression(self):
+        self.assertEqual(GZIP, usable_compression('lzma'))
+
+    def test_should_list_segments_oldest_first(self):
+        for name in ('log', 'log.20130102-120000.gz', 'log.20130101-120000-1.gz', 'log.20130101-120000.gz',
+                     'log.20130103-120000', 'other.20130101-120000.gz'):
+            open(join(self.temporary_directory, name), 'w').close()
+
+        self.assertEqual(['log.20130101-120000.gz', 'log.20130101-120000-1.gz', 'log.20130102-120000.gz',
+                          'log.20130103-120000'],
+                         [basename(segment) for segment in rotated_segments(join(self.temporary_directory, 'log'))])
+
+
+class CompressingLogFileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = mkdtemp()
+        self.path = join(self.temporary_directory, 'yadtreceiver.log')
+
+    def tearDown(self):
+        rmtree(self.temporary_directory)
+
+    @patch('yadtreceiver.logrotation.reactor')
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_rotate_by_size_and_compress_in_background(self, mock_reactor):
+        log_file = CompressingLogFile.fromFullPath(self.path, rotateLength=10, maxRotatedFiles=5)
+
+        log_file.write('0123456789')
+        log_file.write('next')
+        log_file.wait_for_compression(5)
+
+        segments = rotated_segments(self.path)
+        self.assertEqual(1, len(segments))
+        self.assertTrue(segments[0].endswith('.gz'))
+        self.assertEqual('0123456789', read_gzip(segments[0]))
+        with open(self.path) as current_file:
+            self.assertEqual('next', current_file.read())
+        self.assertEqual(1, METRICS['log_rotations'])
+        self.assertFalse('log_compression_seconds' in METRICS)
+        self.assertEqual(call(log_file._record_compression_seconds, ANY), mock_reactor.callFromThread.call_args)
+
+    @patch('yadtreceiver.logrotation.compress')
+    @patch('yadtreceiver.logrotation.reactor')
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_count_compression_failures_on_reactor_thread(self, mock_reactor, mock_compress):
+        mock_compress.side_effect = IOError('disk full')
+        log_file = CompressingLogFile.fromFullPath(self.path, rotateLength=10)
+
+        log_file.write('0123456789')
+        log_file.write('next')
+        log_file.wait_for_compression(5)
+
+        self.assertEqual(call(log_file._count_compression_failure), mock_reactor.callFromThread.call_args)
+        self.assertFalse('log_compression_failures' in METRICS)
+        log_file._count_compression_failure()
+        self.assertEqual(1, METRICS['log_compression_failures'])
+
+    def test_should_keep_only_max_rotated_files(self):
+        log_file = CompressingLogFile.fromFullPath(self.path, rotateLength=1, maxRotatedFiles=2)
+
+        for line in ('a', 'b', 'c', 'd'):
+            log_file.write(line)
+        log_file.wait_for_compression(5)
+
+        self.assertEqual(['b', 'c'], [read_gzip(segment) for segment in rotated_segments(self.path)])
+
+    @patch('yadtreceiver.logrotation.time')
+    def test_should_rotate_by_time(self, mock_time):
+        mock_time.return_value = 1000
+        log_file = CompressingLogFile.fromFullPath(self.path, rotateLength=0, rotate_interval=60,
+                                                   compression=NONE)
+        log_file.write('old')
+
+        mock_time.return_value = 1059
+        self.assertFalse(log_file.shouldRotate())
+        mock_time.return_value = 1060
+        self.assertTrue(log_file.shouldRotate())
+
+    @patch('yadtreceiver.logrotation.time')
+    def test_should_rotate_continued_log_file_by_time_of_last_write(self, mock_time):
+        with open(self.path, 'w') as existing_file:
+            existing_file.write('before restart')
+        os.utime(self.path, (1000, 1000))
+        mock_time.return_value = 1030
+        log_file = CompressingLogFile.fromFullPath(self.path, rotateLength=0, rotate_interval=60,
+                                                   compression=NONE)
+
+        mock_time.return_value = 1059
+        self.assertFalse(log_file.shouldRotate())
+        mock_time.return_value = 1060
+        self.assertTrue(log_file.shouldRotate())
+
+    @patch('yadtreceiver.logrotation.threading')
+    def test_should_not_remove_segments_waiting_for_compression(self, _):
+        for name in ('20130101-120000', '20130101-120001.gz', '20130101-120002.gz'):
+            with open('%s.%s' % (self.path, name), 'w') as segment_file:
+                segment_file.write(name)
+        log_file = CompressingLogFile.fromFullPath(self.path, rotateLength=0, maxRotatedFiles=1)
+
+        log_file.remove_oldest_segments()
+
+        self.assertEqual([self.path + '.20130101-120000', self.path + '.20130101-120002.gz'],
+                         rotated_segments(self.path))
+
+    def test_should_compress_segments_left_uncompressed(self):
+        segment = self.path + '.20130101-120000'
+        with open(segment, 'w') as segment_file:
+            segment_file.write('left over')
+
+        log_file = CompressingLogFile.fromFullPath(self.path, rotateLength=0)
+        log_file.wait_for_compression(5)
+
+        self.assertEqual('left over', read_gzip(segment + '.gz'))
+        self.assertFalse(exists(segment))
+
+    @patch('yadtreceiver.logrotation.os.rename')
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_keep_writing_when_rename_fails(self, mock_rename):
+        mock_rename.side_effect = OSError('disk gone')
+        log_file = CompressingLogFile.fromFullPath(self.path, rotateLength=1)
+
+        log_file.write('a')
+        log_file.write('b')
+        log_file.close()
+
+        with open(self.path) as current_file:
+            self.assertEqual('ab', current_file.read())
+        self.assertEqual(1, METRICS['log_rotation_failures'])
+        self.assertEqual([], rotated_segments(self.path))
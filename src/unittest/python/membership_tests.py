@@ -0,0 +1,172 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+from mock import Mock, call, patch
+
+from yadtreceiver import METRICS, Receiver
+from yadtreceiver.drain import RunningCommands
+from yadtreceiver.membership import (ALIVE,
+                                     FULL_TARGETS_EVERY,
+                                     MEMBERSHIP_TOPIC,
+                                     SUSPECT,
+                                     MembershipTable,
+                                     targets_digest)
+
+
+def heartbeat(name, targets, with_targets=True, interval=5, **kwargs):
+    payload = {'receiver': name, 'targets_digest': targets_digest(targets), 'running_commands': 1,
+               'capacity': 4, 'interval': interval}
+    if with_targets:
+        payload['targets'] = sorted(targets)
+    payload.update(kwargs)
+    return payload
+
+
+class MembershipTableTests(unittest.TestCase):
+
+    def setUp(self):
+        self.membership = MembershipTable('host-a', 5, now=0)
+
+    def test_should_send_targets_only_when_changed_and_every_few_heartbeats(self):
+        heartbeats = [self.membership.heartbeat(['dev01', 'dev02'], 0, 4) for _ in range(FULL_TARGETS_EVERY + 1)]
+        changed = self.membership.heartbeat(['dev01'], 0, 4)
+
+        self.assertEqual(['dev01', 'dev02'], heartbeats[0]['targets'])
+        self.assertFalse('targets' in heartbeats[1])
+        self.assertEqual(['dev01', 'dev02'], heartbeats[FULL_TARGETS_EVERY]['targets'])
+        self.assertEqual(['dev01'], changed['targets'])
+        self.assertEqual(targets_digest(['dev01']), changed['targets_digest'])
+
+    def test_should_announce_running_commands_and_capacity(self):
+        payload = self.membership.heartbeat(['dev01'], 1, 0)
+
+        self.assertEqual(1, payload['running_commands'])
+        self.assertEqual(None, payload['capacity'])
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_record_peers_and_ignore_own_heartbeat(self):
+        self.membership.on_heartbeat(heartbeat('host-a', ['dev01']), now=1)
+        self.membership.on_heartbeat(heartbeat('host-b', ['dev01']), now=1)
+
+        self.assertEqual({'host-b': {'status': ALIVE, 'last_seen_seconds_ago': 0, 'targets': 1,
+                                     'running_commands': 1, 'capacity': 4}},
+                         self.membership.state(now=1))
+        self.assertEqual(1, METRICS['members_joined'])
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_suspect_and_then_remove_silent_peer(self):
+        self.membership.on_heartbeat(heartbeat('host-b', ['dev01']), now=0)
+
+        self.assertEqual(ALIVE, self.membership.state(now=15)['host-b']['status'])
+        self.assertEqual(SUSPECT, self.membership.state(now=16)['host-b']['status'])
+        self.membership.expire(now=50)
+        self.assertTrue('host-b' in self.membership.members)
+        self.membership.expire(now=51)
+        self.assertEqual({}, self.membership.members)
+        self.assertEqual(1, METRICS['members_dead'])
+
+    def test_should_remove_leaving_peer(self):
+        self.membership.on_heartbeat(heartbeat('host-b', ['dev01']), now=0)
+
+        self.membership.on_heartbeat(heartbeat('host-b', ['dev01'], leaving=True), now=1)
+
+        self.assertEqual({}, self.membership.members)
+
+    def test_should_know_peers_on_target(self):
+        self.membership.on_heartbeat(heartbeat('host-b', ['dev01', 'dev02']), now=60)
+        self.membership.on_heartbeat(heartbeat('host-c', ['dev02']), now=60)
+
+        self.assertEqual(['host-b'], self.membership.peers_on('dev01', now=60))
+        self.assertEqual(['host-b', 'host-c'], self.membership.peers_on('dev02', now=60))
+        self.assertTrue(self.membership.is_alone_on('dev03', now=60))
+
+    def test_should_not_know_peers_right_after_start(self):
+        self.assertEqual(None, self.membership.peers_on('dev01', now=49))
+        self.assertEqual([], self.membership.peers_on('dev01', now=50))
+
+    def test_should_not_know_peers_while_targets_of_a_peer_are_unknown(self):
+        self.membership.on_heartbeat(heartbeat('host-b', ['dev01']), now=60)
+        self.membership.on_heartbeat(heartbeat('host-b', ['dev02'], with_targets=False), now=65)
+
+        self.assertEqual(None, self.membership.peers_on('dev03', now=65))
+        self.assertFalse(self.membership.is_alone_on('dev03', now=65))
+
+    def test_should_ignore_invalid_heartbeat(self):
+        self.membership.on_heartbeat(None, now=1)
+        self.membership.on_heartbeat({'receiver': 'host-b'}, now=1)
+
+        self.assertEqual({}, self.membership.members)
+
+
+class ReceiverMembershipTests(unittest.TestCase):
+
+    def setUp(self):
+        self.receiver = Mock(Receiver)
+        self.receiver.broadcaster = Mock()
+        self.receiver.states = {}
+        self.receiver.admission_controller = None
+        self.receiver.leases = None
+        self.receiver.journal = None
+        self.receiver.drain = None
+        self.receiver.running_commands = RunningCommands()
+        self.receiver.configuration = {'hostname': 'host-a', 'allowed_targets': set(['dev01']),
+                                       'max_running_commands': 4}
+        self.receiver.membership = MembershipTable('host-a', 5, now=0)
+        self.event = Mock()
+        self.event.arguments = ['update', '--tracking-id=foo']
+        self.event.target = 'dev01'
+
+    @patch('yadtreceiver.reactor')
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_show_down_right_away_when_alone_on_target(self, mock_reactor):
+        self.receiver.membership.started_at = -100
+
+        Receiver.handle_request(self.receiver, self.event)
+
+        self.assertEqual(call(0, self.receiver.states['foo'].showdown), mock_reactor.callLater.call_args)
+        self.assertEqual(1, METRICS['showdowns_skipped'])
+
+    @patch('yadtreceiver.reactor')
+    def test_should_wait_for_showdown_when_others_share_the_target(self, mock_reactor):
+        self.receiver.membership.started_at = -100
+        self.receiver.membership.on_heartbeat(heartbeat('host-b', ['dev01']))
+
+        Receiver.handle_request(self.receiver, self.event)
+
+        self.assertEqual(call(10, self.receiver.states['foo'].showdown), mock_reactor.callLater.call_args)
+
+    def test_should_send_heartbeat_on_membership_topic(self):
+        Receiver.send_heartbeat(self.receiver)
+
+        self.assertEqual(call('heartbeat', data=heartbeat('host-a', ['dev01'], running_commands=0),
+                              target=MEMBERSHIP_TOPIC),
+                         self.receiver.broadcaster._sendEvent.call_args)
+
+    def test_should_not_send_heartbeat_while_disconnected(self):
+        self.receiver.broadcaster.client = None
+
+        Receiver.send_heartbeat(self.receiver)
+
+        self.assertFalse(self.receiver.broadcaster._sendEvent.called)
+
+    def test_should_record_heartbeat_of_peer(self):
+        Receiver.onEvent(self.receiver, MEMBERSHIP_TOPIC,
+                         {'id': 'heartbeat', 'target': MEMBERSHIP_TOPIC, 'payload': heartbeat('host-b', ['dev01'])})
+
+        self.assertEqual(['host-b'], self.receiver.membership.members.keys())
@@ -0,0 +1,91 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import sys
+import threading
+import unittest
+
+from mock import patch
+from twisted.web import http, server
+from twisted.web.test.requesthelper import DummyRequest
+
+from yadtreceiver.profiling import ProfilingResource, collapse_stack
+
+
+def create_request(postpath, token='secret', **args):
+    request = DummyRequest(postpath)
+    if token:
+        request.requestHeaders.setRawHeaders('Authorization', ['Bearer %s' % token])
+    request.args = dict((name, [value]) for name, value in args.items())
+    return request
+
+
+@patch('yadtreceiver.profiling.log')
+class ProfilingResourceTests(unittest.TestCase):
+
+    def setUp(self):
+        self.resource = ProfilingResource('secret', max_seconds=10)
+
+    def test_should_refuse_requests_without_token(self, _):
+        request = create_request(['stacks'], token=None)
+
+        self.resource.render_GET(request)
+
+        self.assertEqual(http.UNAUTHORIZED, request.responseCode)
+
+    def test_should_refuse_requests_with_wrong_token(self, _):
+        request = create_request(['stacks'], token='guessed')
+
+        self.resource.render_GET(request)
+
+        self.assertEqual(http.UNAUTHORIZED, request.responseCode)
+
+    def test_should_dump_stacks_of_all_threads(self, _):
+        stacks = self.resource.render_GET(create_request(['stacks']))
+
+        self.assertTrue('Thread %s' % threading.current_thread().name in stacks)
+        self.assertTrue('test_should_dump_stacks_of_all_threads' in stacks)
+
+    @patch('yadtreceiver.profiling.reactor')
+    def test_should_return_pstats_after_capture(self, mock_reactor, _):
+        request = create_request(['cprofile'], seconds='60')
+
+        self.assertEqual(server.NOT_DONE_YET, self.resource.render_GET(request))
+        seconds, finish = mock_reactor.callLater.call_args[0]
+        finish()
+
+        self.assertEqual(10, seconds)
+        self.assertTrue('function calls' in ''.join(request.written))
+        self.assertEqual(1, request.finished)
+        self.assertFalse(self.resource.capturing)
+
+    @patch('yadtreceiver.profiling.reactor')
+    def test_should_allow_only_one_capture_at_a_time(self, mock_reactor, _):
+        self.resource.render_GET(create_request(['sample'], seconds='1'))
+        request = create_request(['cprofile'])
+
+        self.resource.render_GET(request)
+        mock_reactor.callLater.call_args[0][1]()
+
+        self.assertEqual(http.CONFLICT, request.responseCode)
+
+    def test_should_collapse_stack_from_outermost_to_innermost(self, _):
+        stack = collapse_stack(sys._getframe())
+
+        innermost = stack.split(';')[-1]
+        self.assertTrue(innermost.startswith('test_should_collapse_stack_from_outermost_to_innermost ('))
+        self.assertTrue(len(stack.split(';')) > 1)
@@ -17,6 +17,7 @@
 
 __author__ = 'Michael Gruber'
 
+import signal
 import unittest
 
 from StringIO import StringIO
@@ -44,6 +45,7 @@ class ProcessProtocolTests (unittest.TestCase):
         mock_reason = Mock()
         mock_reason.value.exitCode = 123
         mock_protocol = Mock(ProcessProtocol)
+        mock_protocol.timed_out = False
 
         ProcessProtocol.processExited(mock_protocol, mock_reason)
 
@@ -53,11 +55,79 @@ class ProcessProtocolTests (unittest.TestCase):
         mock_reason = Mock()
         mock_reason.value.exitCode = 0
         mock_protocol = Mock(ProcessProtocol)
+        mock_protocol.timed_out = False
 
         ProcessProtocol.processExited(mock_protocol, mock_reason)
 
         self.assertEquals(call(), mock_protocol.publish_finished.call_args)
 
+    def test_should_publish_timeout_when_process_timed_out(self):
+        mock_reason = Mock()
+        mock_reason.value.exitCode = None
+        mock_protocol = Mock(ProcessProtocol)
+        mock_protocol.timed_out = True
+
+        ProcessProtocol.processExited(mock_protocol, mock_reason)
+
+        self.assertEquals(call(None, reason='timeout'), mock_protocol.publish_failed.call_args)
+        self.assertTrue(mock_protocol.cancel_timeout.called)
+
+    @patch('yadtreceiver.protocols.log')
+    @patch('yadtreceiver.protocols.reactor')
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_terminate_process_group_and_schedule_kill(self, mock_reactor, _):
+        protocol = ProcessProtocol('hostname', Mock(), 'dev123', '/usr/bin/python abc')
+        protocol.transport = Mock()
+        protocol.transport.pid = 4711
+        protocol.signal_process_group = Mock()
+
+        protocol.terminate(60, 10)
+
+        self.assertTrue(protocol.timed_out)
+        self.assertEqual(call(signal.SIGTERM), protocol.signal_process_group.call_args)
+        self.assertEqual(call(10, protocol.kill), mock_reactor.callLater.call_args)
+        self.assertEqual(1, METRICS['commands_timed_out.dev123'])
+
+        protocol.kill()
+
+        self.assertEqual(call(signal.SIGKILL), protocol.signal_process_group.call_args)
+
+    @patch('yadtreceiver.protocols.os')
+    def test_should_signal_process_group_when_process_leads_it(self, mock_os):
+        mock_protocol = Mock(ProcessProtocol)
+        mock_protocol.transport = Mock()
+        mock_protocol.transport.pid = 4711
+        mock_os.getpgid.return_value = 4711
+
+        ProcessProtocol.signal_process_group(mock_protocol, signal.SIGTERM)
+
+        self.assertEqual(call(4711, signal.SIGTERM), mock_os.killpg.call_args)
+        self.assertFalse(mock_os.kill.called)
+
+    @patch('yadtreceiver.protocols.os')
+    def test_should_signal_only_process_when_it_does_not_lead_a_group(self, mock_os):
+        mock_protocol = Mock(ProcessProtocol)
+        mock_protocol.transport = Mock()
+        mock_protocol.transport.pid = 4711
+        mock_os.getpgid.return_value = 1
+
+        ProcessProtocol.signal_process_group(mock_protocol, signal.SIGTERM)
+
+        self.assertEqual(call(4711, signal.SIGTERM), mock_os.kill.call_args)
+        self.assertFalse(mock_os.killpg.called)
+
+    @patch('yadtreceiver.protocols.log')
+    def test_should_call_exit_callbacks(self, _):
+        protocol = ProcessProtocol('hostname', Mock(), 'dev123', '/usr/bin/python abc')
+        failing_callback = Mock(side_effect=RuntimeError('Booom!'))
+        callback = Mock()
+        protocol.add_exit_callback(failing_callback)
+        protocol.add_exit_callback(callback)
+
+        protocol.notify_exit()
+
+        self.assertEqual(call(), callback.call_args)
+
     @patch.dict('yadtreceiver.METRICS', {}, clear=True)
     def test_should_publish_finished_event(self):
         mock_protocol = Mock(ProcessProtocol)
@@ -87,6 +157,8 @@ class ProcessProtocolTests (unittest.TestCase):
         mock_protocol.tracking_id = 'tracking_id'
         mock_protocol.error_buffer = StringIO(
             'Someone has shut down the internet.')
+        mock_protocol.failure_output = None
+        mock_protocol.output_file = None
 
         ProcessProtocol.publish_failed(mock_protocol, 123)
 
@@ -110,3 +182,12 @@ class ProcessProtocolTests (unittest.TestCase):
         protocol.errReceived('baz')
 
         self.assertEqual('foo\nbarbaz', protocol.error_buffer.getvalue())
+
+    def test_should_record_exit_in_journal(self):
+        mock_journal = Mock()
+        protocol = ProcessProtocol(
+            'hostname', Mock(), 'devabc123', '/usr/bin/python abc 123', tracking_id='tracking-id', journal=mock_journal)
+
+        protocol.record_exit(42)
+
+        self.assertEqual(call('tracking-id', 42), mock_journal.exited.call_args)
@@ -1,9 +1,13 @@
+import os
 from unittest import TestCase
 
+from shutil import rmtree
+from tempfile import mkdtemp
+
 from mock import patch, Mock
 from psutil import AccessDenied
 
-from yadtreceiver.psutil_wrapper import get_processes, safe_access
+from yadtreceiver.psutil_wrapper import get_processes, get_python_processes_containing, safe_access
 
 
 class SafeWrapperTests(TestCase):
@@ -70,3 +74,92 @@ class BackwardsCompatibilityTests(TestCase):
         self.assertEqual(actual_processes[0].name(), "python")
         self.assertEqual(actual_processes[0].cmdline(), ["foo", "bar"])
         self.assertEqual(actual_processes[0].cwd(), "/any/dir")
+
+    @patch("yadtreceiver.psutil_wrapper.psutil")
+    def test_should_cache_name_and_cwd(self, psutil):
+        p1 = Mock()
+        p1.name.return_value = "python"
+        p1.cwd.return_value = "/any/dir"
+        psutil.process_iter.return_value = [p1]
+
+        process = list(get_processes())[0]
+        process.name()
+        process.cwd()
+
+        self.assertEqual(process.name(), "python")
+        self.assertEqual(process.cwd(), "/any/dir")
+        self.assertEqual(p1.name.call_count, 1)
+        self.assertEqual(p1.cwd.call_count, 1)
+
+    @patch("yadtreceiver.psutil_wrapper.psutil")
+    def test_should_fetch_attributes_in_one_pass(self, psutil):
+        p1 = Mock()
+        p1.pid = 42
+        p1.info = {"name": "python", "cmdline": ["python", "yadtshell"]}
+        psutil.process_iter.return_value = [p1]
+
+        process = list(get_processes(attrs=["name", "cmdline"]))[0]
+
+        self.assertEqual(process.name(), "python")
+        self.assertEqual(process.cmdline(), ["python", "yadtshell"])
+        psutil.process_iter.assert_called_with(attrs=["name", "cmdline"])
+        self.assertFalse(p1.name.called)
+        self.assertFalse(p1.cmdline.called)
+
+    @patch("yadtreceiver.psutil_wrapper.psutil")
+    def test_should_fall_back_when_psutil_does_not_support_attrs(self, psutil):
+        p1 = Mock()
+        p1.pid = 42
+        p1.name.return_value = "python"
+
+        def process_iter(**kwargs):
+            if kwargs:
+                raise TypeError("unexpected keyword argument")
+            return [p1]
+        psutil.process_iter.side_effect = process_iter
+
+        process = list(get_processes(attrs=["name"]))[0]
+
+        self.assertEqual(process.name(), "python")
+
+
+def create_proc_entry(proc_directory, pid, name, cmdline, cwd):
+    process_directory = os.path.join(proc_directory, str(pid))
+    os.makedirs(process_directory)
+    with open(os.path.join(process_directory, "comm"), "w") as comm_file:
+        comm_file.write(name + "\n")
+    with open(os.path.join(process_directory, "cmdline"), "w") as cmdline_file:
+        cmdline_file.write("\0".join(cmdline) + "\0")
+    os.symlink(cwd, os.path.join(process_directory, "cwd"))
+
+
+class ProcFilesystemTests(TestCase):
+
+    def setUp(self):
+        self.proc_directory = mkdtemp()
+        os.makedirs(os.path.join(self.proc_directory, "self"))
+        create_proc_entry(self.proc_directory, 1, "init", ["/sbin/init"], "/")
+        create_proc_entry(self.proc_directory, 42, "python",
+                          ["/usr/bin/python", "/usr/bin/yadtshell", "status"], "/etc/yadtshell/targets/dev01")
+        create_proc_entry(self.proc_directory, 43, "less", ["less", "/usr/bin/yadtshell"], "/tmp")
+
+    def tearDown(self):
+        rmtree(self.proc_directory)
+
+    def test_should_find_python_processes_running_the_script(self):
+        processes = get_python_processes_containing("/usr/bin/yadtshell", self.proc_directory)
+
+        self.assertEqual([42], [p.pid for p in processes])
+        self.assertEqual(["/usr/bin/python", "/usr/bin/yadtshell", "status"], processes[0].cmdline())
+        self.assertEqual("/etc/yadtshell/targets/dev01", processes[0].cwd())
+
+    def test_should_ignore_processes_which_vanished(self):
+        rmtree(os.path.join(self.proc_directory, "42"))
+
+        self.assertEqual([], get_python_processes_containing("/usr/bin/yadtshell", self.proc_directory))
+
+    def test_should_return_unknown_cwd_when_not_accessible(self):
+        processes = get_python_processes_containing("/usr/bin/yadtshell", self.proc_directory)
+        os.remove(os.path.join(self.proc_directory, "42", "cwd"))
+
+        self.assertEqual("unknown", processes[0].cwd())
@@ -0,0 +1,166 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+from mock import Mock, patch
+
+from yadtreceiver import METRICS, Receiver
+from yadtreceiver.lease import LeaseTable
+from yadtreceiver.ratelimit import RequestRateLimiter, TokenBucket, parse_rate_limit
+
+
+class ParseRateLimitTests(unittest.TestCase):
+
+    def test_should_parse_requests_per_seconds(self):
+        self.assertEqual((10, 60), parse_rate_limit('10/60'))
+        self.assertEqual((1, 0.5), parse_rate_limit(' 1/0.5 '))
+        self.assertEqual(None, parse_rate_limit('0'))
+
+    def test_should_reject_invalid_limits(self):
+        for value in ('10', '10/0', '0/60', 'ten/60', '10/sixty'):
+            self.assertRaises(ValueError, parse_rate_limit, value)
+
+
+class TokenBucketTests(unittest.TestCase):
+
+    def test_should_allow_burst_and_refill_over_time(self):
+        bucket = TokenBucket((2, 10), now=100)
+
+        for _ in range(2):
+            self.assertTrue(bucket.has_token(now=100))
+            bucket.take()
+        self.assertFalse(bucket.has_token(now=104))
+        self.assertTrue(bucket.has_token(now=105))
+
+    def test_should_not_refill_above_capacity(self):
+        bucket = TokenBucket((2, 10), now=100)
+
+        bucket.refill(now=1000)
+
+        self.assertEqual(2, bucket.tokens)
+
+
+class RequestRateLimiterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.limiter = RequestRateLimiter()
+
+    def test_should_pass_requests_without_limits(self):
+        for _ in range(100):
+            self.assertEqual(None, self.limiter.take('dev01', None, {}, now=100))
+
+    def test_should_limit_each_target_separately(self):
+        target_limits = {'dev*': (1, 60)}
+
+        self.assertEqual(None, self.limiter.take('dev01', None, target_limits, now=100))
+        self.assertEqual('dev*:1/60', self.limiter.take('dev01', None, target_limits, now=100))
+        self.assertEqual(None, self.limiter.take('dev02', None, target_limits, now=100))
+        self.assertEqual(None, self.limiter.take('pro01', None, target_limits, now=100))
+        self.assertEqual(None, self.limiter.take('dev01', None, target_limits, now=160))
+
+    def test_should_limit_all_targets_together(self):
+        self.assertEqual(None, self.limiter.take('dev01', (2, 60), {}, now=100))
+        self.assertEqual(None, self.limiter.take('dev02', (2, 60), {}, now=100))
+        self.assertEqual('global:2/60', self.limiter.take('pro01', (2, 60), {}, now=100))
+
+    def test_should_not_take_global_token_when_target_limit_is_exhausted(self):
+        target_limits = {'dev*': (1, 60)}
+        self.limiter.take('dev01', (2, 60), target_limits, now=100)
+
+        self.assertEqual('dev*:1/60', self.limiter.take('dev01', (2, 60), target_limits, now=100))
+        self.assertEqual(None, self.limiter.take('pro01', (2, 60), target_limits, now=100))
+
+    def test_should_start_full_bucket_when_limit_changes(self):
+        self.limiter.take('dev01', (1, 60), {}, now=100)
+
+        self.assertEqual(None, self.limiter.take('dev01', (5, 60), {}, now=100))
+
+
+class ReceiverRateLimitTests(unittest.TestCase):
+
+    def setUp(self):
+        self.receiver = Mock(Receiver)
+        self.receiver.configuration = {'hostname': 'host', 'request_rate_limit': None,
+                                       'target_request_rate_limits': {'dev*': (1, 60)}}
+        self.receiver.rate_limiter = RequestRateLimiter()
+        self.receiver.leases = None
+        self.receiver.membership = None
+        self.receiver.drain = None
+        self.receiver.states = {}
+        self.receiver.broadcaster = Mock()
+        self.event = Mock(target='dev01', arguments=['update', '--tracking-id=foo'])
+        METRICS['requests_rate_limited'] = 0
+        METRICS['requests_rate_limited.dev01'] = 0
+
+    @patch('yadtreceiver.reactor')
+    def test_should_vote_on_rejection_when_rate_limited(self, _):
+        self.receiver.vote_on_rejection = lambda event, message: Receiver.vote_on_rejection(
+            self.receiver, event, message)
+        self.assertFalse(Receiver.reject_if_rate_limited(self.receiver, self.event))
+        self.assertTrue(Receiver.reject_if_rate_limited(self.receiver, self.event))
+
+        self.assertFalse(self.receiver.publish_failed.called)
+        self.assertTrue('foo' in self.receiver.states)
+        self.assertEqual(1, METRICS['requests_rate_limited'])
+        self.assertEqual(1, METRICS['requests_rate_limited.dev01'])
+
+        self.receiver.states['foo'].showdown()
+
+        self.receiver.publish_failed.assert_called_once_with(
+            self.event, '(host) target[dev01] request rate limited: limit dev*:1/60 exceeded')
+        self.assertEqual({}, self.receiver.states)
+
+    @patch('yadtreceiver.reactor')
+    def test_should_not_publish_rejection_when_vote_is_lost(self, _):
+        Receiver.vote_on_rejection(self.receiver, self.event, 'rate limited')
+        fsm = self.receiver.states['foo']
+
+        fsm.fold()
+        fsm.showdown()
+
+        self.assertFalse(self.receiver.publish_failed.called)
+        self.assertEqual({}, self.receiver.states)
+
+    def test_should_publish_failed_event_when_holding_the_lease(self):
+        self.receiver.leases = LeaseTable('host', 30, settle_seconds=0)
+        self.receiver.leases.acquire('dev01')
+        Receiver.reject_if_rate_limited(self.receiver, self.event)
+
+        self.assertTrue(Receiver.reject_if_rate_limited(self.receiver, self.event))
+
+        self.receiver.publish_failed.assert_called_once_with(
+            self.event, '(host) target[dev01] request rate limited: limit dev*:1/60 exceeded')
+        self.assertFalse(self.receiver.vote_on_rejection.called)
+
+    def test_should_leave_rejection_to_lease_holder(self):
+        self.receiver.leases = LeaseTable('host', 30, settle_seconds=0)
+        self.receiver.leases.on_lease('dev01', {'holder': 'other-host', 'term': 1, 'duration': 30})
+        Receiver.reject_if_rate_limited(self.receiver, self.event)
+
+        self.assertTrue(Receiver.reject_if_rate_limited(self.receiver, self.event))
+
+        self.assertFalse(self.receiver.publish_failed.called)
+        self.assertFalse(self.receiver.vote_on_rejection.called)
+        self.assertEqual(1, METRICS['requests_rate_limited'])
+
+    def test_should_not_create_voting_state_for_rate_limited_request(self):
+        self.receiver.reject_if_rate_limited.return_value = True
+
+        Receiver.onEvent(self.receiver, 'dev01', {'id': 'request', 'cmd': 'update', 'args': ['update']})
+
+        self.assertFalse(self.receiver.handle_request.called)
@@ -0,0 +1,124 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from mock import Mock, patch
+
+from yadtreceiver import METRICS
+from yadtreceiver.recorder import EventRecorder, read_recording, recording_files
+from yadtreceiver.replay import Replay, StubExecutor
+
+
+def request(tracking_id):
+    return {'id': 'request', 'tracking_id': tracking_id, 'target': 'dev01', 'cmd': 'yadtshell',
+            'args': ['status', '--tracking-id=%s' % tracking_id]}
+
+
+class EventRecorderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = mkdtemp()
+        self.recording_file = join(self.temporary_directory, 'recordings', 'events')
+
+    def tearDown(self):
+        rmtree(self.temporary_directory)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_read_recorded_events_in_order(self):
+        recorder = EventRecorder(self.recording_file, 1024 * 1024, 3)
+
+        recorder.record('dev01', request('abc'), 1.5)
+        recorder.record(None, {'id': 'heartbeat'}, 2.5)
+        recorder.close()
+
+        self.assertEqual([(1.5, 'dev01', request('abc')), (2.5, None, {'id': 'heartbeat'})],
+                         list(read_recording(self.recording_file)))
+        self.assertEqual(2, METRICS['events_recorded'])
+
+    def test_should_read_rotated_files_oldest_first(self):
+        recorder = EventRecorder(self.recording_file, 100, 10)
+
+        for number in range(5):
+            recorder.record('dev01', request('id-%d' % number), number)
+        recorder.close()
+
+        self.assertTrue(len(recording_files(self.recording_file)) > 1)
+        self.assertEqual([0, 1, 2, 3, 4], [arrived_at for arrived_at, _, _ in read_recording(self.recording_file)])
+
+    def test_should_skip_truncated_event(self):
+        recorder = EventRecorder(self.recording_file, 1024 * 1024, 3)
+        recorder.record('dev01', request('abc'), 1)
+        recorder.close()
+        with open(self.recording_file, 'a') as recording:
+            recording.write('[2,"dev01",{"id":')
+
+        self.assertEqual(1, len(list(read_recording(self.recording_file))))
+
+
+@patch('yadtreceiver.reactor')
+class ReplayTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.temporary_directory)
+
+    @patch('yadtreceiver.log')
+    def test_should_report_handling_time_per_event_type(self, _, __):
+        recorded_events = [(1, 'dev01', request('abc')),
+                           (2, 'dev01', {'id': 'vote', 'tracking_id': 'abc', 'payload': 'zzz'}),
+                           (3, None, {'id': 'heartbeat', 'target': 'dev01'})]
+        replay = Replay(recorded_events, 0, 0, self.temporary_directory)
+
+        replay.start()
+        report = replay.report()
+
+        self.assertEqual(3, report['events'])
+        self.assertEqual(['heartbeat', 'request', 'vote'], sorted(report['event_types']))
+        self.assertEqual(1, report['event_types']['vote']['events'])
+        self.assertEqual({'vote': 1}, report['published'])
+
+    @patch('yadtreceiver.replay.reactor')
+    @patch('yadtreceiver.log')
+    def test_should_spawn_commands_of_events_recorded_without_target(self, _, __, ___):
+        replay = Replay([(1, None, request('abc'))], 0, 0, self.temporary_directory)
+
+        replay.start()
+        replay.receiver.states['abc'].showdown()
+        report = replay.report()
+
+        self.assertEqual(1, report['commands_spawned'])
+        self.assertEqual({'vote': 1, 'cmd.started': 1}, report['published'])
+
+    @patch('yadtreceiver.replay.reactor')
+    def test_should_let_stub_commands_succeed(self, mock_replay_reactor, _):
+        executor = StubExecutor(5)
+        process_protocol = Mock()
+
+        process = executor.spawnProcess(process_protocol, '/usr/bin/python', ['/usr/bin/python'])
+        finish = mock_replay_reactor.callLater.call_args[0]
+        finish[1](*finish[2:])
+
+        self.assertEqual(1, process.pid)
+        self.assertEqual(5, finish[0])
+        self.assertEqual(0, process_protocol.processExited.call_args[0][0].value.exitCode)
@@ -0,0 +1,178 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import unittest
+
+from os.path import exists, join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from mock import Mock, call, patch
+from twisted.internet.defer import succeed
+from twisted.web.test.requesthelper import DummyRequest
+
+from yadtreceiver import METRICS, Receiver
+from yadtreceiver.app_status import RunOutputResource
+from yadtreceiver.run_output import PRUNE_INTERVAL, RunOutputStore, read_tail
+
+
+class RunOutputStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = mkdtemp()
+        self.directory = join(self.temporary_directory, 'runs')
+        self.store = RunOutputStore(self.directory, max_bytes=100, max_age=60)
+
+    def tearDown(self):
+        rmtree(self.temporary_directory)
+
+    def write_output(self, tracking_id, output):
+        output_fd = self.store.open(tracking_id)
+        os.write(output_fd, output)
+        os.close(output_fd)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_append_output_of_a_run_to_its_file(self):
+        self.write_output('id-1', 'first ')
+        self.write_output('id-1', 'second')
+
+        self.assertEqual('first second', self.store.tail('id-1'))
+        self.assertEqual(2, METRICS['run_outputs'])
+
+    def test_should_return_only_the_tail(self):
+        self.write_output('id-1', 'head' + 'x' * 50 + 'tail')
+
+        self.assertEqual('xxtail', self.store.tail('id-1', 6))
+
+    def test_should_not_open_output_of_invalid_tracking_id(self):
+        self.assertEqual(None, self.store.open('../../etc/passwd'))
+        self.assertEqual(None, self.store.tail('../../etc/passwd'))
+
+    def test_should_return_none_for_unknown_run(self):
+        self.assertEqual(None, RunOutputStore(self.directory).tail('id-1'))
+
+    def test_should_remove_oldest_outputs_until_they_fit(self):
+        for tracking_id in ('id-1', 'id-2', 'id-3'):
+            self.write_output(tracking_id, 'x' * 40)
+        for age, tracking_id in ((30, 'id-1'), (20, 'id-2'), (10, 'id-3')):
+            modified = 1000 - age
+            os.utime(self.store.filename(tracking_id), (modified, modified))
+
+        self.assertEqual(1, self.store.prune(now=1000))
+
+        self.assertFalse(exists(self.store.filename('id-1')))
+        self.assertTrue(exists(self.store.filename('id-2')))
+        self.assertTrue(exists(self.store.filename('id-3')))
+
+    def test_should_remove_outputs_older_than_max_age(self):
+        self.write_output('id-1', 'old')
+        self.write_output('id-2', 'new')
+        os.utime(self.store.filename('id-1'), (900, 900))
+        os.utime(self.store.filename('id-2'), (990, 990))
+
+        self.store.prune(now=1000)
+
+        self.assertFalse(exists(self.store.filename('id-1')))
+        self.assertTrue(exists(self.store.filename('id-2')))
+
+    def test_should_prune_only_when_asked(self):
+        self.write_output('id-1', 'x' * 80)
+        self.write_output('id-2', 'x' * 80)
+
+        self.assertTrue(exists(self.store.filename('id-1')))
+        self.assertEqual(1, self.store.prune())
+        self.assertFalse(exists(self.store.filename('id-1')))
+
+    def test_should_not_prune_missing_directory(self):
+        self.assertEqual(0, RunOutputStore(join(self.directory, 'missing')).prune())
+
+
+class ReceiverRunOutputTests(unittest.TestCase):
+
+    @patch('yadtreceiver.reactor')
+    @patch('yadtreceiver.threads')
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_prune_in_worker_thread_and_count_on_reactor(self, mock_threads, mock_reactor):
+        receiver = Mock(Receiver)
+        receiver.run_output = Mock()
+        mock_threads.deferToThread.return_value = succeed(2)
+
+        Receiver.prune_run_outputs(receiver)
+
+        self.assertEqual(call(receiver.run_output.prune), mock_threads.deferToThread.call_args)
+        self.assertEqual(2, METRICS['run_outputs_pruned'])
+        self.assertEqual(call(PRUNE_INTERVAL, receiver.prune_run_outputs), mock_reactor.callLater.call_args)
+
+
+class ReadTailTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = mkdtemp()
+        self.filename = join(self.temporary_directory, 'output')
+
+    def tearDown(self):
+        rmtree(self.temporary_directory)
+
+    def test_should_read_whole_file_when_it_is_shorter(self):
+        with open(self.filename, 'w') as output_file:
+            output_file.write('short')
+
+        self.assertEqual('short', read_tail(self.filename, 100))
+
+
+class RunOutputResourceTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = mkdtemp()
+        self.receiver = Mock()
+        self.receiver.run_output = RunOutputStore(self.temporary_directory)
+        output_fd = self.receiver.run_output.open('id-1')
+        os.write(output_fd, 'some output of the run')
+        os.close(output_fd)
+
+    def tearDown(self):
+        rmtree(self.temporary_directory)
+
+    def test_should_serve_tail_of_the_output(self):
+        request = DummyRequest(['id-1'])
+        request.args = {'bytes': ['7']}
+
+        self.assertEqual('the run', RunOutputResource(self.receiver).render_GET(request))
+
+    def test_should_answer_not_found_for_unknown_tracking_id(self):
+        request = DummyRequest(['id-2'])
+
+        RunOutputResource(self.receiver).render_GET(request)
+
+        self.assertEqual(404, request.responseCode)
+
+    def test_should_answer_not_found_without_run_outputs(self):
+        self.receiver.run_output = None
+        request = DummyRequest(['id-1'])
+
+        RunOutputResource(self.receiver).render_GET(request)
+
+        self.assertEqual(404, request.responseCode)
+
+    def test_should_answer_bad_request_for_invalid_byte_count(self):
+        request = DummyRequest(['id-1'])
+        request.args = {'bytes': ['many']}
+
+        RunOutputResource(self.receiver).render_GET(request)
+
+        self.assertEqual(400, request.responseCode)
@@ -0,0 +1,134 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+from mock import Mock, call, patch
+
+from yadtreceiver import METRICS, Receiver
+from yadtreceiver.events import Event
+from yadtreceiver.scheduler import RequestScheduler
+
+
+@patch('yadtreceiver.scheduler.log', Mock())
+class RequestSchedulerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.started = []
+        self.scheduler = RequestScheduler(1, {'high': 3, 'low': 1})
+
+    def submit(self, priority_class, name):
+        self.scheduler.submit(priority_class, lambda: self.started.append(name))
+
+    def test_should_start_request_when_slot_is_free(self):
+        self.submit('low', 'low-1')
+
+        self.assertEqual(['low-1'], self.started)
+        self.assertEqual(1, self.scheduler.running)
+
+    def test_should_queue_request_when_all_slots_are_busy(self):
+        self.submit('low', 'low-1')
+        self.submit('high', 'high-1')
+
+        self.assertEqual(['low-1'], self.started)
+        self.assertEqual({'running': 1, 'max_running': 1, 'queued': {'high': 1, 'low': 0}}, self.scheduler.state())
+
+    def test_should_prefer_higher_classes_without_starving_lower_classes(self):
+        self.submit('low', 'running')
+        for _ in range(8):
+            self.submit('low', 'low')
+            self.submit('high', 'high')
+
+        for _ in range(8):
+            self.scheduler.release()
+
+        self.assertEqual(['running', 'high', 'high', 'low', 'high', 'high', 'high', 'low', 'high'], self.started)
+
+    def test_should_release_slot_when_start_releases_right_away(self):
+        scheduler = RequestScheduler(1, {'normal': 1})
+        scheduler.submit('normal', scheduler.release)
+        scheduler.submit('normal', lambda: self.started.append('second'))
+
+        self.assertEqual(['second'], self.started)
+        self.assertEqual(1, scheduler.running)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    @patch('yadtreceiver.scheduler.time')
+    def test_should_record_queue_wait_per_class(self, mock_time):
+        mock_time.return_value = 100
+        self.submit('low', 'low-1')
+        self.submit('high', 'high-1')
+        mock_time.return_value = 107
+
+        self.scheduler.release()
+
+        self.assertEqual(7, METRICS['queue_wait_seconds.high'])
+        self.assertEqual(1, METRICS['queue_waits.high'])
+        self.assertEqual(0, METRICS['queue_wait_seconds.low'])
+
+
+class PriorityClassTests(unittest.TestCase):
+
+    def setUp(self):
+        self.receiver = Receiver()
+        self.receiver.configuration = {'priority_classes': {'high': 9, 'normal': 3, 'low': 1},
+                                       'default_priority_class': 'normal',
+                                       'command_priorities': {'status': 'low', 'update': 'high'},
+                                       'target_priorities': {'dev*': 'low', 'devspecial': 'unknown'}}
+        self.event = Mock(Event)
+
+    def test_should_use_highest_configured_priority_class(self):
+        self.event.target = 'dev123'
+        self.event.arguments = ['update']
+
+        self.assertEqual('high', self.receiver.get_priority_class(self.event))
+
+    def test_should_use_priority_class_of_target(self):
+        self.event.target = 'devspecial'
+        self.event.arguments = ['info']
+
+        self.assertEqual('low', self.receiver.get_priority_class(self.event))
+
+    def test_should_use_default_priority_class(self):
+        self.event.target = 'pro123'
+        self.event.arguments = ['info']
+
+        self.assertEqual('normal', self.receiver.get_priority_class(self.event))
+
+    def test_should_only_use_priority_classes_of_the_scheduler_queues(self):
+        self.receiver.scheduler = RequestScheduler(1, {'high': 9, 'normal': 3}, 'normal')
+        self.receiver.configuration['priority_classes'] = {'urgent': 20, 'low': 1}
+        self.receiver.configuration['default_priority_class'] = 'low'
+        self.receiver.configuration['command_priorities'] = {'update': 'urgent'}
+        self.event.target = 'pro123'
+        self.event.arguments = ['update']
+
+        self.assertEqual('normal', self.receiver.get_priority_class(self.event))
+
+    def test_should_release_slot_when_command_exits(self):
+        self.receiver.scheduler = Mock(RequestScheduler)
+        self.receiver.perform_request = Mock()
+        self.receiver.get_priority_class = Mock(return_value='high')
+
+        self.receiver.schedule_request(self.event, 'fsm-event')
+        start = self.receiver.scheduler.submit.call_args[0][1]
+        start()
+
+        self.assertEqual(call('high', start), self.receiver.scheduler.submit.call_args)
+        self.assertEqual(call(self.event, 'fsm-event'), self.receiver.perform_request.call_args)
+        self.assertEqual(call(self.receiver.scheduler.release),
+                         self.receiver.perform_request.return_value.add_exit_callback.call_args)
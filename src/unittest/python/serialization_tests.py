@@ -0,0 +1,62 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+from autobahn.wamp import serializer
+from mock import patch
+
+from yadtreceiver import METRICS
+from yadtreceiver.serialization import NegotiatingWampBroadcaster, create_wamp_serializers
+
+
+class CreateWampSerializersTests(unittest.TestCase):
+
+    @patch('yadtreceiver.serialization.log')
+    def test_should_always_offer_json_last(self, _):
+        serializers = create_wamp_serializers(['unknown'])
+
+        self.assertEqual([serializer.JsonSerializer], [type(known) for known in serializers])
+
+    def test_should_offer_json_only_once(self):
+        serializers = create_wamp_serializers(['json', 'json'])
+
+        self.assertEqual(1, len(serializers))
+
+    @patch('yadtreceiver.serialization.serializer')
+    def test_should_offer_serializers_in_configured_order(self, mock_serializer):
+        mock_serializer.MsgPackSerializer = type('MsgPackSerializer', (object,), {})
+        mock_serializer.JsonSerializer = type('JsonSerializer', (object,), {})
+
+        serializers = create_wamp_serializers(['msgpack', 'json'])
+
+        self.assertEqual(['MsgPackSerializer', 'JsonSerializer'], [type(known).__name__ for known in serializers])
+
+
+class NegotiatingWampBroadcasterTests(unittest.TestCase):
+
+    @patch('yadtbroadcastclient.reactor')
+    @patch.object(NegotiatingWampBroadcaster, '_connect')
+    @patch('yadtreceiver.serialization.log')
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_count_sessions_by_negotiated_serializer(self, _, __, ___):
+        broadcaster = NegotiatingWampBroadcaster('host', 8081, 'yadtreceiver', ['msgpack'])
+
+        broadcaster.onSerializerNegotiated('json')
+
+        self.assertEqual('json', broadcaster.negotiated_serializer)
+        self.assertEqual(1, METRICS['broadcaster_sessions.json'])
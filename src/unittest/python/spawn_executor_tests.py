@@ -0,0 +1,182 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import base64
+import json
+import signal
+import tempfile
+import unittest
+
+from mock import Mock, call, patch
+from twisted.internet import error
+
+from yadtreceiver import METRICS, Receiver
+from yadtreceiver.spawn_executor import SpawnHelperExecutor, exit_reason, output_path
+
+
+class ExitReasonTests(unittest.TestCase):
+
+    def test_should_translate_wait_status(self):
+        self.assertTrue(exit_reason(0).check(error.ProcessDone))
+        self.assertEqual(3, exit_reason(3 << 8).value.exitCode)
+        self.assertEqual(signal.SIGKILL, exit_reason(signal.SIGKILL).value.signal)
+        self.assertEqual(None, exit_reason(signal.SIGKILL).value.exitCode)
+
+    def test_should_find_path_of_open_file(self):
+        with tempfile.NamedTemporaryFile() as output_file:
+            self.assertEqual(output_file.name, output_path(output_file.fileno()))
+        self.assertEqual(None, output_path(9999))
+
+
+class SpawnHelperExecutorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = SpawnHelperExecutor()
+        self.executor.helper = Mock()
+        self.process_protocol = Mock()
+
+    def spawn(self):
+        spawned = self.executor.spawnProcess(self.process_protocol, '/bin/sh', ['sh', '-c', 'true'],
+                                             env={}, path='/tmp')
+        self.executor.on_reply({'op': 'spawned', 'id': 1, 'pid': 4711})
+        return spawned
+
+    def test_should_send_spawn_request_to_helper(self):
+        self.executor.spawnProcess(self.process_protocol, '/bin/sh', ['sh', '-c', 'true'], env={}, path='/tmp')
+
+        request = json.loads(self.executor.helper.write.call_args[0][0])
+        self.assertEqual({'id': 1, 'executable': '/bin/sh', 'args': ['sh', '-c', 'true'], 'env': {},
+                          'path': '/tmp', 'output': None}, request)
+
+    def test_should_connect_process_protocol_when_helper_reports_pid(self):
+        spawned_processes = []
+
+        self.spawn().addCallback(spawned_processes.append)
+
+        process = self.process_protocol.makeConnection.call_args[0][0]
+        self.assertEqual([process], spawned_processes)
+        self.assertEqual(4711, process.pid)
+
+    def test_should_fail_when_helper_cannot_spawn(self):
+        failures = []
+        spawned = self.executor.spawnProcess(self.process_protocol, '/bin/spam', ['spam'], env={}, path='/tmp')
+        spawned.addErrback(failures.append)
+
+        self.executor.on_reply({'op': 'spawn_failed', 'id': 1, 'error': 'No such file or directory'})
+
+        self.assertEqual('No such file or directory', failures[0].getErrorMessage())
+        self.assertFalse(self.process_protocol.makeConnection.called)
+
+    def test_should_relay_output_and_exit(self):
+        self.spawn()
+
+        self.executor.on_reply({'op': 'output', 'pid': 4711, 'fd': 1, 'data': base64.b64encode('out')})
+        self.executor.on_reply({'op': 'output', 'pid': 4711, 'fd': 2, 'data': base64.b64encode('err')})
+        self.executor.on_reply({'op': 'exited', 'pid': 4711, 'status': 3 << 8})
+        self.executor.on_reply({'op': 'ended', 'pid': 4711})
+
+        self.process_protocol.outReceived.assert_called_with('out')
+        self.process_protocol.errReceived.assert_called_with('err')
+        self.assertEqual(3, self.process_protocol.processExited.call_args[0][0].value.exitCode)
+        self.assertEqual(3, self.process_protocol.processEnded.call_args[0][0].value.exitCode)
+        self.assertEqual({}, self.executor.processes)
+
+    @patch('yadtreceiver.spawn_executor.reactor')
+    def test_should_spawn_with_reactor_when_helper_is_not_running(self, reactor):
+        self.executor.helper = None
+
+        process = self.executor.spawnProcess(self.process_protocol, '/bin/sh', ['sh'], env={}, path='/tmp')
+
+        self.assertEqual(reactor.spawnProcess.return_value, process)
+
+    @patch('yadtreceiver.spawn_executor.reactor')
+    def test_should_spawn_with_reactor_when_output_cannot_be_passed(self, reactor):
+        process = self.executor.spawnProcess(self.process_protocol, '/bin/sh', ['sh'], env={}, path='/tmp',
+                                             childFDs={0: 'w', 1: 9999, 2: 9999})
+
+        self.assertEqual(reactor.spawnProcess.return_value, process)
+        self.assertFalse(self.executor.helper.write.called)
+
+    @patch('yadtreceiver.spawn_executor.os')
+    @patch('yadtreceiver.spawn_executor.log')
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_fail_and_kill_commands_when_helper_exits(self, _, mock_os):
+        self.spawn()
+        failures = []
+        self.executor.spawnProcess(Mock(), '/bin/sh', ['sh'], env={}, path='/tmp').addErrback(failures.append)
+
+        self.executor.helper_ended(Mock())
+
+        self.assertEqual('the spawn helper exited', failures[0].getErrorMessage())
+        self.assertTrue(self.process_protocol.processExited.call_args[0][0].check(error.ProcessTerminated))
+        self.assertTrue(self.process_protocol.processEnded.called)
+        self.assertEqual(call(4711, signal.SIGKILL), mock_os.killpg.call_args)
+        self.assertFalse(mock_os.kill.called)
+        self.assertEqual(None, self.executor.helper)
+        self.assertEqual(1, METRICS['spawn_helper_exits'])
+        self.assertEqual(1, METRICS['spawn_helper_commands_killed'])
+
+    @patch('yadtreceiver.spawn_executor.os')
+    @patch('yadtreceiver.spawn_executor.log')
+    def test_should_kill_command_without_process_group_when_helper_exits(self, _, mock_os):
+        mock_os.killpg.side_effect = OSError(3, 'No such process')
+        self.spawn()
+
+        self.executor.helper_ended(Mock())
+
+        self.assertEqual(call(4711, signal.SIGKILL), mock_os.kill.call_args)
+
+    @patch('yadtreceiver.spawn_executor.os.killpg')
+    @patch('yadtreceiver.spawn_executor.log')
+    def test_should_not_kill_exited_commands_when_helper_exits(self, _, mock_killpg):
+        self.spawn()
+        self.executor.on_reply({'op': 'exited', 'pid': 4711, 'status': 0})
+
+        self.executor.helper_ended(Mock())
+
+        self.assertFalse(mock_killpg.called)
+        self.assertTrue(self.process_protocol.processEnded.call_args[0][0].check(error.ProcessDone))
+
+    def test_should_leave_commands_running_when_stopped(self):
+        self.spawn()
+
+        self.executor.stop()
+        self.executor.helper_ended(Mock())
+
+        self.assertFalse(self.process_protocol.processExited.called)
+
+
+class ReceiverSpawnHelperTests(unittest.TestCase):
+
+    @patch('yadtreceiver.SpawnHelperExecutor')
+    def test_should_spawn_commands_with_helper_when_configured(self, executor_class):
+        receiver = Mock(Receiver)
+        receiver.configuration = {'spawn_helper': True}
+
+        Receiver.start_spawn_helper(receiver)
+
+        executor_class.return_value.start.assert_called_with()
+        self.assertEqual(executor_class.return_value, receiver.executor)
+
+    @patch('yadtreceiver.SpawnHelperExecutor')
+    def test_should_not_start_helper_by_default(self, executor_class):
+        receiver = Mock(Receiver)
+        receiver.configuration = {'spawn_helper': False}
+
+        Receiver.start_spawn_helper(receiver)
+
+        self.assertFalse(executor_class.called)
@@ -0,0 +1,84 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import base64
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from yadtreceiver.spawn_executor import HELPER_SCRIPT
+
+
+class SpawnHelperTests(unittest.TestCase):
+
+    def setUp(self):
+        self.helper = subprocess.Popen([sys.executable, '-S', HELPER_SCRIPT],
+                                       stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.helper.stdin.close()
+        self.helper.wait()
+        shutil.rmtree(self.directory)
+
+    def spawn(self, args, output=None, executable='/bin/sh'):
+        request = {'id': 1, 'executable': executable, 'args': args, 'env': {'GREETING': 'hello'},
+                   'path': self.directory, 'output': output}
+        self.helper.stdin.write(json.dumps(request) + '\n')
+        self.helper.stdin.flush()
+        replies = []
+        while not replies or replies[-1]['op'] not in ('ended', 'spawn_failed'):
+            replies.append(json.loads(self.helper.stdout.readline()))
+        return replies
+
+    def test_should_relay_pid_output_and_exit_status(self):
+        replies = self.spawn(['sh', '-c', 'echo $GREETING; pwd; echo oops >&2; exit 3'])
+
+        self.assertEqual('spawned', replies[0]['op'])
+        pid = replies[0]['pid']
+        stdout = ''.join(base64.b64decode(reply['data']) for reply in replies
+                         if reply['op'] == 'output' and reply['fd'] == 1)
+        stderr = ''.join(base64.b64decode(reply['data']) for reply in replies
+                         if reply['op'] == 'output' and reply['fd'] == 2)
+        self.assertEqual('hello\n%s\n' % os.path.realpath(self.directory), stdout)
+        self.assertEqual('oops\n', stderr)
+        self.assertEqual([{'op': 'exited', 'pid': pid, 'status': 3 << 8}, {'op': 'ended', 'pid': pid}],
+                         replies[-2:])
+
+    def test_should_append_output_to_file(self):
+        output = os.path.join(self.directory, 'output')
+        with open(output, 'w') as output_file:
+            output_file.write('before\n')
+
+        replies = self.spawn(['sh', '-c', 'echo out; echo err >&2'], output=output)
+
+        self.assertEqual(['spawned', 'exited', 'ended'], [reply['op'] for reply in replies])
+        self.assertEqual(0, replies[1]['status'])
+        with open(output) as output_file:
+            self.assertEqual('before\nout\nerr\n', output_file.read())
+
+    def test_should_report_failed_spawn(self):
+        replies = self.spawn(['spam'], executable='/does/not/exist')
+
+        self.assertEqual(1, len(replies))
+        self.assertEqual('spawn_failed', replies[0]['op'])
+        self.assertEqual(1, replies[0]['id'])
+        self.assertTrue(replies[0]['error'])
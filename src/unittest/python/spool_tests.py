@@ -0,0 +1,188 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from os.path import join, getsize
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from mock import Mock, call, patch
+
+from yadtreceiver import METRICS
+from yadtreceiver.spool import EventSpool, SpoolingBroadcaster
+
+
+class EventSpoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = mkdtemp()
+        self.spool_file = join(self.temporary_directory, 'spool', 'outbound.spool')
+
+    def tearDown(self):
+        rmtree(self.temporary_directory)
+
+    @patch('yadtreceiver.spool.log')
+    def test_should_keep_undelivered_events_across_restarts(self, _):
+        spool = EventSpool(self.spool_file, 100000)
+        spool.open()
+        first = spool.append('dev01', 'update', 'started', 'msg', 'id-1')
+        spool.append('dev01', 'update', 'finished', 'msg', 'id-1')
+        spool.mark_delivered(first)
+        spool.close()
+
+        reopened_spool = EventSpool(self.spool_file, 100000)
+        reopened_spool.open()
+
+        self.assertEqual([(2, 'finished')],
+                         [(record['seq'], record['state']) for record in reopened_spool.pending])
+        self.assertEqual(3, reopened_spool.next_sequence)
+
+    def test_should_detect_duplicates_by_tracking_id_and_state(self):
+        spool = EventSpool(self.spool_file, 100000)
+        spool.open()
+        record = spool.append('dev01', 'update', 'finished', None, 'id-1')
+
+        self.assertTrue(spool.is_duplicate('id-1', 'finished'))
+        spool.mark_delivered(record)
+        self.assertTrue(spool.is_duplicate('id-1', 'finished'))
+        self.assertFalse(spool.is_duplicate('id-1', 'failed'))
+        self.assertFalse(spool.is_duplicate(None, 'finished'))
+
+    @patch('yadtreceiver.spool.os.fsync')
+    def test_should_fsync_in_batches(self, mock_fsync):
+        spool = EventSpool(self.spool_file, 100000, fsync_batch_size=3)
+        spool.open()
+
+        spool.append('dev01', 'update', 'started')
+        spool.append('dev01', 'update', 'finished')
+        self.assertFalse(mock_fsync.called)
+
+        spool.append('dev02', 'update', 'started')
+        self.assertEqual(1, mock_fsync.call_count)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    def test_should_compact_delivered_events_when_exceeding_size_cap(self):
+        spool = EventSpool(self.spool_file, 400)
+        spool.open()
+        for number in range(5):
+            spool.mark_delivered(spool.append('dev01', 'update', 'started', None, 'id-%d' % number))
+        spool.append('dev01', 'update', 'finished', None, 'id-pending')
+
+        self.assertTrue(getsize(self.spool_file) <= 400)
+        self.assertEqual(['id-pending'], [record['tracking_id'] for record in spool.pending])
+        self.assertTrue(METRICS['spool_compactions'] >= 1)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    @patch('yadtreceiver.spool.log')
+    def test_should_drop_oldest_events_when_pending_events_exceed_size_cap(self, _):
+        spool = EventSpool(self.spool_file, 300)
+        spool.open()
+        for number in range(5):
+            spool.append('dev01', 'update', 'started', None, 'id-%d' % number)
+
+        self.assertTrue(getsize(self.spool_file) <= 300)
+        self.assertEqual('id-4', spool.pending[-1]['tracking_id'])
+        self.assertTrue(METRICS['spool_dropped'] >= 1)
+
+
+class SpoolingBroadcasterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = mkdtemp()
+        self.spool = EventSpool(join(self.temporary_directory, 'outbound.spool'), 100000)
+        self.spool.open()
+        self.broadcaster = Mock()
+
+    def tearDown(self):
+        rmtree(self.temporary_directory)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    @patch('yadtreceiver.spool.log')
+    def test_should_publish_event_larger_than_the_spool(self, _):
+        self.spool.max_bytes = 100
+        spooling_broadcaster = SpoolingBroadcaster(self.broadcaster, self.spool)
+
+        spooling_broadcaster.publish_cmd_for_target('dev01', 'update', 'failed', 'x' * 200, tracking_id='id-1')
+
+        self.assertEqual(call('dev01', 'update', 'failed', 'x' * 200, tracking_id='id-1'),
+                         self.broadcaster.publish_cmd_for_target.call_args)
+        self.assertEqual([], self.spool.pending)
+        self.assertEqual(1, METRICS['spool_dropped'])
+        self.assertTrue(self.spool.is_duplicate('id-1', 'failed'))
+
+    def test_should_publish_and_acknowledge_when_connected(self):
+        spooling_broadcaster = SpoolingBroadcaster(self.broadcaster, self.spool)
+
+        spooling_broadcaster.publish_cmd_for_target('dev01', 'update', 'finished', 'done', tracking_id='id-1')
+
+        self.assertEqual(call('dev01', 'update', 'finished', 'done', tracking_id='id-1'),
+                         self.broadcaster.publish_cmd_for_target.call_args)
+        self.assertEqual([], self.spool.pending)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    @patch('yadtreceiver.spool.log')
+    def test_should_replay_spooled_events_in_order_after_reconnect(self, _):
+        self.broadcaster.client = None
+        spooling_broadcaster = SpoolingBroadcaster(self.broadcaster, self.spool)
+
+        spooling_broadcaster.publish_cmd_for_target('dev01', 'update', 'started', 'go', tracking_id='id-1')
+        spooling_broadcaster.publish_cmd_for_target('dev01', 'update', 'failed', 'boom', tracking_id='id-1')
+        self.assertFalse(self.broadcaster.publish_cmd_for_target.called)
+
+        self.broadcaster.client = Mock()
+        spooling_broadcaster.replay()
+
+        self.assertEqual([call('dev01', 'update', 'started', 'go', tracking_id='id-1'),
+                          call('dev01', 'update', 'failed', 'boom', tracking_id='id-1')],
+                         self.broadcaster.publish_cmd_for_target.call_args_list)
+        self.assertEqual([], self.spool.pending)
+        self.assertEqual(2, METRICS['spool_replayed'])
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    @patch('yadtreceiver.spool.log')
+    def test_should_publish_new_event_after_spooled_events_when_connected(self, _):
+        self.broadcaster.client = None
+        spooling_broadcaster = SpoolingBroadcaster(self.broadcaster, self.spool)
+        spooling_broadcaster.publish_cmd_for_target('dev01', 'update', 'started', 'go', tracking_id='id-1')
+
+        self.broadcaster.client = Mock()
+        spooling_broadcaster.publish_cmd_for_target('dev01', 'update', 'finished', 'done', tracking_id='id-1')
+
+        self.assertEqual([call('dev01', 'update', 'started', 'go', tracking_id='id-1'),
+                          call('dev01', 'update', 'finished', 'done', tracking_id='id-1')],
+                         self.broadcaster.publish_cmd_for_target.call_args_list)
+        self.assertEqual([], self.spool.pending)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    @patch('yadtreceiver.spool.log')
+    def test_should_suppress_duplicate_events(self, _):
+        spooling_broadcaster = SpoolingBroadcaster(self.broadcaster, self.spool)
+
+        spooling_broadcaster.publish_cmd_for_target('dev01', 'update', 'finished', tracking_id='id-1')
+        spooling_broadcaster.publish_cmd_for_target('dev01', 'update', 'finished', tracking_id='id-1')
+
+        self.assertEqual(1, self.broadcaster.publish_cmd_for_target.call_count)
+        self.assertEqual(1, METRICS['spool_duplicates'])
+
+    def test_should_delegate_client_to_wrapped_broadcaster(self):
+        spooling_broadcaster = SpoolingBroadcaster(self.broadcaster, self.spool)
+
+        spooling_broadcaster.client = None
+
+        self.assertEqual(None, self.broadcaster.client)
+        spooling_broadcaster._sendEvent('vote', data='42')
+        self.assertEqual(call('vote', data='42'), self.broadcaster._sendEvent.call_args)
@@ -0,0 +1,89 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import subprocess
+import sys
+import unittest
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from mock import patch
+
+from yadtreceiver import METRICS
+from yadtreceiver.startup import StartupTimer, process_start_time
+
+
+class ProcessStartTimeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.proc_directory = mkdtemp()
+        os.makedirs(os.path.join(self.proc_directory, 'self'))
+
+    def tearDown(self):
+        rmtree(self.proc_directory)
+
+    @patch('yadtreceiver.startup.os.sysconf')
+    def test_should_compute_start_time_from_boot_time_and_ticks(self, mock_sysconf):
+        mock_sysconf.return_value = 100
+        with open(os.path.join(self.proc_directory, 'self', 'stat'), 'w') as stat_file:
+            stat_file.write('4711 (twistd with) spaces) S 1 1 1 0 -1 4194560 0 0 0 0 0 0 0 0 20 0 1 0 250 0 0\n')
+        with open(os.path.join(self.proc_directory, 'stat'), 'w') as system_stat_file:
+            system_stat_file.write('cpu  1 1 1 1\nbtime 1000000000\n')
+
+        self.assertEqual(1000000002.5, process_start_time(self.proc_directory))
+
+    def test_should_return_none_without_proc_filesystem(self):
+        self.assertEqual(None, process_start_time(self.proc_directory))
+
+
+class LazyImportTests(unittest.TestCase):
+
+    def test_should_not_import_modules_needed_only_after_start_up(self):
+        environment = dict(os.environ)
+        environment['PYTHONPATH'] = os.pathsep.join(sys.path)
+        imported = subprocess.check_output(
+            [sys.executable, '-W', 'ignore', '-c',
+             'import sys, yadtreceiver; '
+             'print(sorted(name for name in sys.modules if sys.modules[name] and '
+             '(name.split(".")[0] in ("psutil", "fysom") or name.startswith("twisted.web"))))'],
+            env=environment)
+
+        self.assertEqual('[]', imported.strip())
+
+
+@patch('yadtreceiver.startup.log')
+class StartupTimerTests(unittest.TestCase):
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    @patch('yadtreceiver.startup.time')
+    def test_should_time_phases_and_readiness(self, mock_time, _):
+        timer = StartupTimer(started_at=100)
+        mock_time.return_value = 101
+        timer.mark('imports')
+        mock_time.return_value = 101.5
+        timer.mark('config')
+        self.assertFalse(timer.is_ready)
+
+        timer.ready()
+
+        self.assertTrue(timer.is_ready)
+        self.assertEqual(1, METRICS['startup_imports_seconds'])
+        self.assertEqual(0.5, METRICS['startup_config_seconds'])
+        self.assertEqual(1.5, METRICS['startup_ready_seconds'])
+        self.assertEqual({'phases': [{'phase': 'imports', 'seconds': 1}, {'phase': 'config', 'seconds': 0.5}],
+                          'ready_after': 1.5}, timer.state())
@@ -0,0 +1,76 @@
+#   yadtreceiver
+#   Copyright (C) 2013 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from mock import patch
+
+from yadtreceiver.target_index import TargetDirectoryIndex, compile_target_patterns
+
+
+class CompileTargetPatternsTests(unittest.TestCase):
+
+    def test_should_match_any_of_the_patterns(self):
+        matches = compile_target_patterns(['dev*', 'pro0?', 'exact'])
+
+        self.assertTrue(matches('devyadt'))
+        self.assertTrue(matches('pro01'))
+        self.assertTrue(matches('exact'))
+        self.assertFalse(matches('pro001'))
+        self.assertFalse(matches('exactly'))
+
+    def test_should_match_hidden_entries_only_with_dot_patterns(self):
+        self.assertFalse(compile_target_patterns(['*'])('.hidden'))
+        self.assertTrue(compile_target_patterns(['*', '.h*'])('.hidden'))
+
+    def test_should_match_nothing_without_patterns(self):
+        self.assertFalse(compile_target_patterns([])('dev01'))
+
+
+class TargetDirectoryIndexTests(unittest.TestCase):
+
+    @patch('yadtreceiver.target_index.os.listdir')
+    def test_should_match_patterns_against_entries(self, mock_listdir):
+        mock_listdir.return_value = ['dev02', 'dev01', 'pro01']
+        index = TargetDirectoryIndex('/etc/yadtshell/targets')
+        index.refresh()
+
+        self.assertEqual(['dev01', 'dev02'], index.match(['dev*']))
+
+    @patch('yadtreceiver.target_index.os.listdir')
+    def test_should_be_empty_when_directory_does_not_exist(self, mock_listdir):
+        mock_listdir.side_effect = OSError('No such file or directory')
+        index = TargetDirectoryIndex('/etc/yadtshell/targets')
+        index.refresh()
+
+        self.assertEqual(set(), index.entries)
+
+    @patch('yadtreceiver.target_index.os.path.exists')
+    def test_should_answer_known_entries_from_memory(self, mock_exists):
+        index = TargetDirectoryIndex('/etc/yadtshell/targets')
+        index.add('dev01')
+
+        self.assertTrue('dev01' in index)
+        self.assertFalse(mock_exists.called)
+
+    @patch('yadtreceiver.target_index.os.path.exists')
+    def test_should_verify_misses_on_disk(self, mock_exists):
+        mock_exists.return_value = True
+        index = TargetDirectoryIndex('/etc/yadtshell/targets')
+
+        self.assertTrue('dev01' in index)
+        mock_exists.assert_called_with('/etc/yadtshell/targets/dev01')
+        self.assertEqual(set(['dev01']), index.entries)
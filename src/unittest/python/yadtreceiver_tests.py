@@ -21,7 +21,7 @@ __author__ = 'Michael Gruber'
 import unittest
 
 from mock import Mock, call, patch, MagicMock
-from twisted.python.logfile import LogFile
+from twisted.internet.defer import Deferred
 
 from yadtreceiver import (__version__,
                           Receiver,
@@ -31,8 +31,13 @@ from yadtreceiver import (__version__,
                           _reset_metrics,
                           )
 from yadtreceiver.configuration import ReceiverConfig
+from yadtreceiver.drain import RunningCommands
 from yadtreceiver.events import Event
+from yadtreceiver.logrotation import CompressingLogFile
+from yadtreceiver.target_index import TargetDirectoryIndex
+from yadtreceiver.scheduler import RequestScheduler
 from twisted.python import filepath
+from twisted.python.failure import Failure
 
 
 class ConfigurationDict(dict):
@@ -46,21 +51,27 @@ class YadtReceiverTests (unittest.TestCase):
     def test_if_this_test_fails_maybe_you_have_yadtreceiver_installed_locally(self):
         self.assertEqual('${version}', __version__)
 
-    @patch('yadtreceiver.LogFile')
+    @patch('yadtreceiver.CompressingLogFile')
     @patch('yadtreceiver.log')
     def test_should_call_start_logging_when_initializing_twisted_logging(self, mock_log, mock_log_file_class):
         receiver = Receiver()
         receiver.set_configuration({'log_filename': 'log/file.log',
+                                    'log_rotate_bytes': 20000000,
+                                    'log_rotated_files': 10,
+                                    'log_rotate_interval': 86400,
+                                    'log_compression': 'gzip',
                                     'targets': set(['devabc123']),
                                     'broadcaster_host': 'broadcaster_host',
                                     'broadcaster_port': 1234})
-        mock_log_file = Mock(LogFile)
+        mock_log_file = Mock(CompressingLogFile)
+        mock_log_file.compression = 'gzip'
         mock_log_file_class.fromFullPath.return_value = mock_log_file
 
         receiver.initialize_twisted_logging()
 
         self.assertEqual(
-            call('log/file.log', rotateLength=20000000, maxRotatedFiles=10),
+            call('log/file.log', rotateLength=20000000, maxRotatedFiles=10, rotate_interval=86400,
+                 compression='gzip'),
             mock_log_file_class.fromFullPath.call_args)
         self.assertEquals(call(mock_log_file), mock_log.startLogging.call_args)
 
@@ -84,6 +95,38 @@ class YadtReceiverTests (unittest.TestCase):
         self.assertEquals(
             call('broadcaster-host', 1234, 'yadtreceiver'), mock_wamb.call_args)
 
+    @patch('yadtreceiver.NegotiatingWampBroadcaster')
+    def test_should_offer_configured_serializers_when_connecting_broadcaster(self, mock_negotiating_wamb):
+        configuration = {'broadcaster_host': 'broadcaster-host',
+                         'broadcaster_port': 1234,
+                         'event_serializers': ['msgpack', 'json']}
+        receiver = Receiver()
+        receiver.set_configuration(configuration)
+
+        receiver._connect_broadcaster()
+
+        self.assertEquals(
+            call('broadcaster-host', 1234, 'yadtreceiver', ['msgpack', 'json']), mock_negotiating_wamb.call_args)
+
+    @patch('yadtreceiver.log')
+    @patch('yadtreceiver.FanInBroadcaster')
+    @patch('yadtreceiver.WampBroadcaster')
+    def test_should_fan_in_several_broadcasters_when_connecting_broadcaster(self, mock_wamb, mock_fan_in, _):
+        configuration = {'broadcaster_host': 'broadcaster-host',
+                         'broadcaster_port': 1234,
+                         'broadcasters': [('broadcaster1', 8081), ('broadcaster2', 8082)],
+                         'broadcaster_recent_ids': 100}
+        receiver = Receiver()
+        receiver.set_configuration(configuration)
+
+        receiver._connect_broadcaster()
+
+        self.assertEqual([call('broadcaster1', 8081, 'yadtreceiver'), call('broadcaster2', 8082, 'yadtreceiver')],
+                         mock_wamb.call_args_list)
+        self.assertEqual(call([mock_wamb.return_value, mock_wamb.return_value], 100), mock_fan_in.call_args)
+        self.assertEqual(mock_fan_in.return_value, receiver.broadcaster)
+        self.assertEqual(call(receiver.onConnect), mock_fan_in.return_value.addOnSessionOpenHandler.call_args)
+
     @patch('yadtreceiver.WampBroadcaster')
     def test_should_add_session_handler_to_broadcaster_when_connecting_broadcaster(self, mock_wamb):
         receiver = Receiver()
@@ -98,6 +141,24 @@ class YadtReceiverTests (unittest.TestCase):
         self.assertEquals(
             call(receiver.onConnect), mock_broadcaster_client.addOnSessionOpenHandler.call_args)
 
+    @patch('yadtreceiver.log')
+    @patch('yadtreceiver.EventSpool')
+    @patch('yadtreceiver.WampBroadcaster')
+    def test_should_wrap_broadcaster_when_spool_is_configured(self, mock_wamb, mock_spool_class, _):
+        configuration = {'broadcaster_host': 'broadcaster-host',
+                         'broadcaster_port': 1234,
+                         'spool_file': '/var/spool/yadtreceiver/outbound.spool',
+                         'spool_max_bytes': 4096}
+        receiver = Receiver()
+        receiver.set_configuration(configuration)
+
+        receiver._connect_broadcaster()
+
+        self.assertEqual(call('/var/spool/yadtreceiver/outbound.spool', 4096), mock_spool_class.call_args)
+        self.assertEqual(call(), mock_spool_class.return_value.open.call_args)
+        self.assertEqual(mock_spool_class.return_value, receiver.broadcaster.spool)
+        self.assertEqual(mock_wamb.return_value, receiver.broadcaster._broadcaster)
+
     @patch('yadtreceiver.log')
     @patch('__builtin__.exit')
     def test_should_exit_when_no_target_configured(self, mock_exit, mock_log):
@@ -135,6 +196,28 @@ class YadtReceiverTests (unittest.TestCase):
         self.assertEquals(call(receiver.onEvent, 'devabc123'),
                           mock_broadcaster_client.client.subscribe.call_args)
 
+    @patch('yadtreceiver.log')
+    def test_should_report_ready_when_all_subscriptions_are_acknowledged(self, _):
+        receiver = Receiver()
+        receiver.broadcaster = Mock()
+        subscriptions = [Deferred(), Deferred()]
+        receiver.broadcaster.client.subscribe.side_effect = subscriptions
+        receiver.startup = Mock()
+        receiver.startup.is_ready = False
+        receiver.set_configuration(ConfigurationDict(allowed_targets=set(['dev01', 'dev02']),
+                                                     broadcaster_host='broadcaster_host',
+                                                     broadcaster_port=1234))
+
+        receiver.onConnect()
+        self.assertEqual([call('connect')], receiver.startup.mark.call_args_list)
+        self.assertFalse(receiver.startup.ready.called)
+
+        for subscription in subscriptions:
+            subscription.callback(None)
+
+        self.assertEqual([call('connect'), call('subscribe')], receiver.startup.mark.call_args_list)
+        self.assertTrue(receiver.startup.ready.called)
+
     def test_should_subscribe_to_targets_from_configuration_in_alphabetical_order_when_connected(self):
         receiver = Receiver()
         mock_broadcaster_client = Mock()
@@ -156,8 +239,9 @@ class YadtReceiverTests (unittest.TestCase):
     def test_should_raise_exception_when_target_directory_does_not_exist(self, mock_exists):
         mock_exists.return_value = False
         receiver = Receiver()
-        configuration = {'hostname': 'hostname',
-                         'targets_directory': '/etc/yadtshell/targets/'}
+        configuration = ConfigurationDict({'hostname': 'hostname',
+                                           'targets_directory': '/etc/yadtshell/targets/'})
+        configuration.target_index = TargetDirectoryIndex('/etc/yadtshell/targets/')
         receiver.set_configuration(configuration)
 
         self.assertRaises(
@@ -167,8 +251,9 @@ class YadtReceiverTests (unittest.TestCase):
     def test_should_append_target_name_to_targets_directory(self, mock_exists):
         mock_exists.return_value = True
         receiver = Receiver()
-        configuration = {'hostname': 'hostname',
-                         'targets_directory': '/etc/yadtshell/targets/'}
+        configuration = ConfigurationDict({'hostname': 'hostname',
+                                           'targets_directory': '/etc/yadtshell/targets/'})
+        configuration.target_index = TargetDirectoryIndex('/etc/yadtshell/targets/')
         receiver.set_configuration(configuration)
 
         actual_target_directory = receiver.get_target_directory('spargel')
@@ -180,8 +265,9 @@ class YadtReceiverTests (unittest.TestCase):
     def test_should_join_target_name_with_targets_directory(self, mock_exists):
         mock_exists.return_value = True
         receiver = Receiver()
-        configuration = {'hostname': 'hostname',
-                         'targets_directory': '/etc/yadtshell/targets/'}
+        configuration = ConfigurationDict({'hostname': 'hostname',
+                                           'targets_directory': '/etc/yadtshell/targets/'})
+        configuration.target_index = TargetDirectoryIndex('/etc/yadtshell/targets/')
         receiver.set_configuration(configuration)
 
         actual_target_directory = receiver.get_target_directory('spargel')
@@ -194,9 +280,12 @@ class YadtReceiverTests (unittest.TestCase):
     def test_should_spawn_new_process_on_reactor(self, mock_protocol, mock_reactor):
         mock_protocol.return_value = 'mock-protocol'
         mock_receiver = Mock(Receiver)
+        mock_receiver.executor = None
+        mock_receiver.run_output = None
         mock_broadcaster = Mock()
         mock_receiver.broadcaster = mock_broadcaster
         mock_receiver.get_target_directory.return_value = '/etc/yadtshell/targets/devabc123'
+        mock_receiver.get_command_timeout.return_value = None
         mock_receiver.states = {None: Mock()}
 
         mock_receiver.configuration = {'hostname': 'hostname',
@@ -211,7 +300,8 @@ class YadtReceiverTests (unittest.TestCase):
         Receiver.perform_request(mock_receiver, mock_event, Mock())
 
         self.assertEquals(call('hostname', mock_broadcaster, 'devabc123',
-                               '/usr/bin/python /usr/bin/yadtshell update', tracking_id=None), mock_protocol.call_args)
+                               '/usr/bin/python /usr/bin/yadtshell update', tracking_id=None, journal=mock_receiver.journal,
+                               failure_output=mock_receiver.failure_output, output_file=None), mock_protocol.call_args)
         self.assertEquals(call('mock-protocol', '/usr/bin/python', [
                           '/usr/bin/python', '/usr/bin/yadtshell', 'update'], path='/etc/yadtshell/targets/devabc123', env={}), mock_reactor.spawnProcess.call_args)
 
@@ -221,9 +311,12 @@ class YadtReceiverTests (unittest.TestCase):
     def test_should_spawn_new_process_on_reactor_even_when_not_registered(self, _, mock_protocol, mock_reactor):
         mock_protocol.return_value = 'mock-protocol'
         mock_receiver = Mock(Receiver)
+        mock_receiver.executor = None
+        mock_receiver.run_output = None
         mock_broadcaster = Mock()
         mock_receiver.broadcaster = mock_broadcaster
         mock_receiver.get_target_directory.return_value = '/etc/yadtshell/targets/devabc123'
+        mock_receiver.get_command_timeout.return_value = None
         mock_receiver.states = {}
 
         mock_receiver.configuration = {'hostname': 'hostname',
@@ -238,18 +331,147 @@ class YadtReceiverTests (unittest.TestCase):
         Receiver.perform_request(mock_receiver, mock_event, Mock())
 
         self.assertEquals(call('hostname', mock_broadcaster, 'devabc123',
-                               '/usr/bin/python /usr/bin/yadtshell update', tracking_id=None), mock_protocol.call_args)
+                               '/usr/bin/python /usr/bin/yadtshell update', tracking_id=None, journal=mock_receiver.journal,
+                               failure_output=mock_receiver.failure_output, output_file=None), mock_protocol.call_args)
         self.assertEquals(call('mock-protocol', '/usr/bin/python', [
                           '/usr/bin/python', '/usr/bin/yadtshell', 'update'], path='/etc/yadtshell/targets/devabc123', env={}), mock_reactor.spawnProcess.call_args)
 
+    @patch('yadtreceiver.reactor')
+    @patch('yadtreceiver.ProcessProtocol')
+    @patch('yadtreceiver.log')
+    def test_should_spawn_process_in_own_session_and_schedule_timeout(self, _, mock_protocol, mock_reactor):
+        mock_receiver = Mock(Receiver)
+        mock_receiver.executor = None
+        mock_receiver.run_output = None
+        mock_receiver.broadcaster = Mock()
+        mock_receiver.get_target_directory.return_value = '/etc/yadtshell/targets/devabc123'
+        mock_receiver.get_command_timeout.return_value = 600
+        mock_receiver.states = {}
+        mock_receiver.configuration = {'hostname': 'hostname',
+                                       'python_command': '/usr/bin/python',
+                                       'script_to_execute': '/usr/bin/yadtshell',
+                                       'setsid_command': '/usr/bin/setsid',
+                                       'command_kill_grace_period': 30}
+        mock_event = Mock(Event)
+        mock_event.target = 'devabc123'
+        mock_event.arguments = ['update']
+
+        Receiver.perform_request(mock_receiver, mock_event, Mock())
+
+        self.assertEquals(call(mock_protocol.return_value, '/usr/bin/setsid',
+                               ['/usr/bin/setsid', '/usr/bin/python', '/usr/bin/yadtshell', 'update'],
+                               path='/etc/yadtshell/targets/devabc123', env={}), mock_reactor.spawnProcess.call_args)
+        self.assertEquals(call(mock_reactor.spawnProcess.return_value, mock_event, mock_protocol.return_value, 600),
+                          mock_receiver._process_spawned.call_args)
+
+    @patch('yadtreceiver.os.close')
+    @patch('yadtreceiver.reactor')
+    @patch('yadtreceiver.ProcessProtocol')
+    @patch('yadtreceiver.log')
+    def test_should_connect_output_of_process_to_run_output_file(self, _, mock_protocol, mock_reactor, mock_close):
+        mock_receiver = Mock(Receiver)
+        mock_receiver.executor = None
+        mock_receiver.run_output.open.return_value = 42
+        mock_receiver.run_output.filename.return_value = '/var/log/yadtreceiver/runs/tracking-id.log'
+        mock_receiver.broadcaster = Mock()
+        mock_receiver.get_target_directory.return_value = '/etc/yadtshell/targets/devabc123'
+        mock_receiver.get_command_timeout.return_value = None
+        mock_receiver.states = {}
+        mock_receiver.configuration = {'hostname': 'hostname',
+                                       'python_command': '/usr/bin/python',
+                                       'script_to_execute': '/usr/bin/yadtshell'}
+        mock_event = Mock(Event)
+        mock_event.target = 'devabc123'
+        mock_event.tracking_id = 'tracking-id'
+        mock_event.arguments = ['update']
+
+        Receiver.perform_request(mock_receiver, mock_event, Mock())
+
+        self.assertEquals('/var/log/yadtreceiver/runs/tracking-id.log', mock_protocol.call_args[1]['output_file'])
+        self.assertEquals({0: 'w', 1: 42, 2: 42}, mock_reactor.spawnProcess.call_args[1]['childFDs'])
+        self.assertEquals(call(42), mock_close.call_args)
+
+    def test_should_schedule_timeout_and_journal_pid_when_process_was_spawned(self):
+        mock_receiver = Mock(Receiver)
+        mock_receiver.configuration = {'command_kill_grace_period': 30}
+        mock_process = Mock()
+        mock_process.pid = 4711
+        mock_protocol = Mock()
+        mock_event = Mock(Event)
+        mock_event.tracking_id = 'tracking-id'
+
+        Receiver._process_spawned(mock_receiver, mock_process, mock_event, mock_protocol, 600)
+
+        self.assertEquals(call(600, 30), mock_protocol.schedule_timeout.call_args)
+        self.assertEquals(call('tracking-id', 4711), mock_receiver.journal.spawned.call_args)
+
+    def test_should_publish_failed_and_release_when_process_could_not_be_spawned(self):
+        mock_receiver = Mock(Receiver)
+        mock_protocol = Mock()
+        mock_event = Mock(Event)
+        mock_event.tracking_id = 'tracking-id'
+
+        Receiver._process_not_spawned(mock_receiver, Failure(OSError('No such file or directory')),
+                                      mock_event, mock_protocol)
+
+        self.assertEquals(call(mock_event, "<type 'exceptions.OSError'> : No such file or directory"),
+                          mock_receiver.publish_failed.call_args)
+        self.assertTrue(mock_protocol.notify_exit.called)
+        self.assertEquals(call('tracking-id', 'not spawned'), mock_receiver.journal.discarded.call_args)
+
+    @patch('yadtreceiver.log')
+    def test_should_not_register_run_when_target_directory_does_not_exist(self, _):
+        mock_receiver = Mock(Receiver)
+        mock_receiver.configuration = {'hostname': 'hostname', 'python_command': '/usr/bin/python',
+                                       'script_to_execute': '/usr/bin/yadtshell'}
+        mock_receiver.states = {}
+        mock_receiver.leases = None
+        mock_receiver.running_commands = RunningCommands()
+        mock_receiver.get_command_timeout.return_value = 0
+        mock_receiver.get_target_directory.side_effect = ReceiverException('target directory does not exist')
+        mock_event = Mock(Event)
+        mock_event.target = 'dev01'
+        mock_event.arguments = ['update', '--tracking-id=tracking-id']
+
+        self.assertEqual(None, Receiver.perform_request(mock_receiver, mock_event, None))
+
+        self.assertEqual(0, len(mock_receiver.running_commands))
+        self.assertFalse(mock_receiver.run_output.open.called)
+        self.assertEquals(call('tracking-id', 'failed'), mock_receiver.journal.discarded.call_args)
+        self.assertTrue(mock_receiver.publish_failed.called)
+
+    def test_should_use_smallest_matching_timeout(self):
+        receiver = Receiver()
+        receiver.configuration = {'command_timeout': 3600,
+                                  'command_timeouts': {'update': 7200, 'status': 300},
+                                  'target_timeouts': {'dev*': 600, 'pro*': 60}}
+        event = Mock(Event)
+        event.target = 'dev123'
+
+        event.arguments = ['update']
+        self.assertEqual(600, receiver.get_command_timeout(event))
+        event.arguments = ['status']
+        self.assertEqual(300, receiver.get_command_timeout(event))
+
+    def test_should_not_use_timeout_when_none_is_configured(self):
+        receiver = Receiver()
+        receiver.configuration = {'command_timeout': 0}
+        event = Mock(Event)
+        event.target = 'dev123'
+        event.arguments = ['update']
+
+        self.assertEqual(None, receiver.get_command_timeout(event))
+
     @patch('yadtreceiver.reactor')
     @patch('yadtreceiver.ProcessProtocol')
     def test_should_broadcast_error_when_spawning_fails(self, mock_protocol, mock_reactor):
         mock_protocol.side_effect = RuntimeError('Booom!')
         mock_receiver = Mock(Receiver)
+        mock_receiver.run_output = None
         mock_broadcaster = Mock()
         mock_receiver.broadcaster = mock_broadcaster
         mock_receiver.get_target_directory.return_value = '/etc/yadtshell/targets/devabc123'
+        mock_receiver.get_command_timeout.return_value = None
         mock_receiver.states = {None: Mock()}
 
         mock_receiver.configuration = {'hostname': 'hostname',
@@ -270,6 +492,7 @@ class YadtReceiverTests (unittest.TestCase):
     def test_should_create_process_protocol_with_tracking_id_if_given(self, mock_protocol, mock_reactor):
         mock_protocol.return_value = 'mock-protocol'
         mock_receiver = Mock(Receiver)
+        mock_receiver.run_output = None
         mock_broadcaster = Mock()
         mock_receiver.states = {'foo': Mock()}
         mock_receiver.broadcaster = mock_broadcaster
@@ -291,13 +514,15 @@ class YadtReceiverTests (unittest.TestCase):
         self.assertEqual(
             call(
                 'hostname', mock_broadcaster, 'devabc123', expected_command_with_arguments,
-                tracking_id='foo'), mock_protocol.call_args)
+                tracking_id='foo', journal=mock_receiver.journal,
+                failure_output=mock_receiver.failure_output, output_file=None), mock_protocol.call_args)
 
     @patch('yadtreceiver.reactor')
     @patch('yadtreceiver.ProcessProtocol')
     def test_should_create_process_protocol_with_no_tracking_id_if_not_given(self, mock_protocol, mock_reactor):
         mock_protocol.return_value = 'mock-protocol'
         mock_receiver = Mock(Receiver)
+        mock_receiver.run_output = None
         mock_receiver.states = {None: Mock()}
         mock_broadcaster = Mock()
         mock_receiver.broadcaster = mock_broadcaster
@@ -317,7 +542,8 @@ class YadtReceiverTests (unittest.TestCase):
         expected_command_with_arguments = '/usr/bin/python /usr/bin/yadtshell update'
 
         self.assertEqual(call('hostname', mock_broadcaster, 'devabc123',
-                              expected_command_with_arguments, tracking_id=None), mock_protocol.call_args)
+                              expected_command_with_arguments, tracking_id=None, journal=mock_receiver.journal,
+                               failure_output=mock_receiver.failure_output, output_file=None), mock_protocol.call_args)
 
     @patch.dict('yadtreceiver.METRICS', {}, clear=True)
     @patch('yadtreceiver.log')
@@ -369,9 +595,12 @@ class YadtReceiverTests (unittest.TestCase):
     @patch('yadtreceiver.events.Event')
     def test_should_handle_request(self, mock_event_class):
         mock_receiver = Mock(Receiver)
+        mock_receiver.rate_limiter = None
         mock_receiver.states = {None: Mock()}
         mock_event = Mock(Event)
         mock_event.is_a_vote = False
+        mock_event.is_a_lease = False
+        mock_event.is_a_heartbeat = False
         mock_event_class.return_value = mock_event
 
         Receiver.onEvent(mock_receiver, 'target', {
@@ -385,9 +614,12 @@ class YadtReceiverTests (unittest.TestCase):
     @patch('yadtreceiver.events.Event')
     def test_should_handle_request_with_wamp_v2(self, mock_event_class):
         mock_receiver = Mock(Receiver)
+        mock_receiver.rate_limiter = None
         mock_receiver.states = {None: Mock()}
         mock_event = Mock(Event)
         mock_event.is_a_vote = False
+        mock_event.is_a_lease = False
+        mock_event.is_a_heartbeat = False
         mock_event_class.return_value = mock_event
 
         Receiver.onEvent(mock_receiver, {  # wamp v2: no topic in onEvent
@@ -400,15 +632,27 @@ class YadtReceiverTests (unittest.TestCase):
         self.assertEqual(
             call(mock_event), mock_receiver.handle_request.call_args)
 
+    @patch('yadtreceiver.events.Event')
+    def test_should_record_event_when_recording(self, _):
+        mock_receiver = Mock(Receiver)
+        mock_receiver.states = {}
+
+        Receiver.onEvent(mock_receiver, {'id': 'heartbeat'})
+
+        self.assertEqual(call(None, {'id': 'heartbeat'}), mock_receiver.recorder.record.call_args)
+
     @patch('yadtreceiver.events.Event')
     @patch('yadtreceiver.log')
     def test_should_publish_event_about_failed_request_when_handle_request_fails(self, mock_log, mock_event_class):
         mock_receiver = Mock(Receiver)
+        mock_receiver.rate_limiter = None
         mock_receiver.handle_request.side_effect = ReceiverException(
             'It failed!')
         mock_receiver.states = {'some-id': Mock()}
         mock_event = Mock(Event)
         mock_event.is_a_vote = False
+        mock_event.is_a_lease = False
+        mock_event.is_a_heartbeat = False
         mock_event.tracking_id = 'some-id'
         mock_event_class.return_value = mock_event
 
@@ -464,6 +708,7 @@ class YadtReceiverTests (unittest.TestCase):
     @patch('yadtreceiver.log')
     def test_should_log_shutting_down_of_service(self, mock_log):
         mock_receiver = Mock(Receiver)
+        mock_receiver.leases = None
 
         Receiver.stopService(mock_receiver)
 
@@ -545,6 +790,74 @@ class ConnectionRefreshTests(unittest.TestCase):
         self.assertFalse(Receiver._should_refresh_connection(receiver))
 
 
+class ConfigurationReloadTests(unittest.TestCase):
+
+    def setUp(self):
+        self.receiver = Receiver()
+        self.receiver.broadcaster = Mock()
+        self.configuration = Mock(ReceiverConfig)
+        self.allowed_targets = ['dev01', 'dev02']
+        self.configuration.__getitem__ = lambda _self, key: {'allowed_targets': self.allowed_targets,
+                                                             'broadcaster_host': 'broadcaster-2',
+                                                             'broadcaster_port': 8081}[key]
+        self.configuration.get.return_value = []
+        self.receiver.set_configuration(self.configuration)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    @patch('yadtreceiver.log')
+    def test_should_subscribe_and_unsubscribe_changed_targets(self, _):
+        def reload():
+            self.allowed_targets = ['dev02', 'dev03']
+            return ['allowed_targets', 'targets']
+        self.configuration.reload.side_effect = reload
+
+        self.receiver.reload_configuration()
+
+        self.assertEqual([call(self.receiver.onEvent, 'dev03')],
+                         self.receiver.broadcaster.client.subscribe.call_args_list)
+        self.assertEqual([call('dev01')], self.receiver.broadcaster.client.unsubscribe.call_args_list)
+        self.assertFalse(self.receiver.broadcaster.client.sendClose.called)
+        self.assertEqual(1, yadtreceiver.METRICS['config_reloads'])
+        self.assertTrue('last_config_reload_duration' in yadtreceiver.METRICS)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    @patch('yadtreceiver.log')
+    def test_should_reconnect_only_when_broadcaster_endpoint_changed(self, _):
+        self.configuration.reload.return_value = ['broadcaster_host']
+
+        self.receiver.reload_configuration()
+
+        self.assertEqual('broadcaster-2', self.receiver.broadcaster.host)
+        self.assertEqual('ws://broadcaster-2:8081/', self.receiver.broadcaster.url)
+        self.assertEqual(call(self.receiver.onConnect),
+                         self.receiver.broadcaster.addOnSessionOpenHandler.call_args)
+        self.assertEqual(call(), self.receiver.broadcaster.client.sendClose.call_args)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    @patch('yadtreceiver.log')
+    def test_should_warn_that_priority_classes_need_a_restart(self, mock_log):
+        self.receiver.scheduler = RequestScheduler(1, {'high': 9, 'normal': 3}, 'normal')
+        self.configuration.reload.return_value = ['priority_classes']
+
+        self.receiver.reload_configuration()
+
+        messages = [args[0] for args, _ in mock_log.msg.call_args_list]
+        self.assertTrue('Changed setting priority_classes will be applied after restarting the receiver' in messages)
+        self.assertTrue('command_priorities and target_priorities are applied right away, but only with the priority '
+                        'classes high, normal until the restart, requests of other classes are queued as normal'
+                        in messages)
+
+    @patch.dict('yadtreceiver.METRICS', {}, clear=True)
+    @patch('yadtreceiver.log')
+    def test_should_keep_configuration_when_reloading_fails(self, _):
+        self.configuration.reload.side_effect = ValueError('broken file')
+
+        self.receiver.reload_configuration()
+
+        self.assertEqual(1, yadtreceiver.METRICS['config_reloads_failed'])
+        self.assertFalse(self.receiver.broadcaster.client.subscribe.called)
+
+
 class YadtReceiverFilesytemWatcherTests(unittest.TestCase):
 
     def setUp(self):
@@ -557,6 +870,17 @@ class YadtReceiverFilesytemWatcherTests(unittest.TestCase):
         self.assertRaises(
             AttributeError, fs.onChange, 'watch', self.PATH, self.CREATE)
 
+    def test_should_keep_target_index_current(self):
+        index = TargetDirectoryIndex('/foo')
+        fs = FileSystemWatcher('/foo', index)
+        fs.onChangeCallbacks = dict(create=Mock())
+
+        fs.onChange('watch', filepath.FilePath('/foo/bar'), self.CREATE)
+        self.assertEqual(set(['bar']), index.entries)
+
+        fs.onChange('watch', filepath.FilePath('/foo/bar'), self.DELETE)
+        self.assertEqual(set(), index.entries)
+
     def test_for_mock_callback_create(self):
         mock_receiver = Mock(Receiver)
         fs = FileSystemWatcher('/foo/bar')
@@ -39,6 +39,9 @@ class YadtreceiverVotingTests(TestCase):
         receiver = Mock(Receiver)
         receiver.broadcaster = Mock()
         receiver.states = {'foo': None}
+        receiver.leases = None
+        receiver.membership = None
+        receiver.drain = None
         event = Mock()
         event.arguments = ['--tracking-id=foo']
         event.target = 'target'
@@ -52,6 +55,9 @@ class YadtreceiverVotingTests(TestCase):
         receiver = Mock(Receiver)
         receiver.broadcaster = Mock()
         receiver.states = {'foo': None}
+        receiver.leases = None
+        receiver.membership = None
+        receiver.drain = None
         event = Mock()
         event.arguments = ['--tracking-id=foo']
         Receiver.handle_request(receiver, event)
@@ -64,6 +70,9 @@ class YadtreceiverVotingTests(TestCase):
         receiver = Mock(Receiver)
         receiver.broadcaster = Mock()
         receiver.states = {'foo': None}
+        receiver.leases = None
+        receiver.membership = None
+        receiver.drain = None
         event = Mock()
         event.arguments = ['--tracking-id=foo']
 
@@ -75,9 +84,15 @@ class YadtreceiverVotingTests(TestCase):
         receiver = Mock(Receiver)
         receiver.broadcaster = Mock()
         receiver.states = {'foo': None}
+        receiver.leases = None
+        receiver.membership = None
+        receiver.drain = None
         receiver = Mock(Receiver)
         receiver.broadcaster = Mock()
         receiver.states = {'foo': None}
+        receiver.leases = None
+        receiver.membership = None
+        receiver.drain = None
         event = Mock()
         event.arguments = ['--tracking-id=foo']
         Receiver.handle_request(receiver, event)
@@ -86,3 +101,21 @@ class YadtreceiverVotingTests(TestCase):
         receiver.states['foo'].spawned()
 
         self.assertEqual(receiver.states, {})
+
+    @patch('yadtreceiver.reactor.callLater')
+    def test_should_discard_journaled_job_when_folding(self, _):
+        receiver = Mock(Receiver)
+        receiver.broadcaster = Mock()
+        receiver.states = {}
+        receiver.leases = None
+        receiver.membership = None
+        receiver.drain = None
+        receiver.admission_controller = None
+        event = Mock()
+        event.arguments = ['--tracking-id=foo']
+        Receiver.handle_request(receiver, event)
+
+        receiver.states['foo'].fold()
+
+        receiver.journal.discarded.assert_called_with('foo', 'folded')
+        self.assertEqual(receiver.states, {})